@@ -0,0 +1,373 @@
+#!/usr/bin/env python
+
+"""
+In-process forward and inverse kinematics for Baxter's 7-DOF arms.
+
+Everything is vectorized over a leading batch dimension, so N joint
+configurations or N target poses are handled in one pass of NumPy
+operations. Needs no ROS master; LocalIKService exposes the solver
+through the same call interface as the SolvePositionIK service proxy.
+
+A solve is not free: one pose takes from about 0.6 ms to a few ms, even
+from a close seed, mostly in NumPy call overhead, and a batch of 20
+poses about 4.5 ms. Batch the poses of a cycle rather than solving them
+one at a time in a loop.
+"""
+import struct
+
+import numpy as np
+
+
+JOINTS = ('s0', 's1', 'e0', 'e1', 'w0', 'w1', 'w2')
+
+# Denavit-Hartenberg parameters from the s0 joint frame to the w2 flange:
+# theta offset, d, a, alpha (Baxter kinematic specification)
+DH = np.array([
+    [0.0,         0.27035, 0.069, -np.pi / 2],
+    [np.pi / 2,   0.0,     0.0,    np.pi / 2],
+    [0.0,         0.36435, 0.069, -np.pi / 2],
+    [0.0,         0.0,     0.0,    np.pi / 2],
+    [0.0,         0.37429, 0.010, -np.pi / 2],
+    [0.0,         0.0,     0.0,    np.pi / 2],
+    [0.0,         0.22952, 0.0,    0.0],
+])
+
+# Joint position limits (rad) and velocity limits (rad/s), ordered as JOINTS
+JOINT_LIMITS = np.array([
+    [-1.70168, 1.70168],
+    [-2.147,   1.047],
+    [-3.0541,  3.0541],
+    [-0.05,    2.618],
+    [-3.059,   3.059],
+    [-1.5708,  2.094],
+    [-3.059,   3.059],
+])
+VELOCITY_LIMITS = np.array([2.0, 2.0, 2.0, 2.0, 4.0, 4.0, 4.0])
+# Baxter publishes no acceleration limits. These are an estimate, not a
+# measurement: full speed in 0.5 s. Still to be checked against the
+# joint limits in the robot's URDF. Callers should scale them down, as
+# pick_and_place.PickAndPlace does by default.
+ACCELERATION_LIMITS = 2.0 * VELOCITY_LIMITS
+
+# base -> <limb>_arm_mount (xyz, yaw) and arm_mount -> s0 joint (xyz)
+ARM_MOUNTS = {
+    'left': ((0.024645, 0.219645, 0.118588), np.pi / 4),
+    'right': ((0.024645, -0.219645, 0.118588), -np.pi / 4),
+}
+MOUNT_TO_S0 = (0.055695, 0.0, 0.011038)
+
+# Nominal configuration used to seed the solver when no seed is given
+NEUTRAL = np.array([0.0, -0.55, 0.0, 0.75, 0.0, 1.26, 0.0])
+
+
+def quaternion_to_matrix(q):
+    # (..., 4) quaternions as x, y, z, w -> (..., 3, 3) rotation matrices
+    q = np.asarray(q, dtype=np.float64)
+    q = q / np.linalg.norm(q, axis=-1)[..., np.newaxis]
+    x, y, z, w = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+    R = np.empty(q.shape[:-1] + (3, 3))
+    R[..., 0, 0] = 1 - 2 * (y * y + z * z)
+    R[..., 0, 1] = 2 * (x * y - z * w)
+    R[..., 0, 2] = 2 * (x * z + y * w)
+    R[..., 1, 0] = 2 * (x * y + z * w)
+    R[..., 1, 1] = 1 - 2 * (x * x + z * z)
+    R[..., 1, 2] = 2 * (y * z - x * w)
+    R[..., 2, 0] = 2 * (x * z - y * w)
+    R[..., 2, 1] = 2 * (y * z + x * w)
+    R[..., 2, 2] = 1 - 2 * (x * x + y * y)
+    return R
+
+
+def matrix_to_quaternion(R):
+    # (..., 3, 3) rotation matrices -> (..., 4) quaternions as x, y, z, w
+    # with w >= 0. Uses the largest of the four candidate denominators.
+    R = np.asarray(R, dtype=np.float64)
+    shape = R.shape[:-2]
+    R = R.reshape(-1, 3, 3)
+    m00, m11, m22 = R[:, 0, 0], R[:, 1, 1], R[:, 2, 2]
+    candidates = np.stack([1 + m00 + m11 + m22, 1 + m00 - m11 - m22,
+                           1 - m00 + m11 - m22, 1 - m00 - m11 + m22], axis=-1)
+    case = np.argmax(candidates, axis=-1)
+    s = np.sqrt(np.maximum(np.max(candidates, axis=-1), 1e-12)) * 2
+    d21, d02, d10 = R[:, 2, 1] - R[:, 1, 2], R[:, 0, 2] - R[:, 2, 0], R[:, 1, 0] - R[:, 0, 1]
+    s21, s02, s10 = R[:, 2, 1] + R[:, 1, 2], R[:, 0, 2] + R[:, 2, 0], R[:, 1, 0] + R[:, 0, 1]
+    options = np.stack([
+        np.stack([d21 / s, d02 / s, d10 / s, s / 4], axis=-1),
+        np.stack([s / 4, s10 / s, s02 / s, d21 / s], axis=-1),
+        np.stack([s10 / s, s / 4, s21 / s, d02 / s], axis=-1),
+        np.stack([s02 / s, s21 / s, s / 4, d10 / s], axis=-1),
+    ], axis=1)
+    q = options[np.arange(len(case)), case]
+    q = np.where(q[:, 3:4] < 0, -q, q)
+    q /= np.linalg.norm(q, axis=-1)[:, np.newaxis]
+    return q.reshape(shape + (4,))
+
+
+def _translation(xyz):
+    T = np.eye(4)
+    T[:3, 3] = xyz
+    return T
+
+
+def _rot_z(angle):
+    T = np.eye(4)
+    c, s = np.cos(angle), np.sin(angle)
+    T[:2, :2] = [[c, -s], [s, c]]
+    return T
+
+
+class BaxterKinematics(object):
+    """
+    Batched kinematics for one of Baxter's arms, in the base frame.
+
+    tool_length: distance along the flange z axis from the w2 flange to the
+                 end effector point the IK targets, in meters. The 0.15
+                 default is an estimate for the electric gripper; check
+                 it against the gripper frame in the URDF and against the
+                 IK service's solutions before trusting local IK alone.
+    """
+    def __init__(self, limb, tool_length=0.15):
+        mount_xyz, mount_yaw = ARM_MOUNTS[limb]
+        self._limb_name = limb
+        self._base = _translation(mount_xyz).dot(_rot_z(mount_yaw)).dot(
+            _translation(MOUNT_TO_S0))
+        self._tool = _translation((0.0, 0.0, tool_length))
+
+    def joint_names(self):
+        return [self._limb_name + '_' + joint for joint in JOINTS]
+
+    def shoulder_position(self):
+        # Base-frame position of the s1 joint, the centre of the arm's reach
+        return self._frames(np.zeros((1, 7)))[0, 1, :3, 3].copy()
+
+    def to_array(self, joint_angles):
+        # Limb API-compatible joint dict -> (7,) array ordered as JOINTS
+        return np.array([joint_angles[name] for name in self.joint_names()])
+
+    def to_dict(self, q):
+        return dict(zip(self.joint_names(), np.asarray(q, dtype=np.float64).tolist()))
+
+    def _frames(self, q):
+        # (N, 7) joint angles -> (N, 9, 4, 4) frames: base, one per joint
+        # after its transform, and the tool frame last.
+        n = q.shape[0]
+        theta = q + DH[:, 0]
+        ct, st = np.cos(theta), np.sin(theta)
+        ca, sa = np.cos(DH[:, 3]), np.sin(DH[:, 3])
+        A = np.zeros((n, 7, 4, 4))
+        A[..., 0, 0] = ct
+        A[..., 0, 1] = -st * ca
+        A[..., 0, 2] = st * sa
+        A[..., 0, 3] = DH[:, 2] * ct
+        A[..., 1, 0] = st
+        A[..., 1, 1] = ct * ca
+        A[..., 1, 2] = -ct * sa
+        A[..., 1, 3] = DH[:, 2] * st
+        A[..., 2, 1] = sa
+        A[..., 2, 2] = ca
+        A[..., 2, 3] = DH[:, 1]
+        A[..., 3, 3] = 1.0
+        frames = np.empty((n, 9, 4, 4))
+        frames[:, 0] = self._base
+        for i in range(7):
+            frames[:, i + 1] = np.matmul(frames[:, i], A[:, i])
+        frames[:, 8] = np.matmul(frames[:, 7], self._tool)
+        return frames
+
+    def forward(self, q):
+        """
+        Tool poses for joint angles q of shape (7,) or (N, 7).
+        Returns positions (..., 3) and quaternions (..., 4) as x, y, z, w.
+        """
+        q = np.asarray(q, dtype=np.float64)
+        single = q.ndim == 1
+        T = self._frames(np.atleast_2d(q))[:, 8]
+        positions, quaternions = T[:, :3, 3], matrix_to_quaternion(T[:, :3, :3])
+        if single:
+            return positions[0], quaternions[0]
+        return positions, quaternions
+
+    def jacobian(self, q):
+        # Geometric jacobian (N, 6, 7) of the tool point for (N, 7) angles
+        frames = self._frames(np.atleast_2d(np.asarray(q, dtype=np.float64)))
+        return self._jacobian(frames)
+
+    @staticmethod
+    def _jacobian(frames):
+        # joint i rotates about the z axis of the frame before its transform
+        z = frames[:, :7, :3, 2]
+        origins = frames[:, :7, :3, 3]
+        tip = frames[:, 8, :3, 3][:, np.newaxis, :]
+        J = np.empty((frames.shape[0], 6, 7))
+        J[:, :3, :] = np.cross(z, tip - origins).transpose(0, 2, 1)
+        J[:, 3:, :] = z.transpose(0, 2, 1)
+        return J
+
+    def inverse(self, positions, quaternions, seeds=None, restarts=3,
+                **options):
+        """
+        Damped-least-squares IK for N target poses at once.
+
+        positions: (N, 3), quaternions: (N, 4) as x, y, z, w
+        seeds: (N, 7) initial joint angles, NEUTRAL if None
+        restarts: retries from random seeds for targets that did not converge
+        Returns joint angles (N, 7), clipped to JOINT_LIMITS, and a (N,)
+        boolean mask of the targets that converged within tolerance.
+        """
+        positions = np.atleast_2d(np.asarray(positions, dtype=np.float64))
+        target_R = quaternion_to_matrix(np.atleast_2d(quaternions))
+        n = positions.shape[0]
+        if seeds is None:
+            seeds = np.tile(NEUTRAL, (n, 1))
+        q, converged = self._dls(positions, target_R,
+                                 np.array(np.atleast_2d(seeds), dtype=np.float64),
+                                 **options)
+        # fixed random state so that solutions are repeatable
+        rng = np.random.RandomState(0)
+        for _ in range(restarts):
+            failed = np.flatnonzero(~converged)
+            if not len(failed):
+                break
+            retry = rng.uniform(JOINT_LIMITS[:, 0], JOINT_LIMITS[:, 1], (len(failed), 7))
+            q_retry, ok = self._dls(positions[failed], target_R[failed], retry, **options)
+            q[failed[ok]] = q_retry[ok]
+            converged[failed[ok]] = True
+        return q, converged
+
+    def _dls(self, positions, target_R, q, max_iterations=200, damping=0.05,
+             position_tolerance=1e-4, orientation_tolerance=1e-3, max_step=0.2):
+        n = positions.shape[0]
+        lower, upper = JOINT_LIMITS[:, 0], JOINT_LIMITS[:, 1]
+        q = np.clip(q, lower, upper)
+        converged = np.zeros(n, dtype=bool)
+        identity = np.eye(6) * damping * damping
+        for _ in range(max_iterations):
+            active = ~converged
+            if not active.any():
+                break
+            frames = self._frames(q[active])
+            tip = frames[:, 8]
+            pos_err = positions[active] - tip[:, :3, 3]
+            # orientation error as the vector part of the error quaternion,
+            # which points along the rotation axis for any angle up to pi
+            err_R = np.matmul(target_R[active], tip[:, :3, :3].transpose(0, 2, 1))
+            rot_err = 2.0 * matrix_to_quaternion(err_R)[:, :3]
+            done = ((np.linalg.norm(pos_err, axis=1) < position_tolerance) &
+                    (np.linalg.norm(rot_err, axis=1) < orientation_tolerance))
+            error = np.concatenate([pos_err, rot_err], axis=1)
+            J = self._jacobian(frames)
+            JJt = np.matmul(J, J.transpose(0, 2, 1)) + identity
+            dq = np.matmul(J.transpose(0, 2, 1),
+                           np.linalg.solve(JJt, error[:, :, np.newaxis]))[:, :, 0]
+            # limit the step so that large errors do not overshoot
+            scale = np.minimum(1.0, max_step / np.maximum(np.abs(dq).max(axis=1), 1e-12))
+            dq *= scale[:, np.newaxis]
+            dq[done] = 0.0
+            q[active] = np.clip(q[active] + dq, lower, upper)
+            converged[np.flatnonzero(active)[done]] = True
+        return q, converged
+
+    def cartesian_path(self, q_start, positions, quaternions, max_iterations=10,
+                       max_joint_step=0.2, **options):
+        """
+        Joint angles tracking a dense sequence of tool poses.
+
+        Each pose is solved from the previous solution with a few local
+        damped-least-squares steps, starting from q_start (7,), instead of
+        a fresh global solve. Returns (N, 7) joint angles and an (N,) mask
+        of the poses that converged without any joint moving more than
+        max_joint_step from the previous pose.
+        """
+        positions = np.atleast_2d(np.asarray(positions, dtype=np.float64))
+        target_R = quaternion_to_matrix(np.atleast_2d(quaternions))
+        n = positions.shape[0]
+        path = np.empty((n, 7))
+        ok = np.zeros(n, dtype=bool)
+        q = np.array(q_start, dtype=np.float64).reshape(1, 7)
+        for i in range(n):
+            previous = q[0].copy()
+            q, converged = self._dls(positions[i:i + 1], target_R[i:i + 1], q,
+                                     max_iterations=max_iterations, **options)
+            path[i] = q[0]
+            ok[i] = converged[0] and np.abs(q[0] - previous).max() <= max_joint_step
+        return path, ok
+
+    def straight_line(self, q_start, start, end, quaternion, step=0.01):
+        """
+        Joint angles along the straight line from the tool position start
+        to end (3,), at the fixed orientation quaternion, one pose every
+        step meters, excluding start. Returns the cartesian_path result.
+        """
+        start, end = np.asarray(start, dtype=np.float64), np.asarray(end, dtype=np.float64)
+        count = max(1, int(np.ceil(np.linalg.norm(end - start) / step)))
+        s = np.arange(1, count + 1)[:, np.newaxis] / float(count)
+        return self.cartesian_path(q_start, start + s * (end - start),
+                                   np.tile(np.asarray(quaternion, dtype=np.float64), (count, 1)))
+
+    def solve_poses(self, poses, seeds=None):
+        # geometry_msgs Poses -> list of joint dicts, or False when the
+        # solver did not converge for that pose
+        if not poses:
+            return []
+        positions = np.array([[p.position.x, p.position.y, p.position.z] for p in poses])
+        quaternions = np.array([[p.orientation.x, p.orientation.y,
+                                 p.orientation.z, p.orientation.w] for p in poses])
+        if seeds is not None:
+            seeds = np.array([self.to_array(seed) if seed else NEUTRAL for seed in seeds])
+        q, ok = self.inverse(positions, quaternions, seeds)
+        return [self.to_dict(row) if good else False for row, good in zip(q, ok)]
+
+
+class _JointSolution(object):
+    # Mirrors sensor_msgs/JointState as returned in the IK response
+    def __init__(self, name, position):
+        self.name = list(name)
+        self.position = list(position)
+
+
+class IKResponse(object):
+    # Mirrors the fields of baxter_core_msgs/SolvePositionIKResponse
+    RESULT_INVALID = 0
+
+    def __init__(self, joints, result_type):
+        self.joints = joints
+        self.result_type = result_type
+        self.isValid = [seed != self.RESULT_INVALID
+                        for seed in struct.unpack('<%dB' % len(result_type), result_type)]
+
+    @classmethod
+    def from_solutions(cls, solutions, seed_type):
+        # solutions: joint dicts, or False/None for failed poses
+        joints = []
+        seeds = []
+        for solution in solutions:
+            if solution:
+                names = sorted(solution)
+                joints.append(_JointSolution(names, [solution[n] for n in names]))
+                seeds.append(seed_type)
+            else:
+                joints.append(_JointSolution([], []))
+                seeds.append(cls.RESULT_INVALID)
+        return cls(joints, struct.pack('<%dB' % len(seeds), *seeds))
+
+
+class LocalIKService(object):
+    """
+    Drop-in replacement for the SolvePositionIK service proxy that solves
+    in-process with BaxterKinematics. Honours per-pose seed_angles.
+    """
+    SEED_USER = 1
+    SEED_NS_MAP = 3
+
+    def __init__(self, limb, kinematics=None):
+        self.kinematics = kinematics or BaxterKinematics(limb)
+
+    def __call__(self, request):
+        poses = [pose_stamped.pose for pose_stamped in request.pose_stamp]
+        seeds = None
+        seed_type = self.SEED_NS_MAP
+        if len(request.seed_angles) == len(poses) and poses:
+            seeds = [dict(zip(js.name, js.position)) for js in request.seed_angles]
+            seed_type = self.SEED_USER
+        return IKResponse.from_solutions(
+            self.kinematics.solve_poses(poses, seeds), seed_type)
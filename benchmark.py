@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+
+"""
+Headless cycle-time benchmark for the pick and place demo.
+
+Runs the waypoint tour and N pick/place cycles of pick_and_place against
+the deterministic in-process fakes from sim_backend, with no
+Gazebo, ROS master or baxter_interface. Motion, gripper and IK latency
+are charged to a simulated clock, so the cycle-time metrics are exactly
+repeatable and can be compared against a stored baseline. The baseline
+records the parameters it was run with, and is only compared against a
+run with the same parameters.
+
+Allocations are measured with tracemalloc where the interpreter has it
+(Python 3.4 and later); CPython keeps no count of every allocation, so
+the benchmark reports the peak memory the cycles allocate on top of what
+was live before them, and the number of blocks they leave allocated.
+Tracing slows the interpreter down, which shows in wall_ms_per_cycle.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import sim_backend
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# metrics that are deterministic and checked against the baseline;
+# lower is better for all of them
+_CHECKED = ('tour_streamed_s', 'tour_blocking_s', 'cycle_s', 'ik_calls_per_cycle')
+
+# modules of the demo that bind the fake rospy, messages and clock when
+# imported; re-imported on every run so each run gets its own fakes
+_ROS_MODULES = ('pick_and_place', 'block_perception', 'gazebo_scene', 'ik_client')
+
+_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'benchmarks', 'baseline.json')
+
+
+def run_benchmark(cycles=10, ik_latency=0.05, actuation_delay=0.1,
+                  travel_time=0.4, settle_time=0.3):
+    """Run the tour and cycles once and return a dict of metrics."""
+    clock = sim_backend.SimClock()
+    rospy = sim_backend.install_fake_ros(
+        clock, ik_latency=ik_latency,
+        limb_options=dict(settle_time=settle_time),
+        gripper_options=dict(actuation_delay=actuation_delay,
+                             travel_time=travel_time, object_width=40.0))
+    # import only once the fakes are in place
+    for name in _ROS_MODULES:
+        sys.modules.pop(name, None)
+    import pick_and_place as demo
+    import instrumentation
+    import waypoints
+    from geometry_msgs.msg import Pose, Point, Quaternion
+
+    tour = waypoints.WaypointLibrary.load(
+        os.path.join(os.path.dirname(os.path.abspath(demo.__file__)),
+                     "waypoints", "left_tour.wpt"), 'left')
+    profiler = instrumentation.Profiler(clock=clock.now)
+    pnp = demo.PickAndPlace('left', 0.15, verbose=False, profiler=profiler)
+    metrics = {}
+
+    # the tour main() runs, streamed and with one blocking move per waypoint
+    pnp._limb.set_joint_positions(tour.joint_dict(0))
+    start = clock.now()
+    pnp.execute_trajectory(tour[1:], tolerance=demo.TOUR_TOLERANCE)
+    metrics['tour_streamed_s'] = clock.now() - start
+    pnp._limb.set_joint_positions(tour.joint_dict(0))
+    start = clock.now()
+    for i in range(1, len(tour)):
+        pnp._guarded_move_to_joint_position(tour.joint_dict(i))
+    metrics['tour_blocking_s'] = clock.now() - start
+
+    overhead = Quaternion(x=-0.0249590815779, y=0.999649402929,
+                          z=0.00737916180073, w=0.00486450832011)
+    block_poses = [Pose(position=Point(x=0.75, y=-0.1, z=-0.129), orientation=overhead),
+                   Pose(position=Point(x=0.7, y=0.15, z=-0.129), orientation=overhead)]
+    iksvc = pnp._iksvc
+    calls_before = iksvc.calls
+    if tracemalloc is not None:
+        tracemalloc.start()
+        allocated_before = tracemalloc.take_snapshot()
+        memory_before, _ = tracemalloc.get_traced_memory()
+    wall_start = time.time()
+    start = clock.now()
+    for cycle in range(cycles):
+        pnp.pick(block_poses[cycle % 2])
+        pnp.place(block_poses[(cycle + 1) % 2])
+    elapsed = clock.now() - start
+    wall = time.time() - wall_start
+    if tracemalloc is not None:
+        _, memory_peak = tracemalloc.get_traced_memory()
+        allocated_after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        metrics['alloc_peak_kib'] = (memory_peak - memory_before) / 1024.0
+        metrics['alloc_blocks_retained'] = sum(
+            stat.count_diff for stat in
+            allocated_after.compare_to(allocated_before, 'filename'))
+    metrics['cycle_s'] = elapsed / cycles
+    metrics['cycles_per_min'] = 60.0 * cycles / elapsed
+    metrics['ik_calls_per_cycle'] = float(iksvc.calls - calls_before) / cycles
+    metrics['wall_ms_per_cycle'] = 1000.0 * wall / cycles
+    metrics['errors_logged'] = rospy.log_counts['logerr']
+    metrics['phases'] = profiler.summary()
+    return metrics
+
+
+def parameter_mismatch(parameters, baseline):
+    # Names of the run parameters the baseline was recorded with
+    # different values of; a baseline from before they were recorded
+    # matches nothing
+    recorded = baseline.get('parameters', {})
+    return [name for name in sorted(parameters)
+            if recorded.get(name) != parameters[name]]
+
+
+def compare(metrics, baseline, tolerance):
+    # Names of the checked metrics that got worse than baseline by more
+    # than the relative tolerance
+    return [name for name in _CHECKED
+            if name in baseline and
+            metrics[name] > baseline[name] * (1.0 + tolerance) + 1e-9]
+
+
+def main(argv=None):
+    """Run the headless pick and place benchmark."""
+    arg_fmt = argparse.RawDescriptionHelpFormatter
+    parser = argparse.ArgumentParser(formatter_class=arg_fmt,
+                                     description=main.__doc__)
+    parser.add_argument('-n', '--cycles', type=int, default=10,
+                        help="number of pick/place cycles")
+    parser.add_argument('--ik-latency', type=float, default=0.05,
+                        help="simulated IK service latency per call (s)")
+    parser.add_argument('--baseline', default=_BASELINE,
+                        help="baseline results to compare against")
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="store these results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.02,
+                        help="allowed relative regression before failing")
+    args = parser.parse_args(argv)
+
+    parameters = dict(cycles=args.cycles, ik_latency=args.ik_latency)
+    metrics = run_benchmark(**parameters)
+    print("{0:<24}{1:>7}{2:>10}{3:>9}{4:>9}{5:>9}".format(
+        'phase', 'count', 'total', 'p50', 'p95', 'p99'))
+    for name, s in sorted(metrics['phases'].items(), key=lambda item: -item[1]['total']):
+        print("{0:<24}{1:>7}{2:>9.3f}s{3:>8.3f}s{4:>8.3f}s{5:>8.3f}s".format(
+            name, s['count'], s['total'], s['p50'], s['p95'], s['p99']))
+    for name in sorted(metrics):
+        if name != 'phases':
+            print("{0:<24}{1:>12.4f}".format(name, metrics[name]))
+
+    if args.save_baseline:
+        directory = os.path.dirname(os.path.abspath(args.baseline))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(args.baseline, 'w') as baseline_file:
+            baseline = dict((name, metrics[name]) for name in _CHECKED)
+            baseline['parameters'] = parameters
+            json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+        print("Saved baseline to {0}".format(args.baseline))
+        return 0
+    if not os.path.exists(args.baseline):
+        print("No baseline at {0}; run with --save-baseline".format(args.baseline))
+        return 0
+    with open(args.baseline, 'r') as baseline_file:
+        baseline = json.load(baseline_file)
+    mismatched = parameter_mismatch(parameters, baseline)
+    if mismatched:
+        recorded = baseline.get('parameters', {})
+        for name in mismatched:
+            print("PARAMETER MISMATCH {0}: {1} vs baseline {2}".format(
+                name, parameters[name], recorded.get(name, 'unrecorded')))
+        print("Not compared with {0}; rerun with the baseline's parameters "
+              "or --save-baseline".format(args.baseline))
+        return 2
+    regressions = compare(metrics, baseline, args.tolerance)
+    for name in regressions:
+        print("REGRESSION {0}: {1:.4f} vs baseline {2:.4f}".format(
+            name, metrics[name], baseline[name]))
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
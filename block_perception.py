@@ -0,0 +1,366 @@
+#!/usr/bin/env python
+
+"""
+Block pose estimation for closing the pick and place loop.
+
+Depth images or point clouds (recorded .npz frames locally) are
+deprojected into the base frame, the points just above the table plane
+are rasterized and split into connected blobs, and each block-sized blob
+becomes an overhead grasp Pose. Frames are consumed as a stream through
+a drop-oldest buffer, so a slow consumer only ever sees the latest frame,
+and confirmed blocks are turned into PickPlaceJobs that
+PipelinedScheduler.run consumes as they arrive.
+"""
+import glob
+import math
+import os
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import numpy as np
+
+from geometry_msgs.msg import (
+    Pose,
+    Point,
+    Quaternion,
+)
+
+import reachability
+from pick_place_scheduler import NullGuard, PickPlaceJob
+
+
+class CameraModel(object):
+    """
+    Pinhole depth camera.
+
+    transform: 4x4 camera-to-base homogeneous transform
+    depth_scale: meters per depth unit, e.g. 0.001 for uint16 millimeters
+    """
+    def __init__(self, fx, fy, cx, cy, transform=None, depth_scale=1.0):
+        self.fx, self.fy, self.cx, self.cy = fx, fy, cx, cy
+        self.transform = np.eye(4) if transform is None else np.asarray(transform, dtype=np.float64)
+        self.depth_scale = depth_scale
+        self._rays = {}
+
+    def _ray_grid(self, shape):
+        # per-pixel (x/z, y/z) for an image shape, computed once
+        rays = self._rays.get(shape)
+        if rays is None:
+            v, u = np.indices(shape, dtype=np.float64)
+            rays = self._rays[shape] = (((u - self.cx) / self.fx).ravel(),
+                                        ((v - self.cy) / self.fy).ravel())
+        return rays
+
+    def deproject(self, depth):
+        # (N, 3) base-frame points of the pixels with a valid depth
+        rx, ry = self._ray_grid(depth.shape)
+        z = depth.ravel().astype(np.float64) * self.depth_scale
+        valid = np.isfinite(z) & (z > 0)
+        z = z[valid]
+        camera = np.column_stack((rx[valid] * z, ry[valid] * z, z))
+        return camera.dot(self.transform[:3, :3].T) + self.transform[:3, 3]
+
+
+def read_frames(path, camera=None, period=None, now=time.time, sleep=time.sleep):
+    """
+    Yield (stamp, points) for recorded frames, in file name order.
+
+    path: directory or glob of .npz frames, each holding 'points' (N, 3)
+          in the base frame or a 'depth' image (needs camera), and
+          optionally a 'stamp'
+    period: replay at one frame per period seconds, like a live sensor;
+            None reads as fast as the consumer pulls
+    """
+    pattern = os.path.join(path, '*.npz') if os.path.isdir(path) else path
+    next_time = now()
+    for index, frame_file in enumerate(sorted(glob.glob(pattern))):
+        if period is not None:
+            delay = next_time - now()
+            if delay > 0:
+                sleep(delay)
+            next_time += period
+        data = np.load(frame_file)
+        if 'points' in data:
+            points = np.asarray(data['points'], dtype=np.float64).reshape(-1, 3)
+        else:
+            if camera is None:
+                raise ValueError("{0} holds a depth image; a CameraModel is required".format(
+                    frame_file))
+            points = camera.deproject(data['depth'])
+        stamp = float(data['stamp']) if 'stamp' in data else float(index)
+        yield stamp, points
+
+
+class LatestFrames(object):
+    """
+    Drop-oldest frame buffer. A reader thread pulls frames from the
+    source as fast as it produces them; iterating yields the newest
+    buffered frames, and frames the consumer had no time for are dropped.
+
+    maxsize: frames kept waiting for the consumer
+    """
+    _END = object()
+
+    def __init__(self, frames, maxsize=1):
+        self._frames = frames
+        self._buffer = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self.received = 0
+        self.dropped = 0
+        self._reader = threading.Thread(target=self._read)
+        self._reader.daemon = True
+        self._reader.start()
+
+    def _offer(self, item):
+        # put, evicting the oldest buffered frame when full
+        with self._lock:
+            while True:
+                try:
+                    self._buffer.put_nowait(item)
+                    return
+                except queue.Full:
+                    try:
+                        self._buffer.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+
+    def _read(self):
+        try:
+            for frame in self._frames:
+                if self._stopped.is_set():
+                    break
+                self.received += 1
+                self._offer(frame)
+        finally:
+            # the end marker must not evict a frame the consumer has yet
+            # to see, so wait for room
+            while not self._stopped.is_set():
+                try:
+                    self._buffer.put(self._END, timeout=0.05)
+                    break
+                except queue.Full:
+                    pass
+
+    def stop(self):
+        self._stopped.set()
+
+    def __iter__(self):
+        while not self._stopped.is_set():
+            try:
+                item = self._buffer.get(timeout=0.05)
+            except queue.Empty:
+                continue
+            if item is self._END:
+                return
+            yield item
+
+
+def _quaternion_multiply(a, b):
+    # Hamilton product of xyzw quaternions
+    ax, ay, az, aw = a
+    bx, by, bz, bw = b
+    return (aw * bx + ax * bw + ay * bz - az * by,
+            aw * by - ax * bz + ay * bw + az * bx,
+            aw * bz + ax * by - ay * bx + az * bw,
+            aw * bw - ax * bx - ay * by - az * bz)
+
+
+def _label_components(occupied):
+    # 4-connected component labels of a 2D boolean grid, -1 off the grid;
+    # min-label propagation with pointer jumping, all in numpy
+    size = occupied.size
+    labels = np.where(occupied.ravel(), np.arange(size), size).reshape(occupied.shape)
+    while True:
+        new = labels.copy()
+        np.minimum(new[1:, :], labels[:-1, :], out=new[1:, :])
+        np.minimum(new[:-1, :], labels[1:, :], out=new[:-1, :])
+        np.minimum(new[:, 1:], labels[:, :-1], out=new[:, 1:])
+        np.minimum(new[:, :-1], labels[:, 1:], out=new[:, :-1])
+        new[~occupied] = size
+        flat = new.ravel()
+        inside = flat < size
+        flat[inside] = flat[flat[inside]]
+        if np.array_equal(new, labels):
+            break
+        labels = new
+    labels[~occupied] = -1
+    return labels
+
+
+class BlockDetector(object):
+    """
+    Segments blocks lying on the table plane.
+
+    table_height: nominal table top z in the base frame; refined per
+                  frame from the points near it when fit_table is set
+    band: (low, high) heights above the table of the points kept
+    cell: raster cell edge length, meters
+    min_points: smallest blob accepted as a block
+    max_size: largest blob extent accepted as a block, meters; bigger
+              blobs (e.g. the arm over the table) are ignored
+    workspace: optional ((x_min, x_max), (y_min, y_max)) region of interest
+    """
+    def __init__(self, table_height=reachability.TABLE_HEIGHT - reachability.BASE_HEIGHT,
+                 band=(0.01, 0.12), cell=0.005, min_points=30, max_size=0.09,
+                 workspace=None, fit_table=True,
+                 orientation=reachability.OVERHEAD_ORIENTATION):
+        self.table_height = table_height
+        self._band = band
+        self._cell = cell
+        self._min_points = min_points
+        self._max_size = max_size
+        self._workspace = workspace
+        self._fit_table = fit_table
+        self._orientation = tuple(orientation)
+
+    def _table_height(self, z):
+        # median of the points within 2 cm of the nominal table top
+        if self._fit_table:
+            near = z[np.abs(z - self.table_height) < 0.02]
+            if len(near) >= self._min_points:
+                return float(np.median(near))
+        return self.table_height
+
+    def detect(self, points):
+        """Grasp Poses in the base frame of the blocks in points (N, 3)."""
+        points = np.asarray(points, dtype=np.float64)
+        if self._workspace is not None:
+            (x0, x1), (y0, y1) = self._workspace
+            points = points[(points[:, 0] >= x0) & (points[:, 0] <= x1) &
+                            (points[:, 1] >= y0) & (points[:, 1] <= y1)]
+        if not len(points):
+            return []
+        table = self._table_height(points[:, 2])
+        height = points[:, 2] - table
+        points = points[(height >= self._band[0]) & (height <= self._band[1])]
+        if len(points) < self._min_points:
+            return []
+
+        # rasterize the xy footprint and label the connected blobs
+        lower = points[:, :2].min(axis=0)
+        cells = np.floor((points[:, :2] - lower) / self._cell).astype(np.int64)
+        shape = tuple(cells.max(axis=0) + 1)
+        flat = cells[:, 0] * shape[1] + cells[:, 1]
+        occupied = np.bincount(flat, minlength=shape[0] * shape[1]).reshape(shape) > 0
+        cell_labels = _label_components(occupied).ravel()
+        blobs, blob_of = np.unique(cell_labels[flat], return_inverse=True)
+
+        # per-blob moments
+        count = np.bincount(blob_of, minlength=len(blobs)).astype(np.float64)
+        x, y = points[:, 0], points[:, 1]
+        mx = np.bincount(blob_of, x, len(blobs)) / count
+        my = np.bincount(blob_of, y, len(blobs)) / count
+        dx, dy = x - mx[blob_of], y - my[blob_of]
+        sxx = np.bincount(blob_of, dx * dx, len(blobs)) / count
+        syy = np.bincount(blob_of, dy * dy, len(blobs)) / count
+        sxy = np.bincount(blob_of, dx * dy, len(blobs)) / count
+        # fourth-order complex moment: a square's second moments are
+        # isotropic, but sum((dx + i dy)^4) turns with 4x its yaw
+        d2 = dx * dx - dy * dy
+        c4 = np.bincount(blob_of, d2 * d2 - 4.0 * (dx * dy) ** 2, len(blobs))
+        s4 = np.bincount(blob_of, 4.0 * dx * dy * d2, len(blobs))
+        top = np.full(len(blobs), -np.inf)
+        np.maximum.at(top, blob_of, points[:, 2])
+
+        # principal axis extent of a uniform square is sqrt(12) std
+        spread = np.sqrt(np.maximum((sxx - syy) ** 2 / 4.0 + sxy ** 2, 0.0))
+        extent = np.sqrt(12.0 * np.maximum((sxx + syy) / 2.0 + spread, 0.0))
+        keep = (count >= self._min_points) & (extent <= self._max_size)
+        poses = []
+        for i in np.flatnonzero(keep):
+            # the moment of an axis-aligned square is negative real; the
+            # grasp yaw only matters modulo 90 deg
+            yaw = (math.atan2(s4[i], c4[i]) - math.pi) / 4.0
+            yaw = (yaw + math.pi / 4.0) % (math.pi / 2.0) - math.pi / 4.0
+            turn = (0.0, 0.0, math.sin(yaw / 2.0), math.cos(yaw / 2.0))
+            qx, qy, qz, qw = _quaternion_multiply(turn, self._orientation)
+            # grasp halfway up the block
+            poses.append(Pose(
+                position=Point(x=float(mx[i]), y=float(my[i]),
+                               z=float((table + top[i]) / 2.0)),
+                orientation=Quaternion(x=qx, y=qy, z=qz, w=qw)))
+        return poses
+
+
+class BlockTracker(object):
+    """
+    Turns per-frame detections into one pick per block. A block is
+    confirmed once it is seen in confirm_frames consecutive frames, and
+    is never reported again; neither is anything at an excluded position
+    (e.g. where blocks have been placed).
+    """
+    def __init__(self, match_radius=0.03, confirm_frames=2):
+        self._radius2 = match_radius ** 2
+        self._confirm_frames = confirm_frames
+        self._candidates = []
+        self._known = []
+
+    def exclude(self, pose):
+        self._known.append((pose.position.x, pose.position.y))
+
+    def _near(self, positions, x, y):
+        for px, py in positions:
+            if (px - x) ** 2 + (py - y) ** 2 <= self._radius2:
+                return True
+        return False
+
+    def update(self, poses):
+        """Newly confirmed blocks among this frame's detections."""
+        confirmed = []
+        candidates = []
+        for pose in poses:
+            x, y = pose.position.x, pose.position.y
+            if self._near(self._known, x, y):
+                continue
+            hits = 1
+            for cx, cy, previous in self._candidates:
+                if (cx - x) ** 2 + (cy - y) ** 2 <= self._radius2:
+                    hits = previous + 1
+                    break
+            if hits >= self._confirm_frames:
+                self._known.append((x, y))
+                confirmed.append(pose)
+            else:
+                candidates.append((x, y, hits))
+        self._candidates = candidates
+        return confirmed
+
+
+def pick_jobs(frames, place_poses, detector=None, tracker=None, profiler=None,
+              is_shutdown=lambda: False):
+    """
+    Generator of PickPlaceJobs for PipelinedScheduler.run: each confirmed
+    block is picked and placed at the next of place_poses. Ends with the
+    frames or the place poses, and then stops the frames if they can be.
+
+    frames: iterable of (stamp, points), e.g. LatestFrames(read_frames(...))
+    profiler: optional instrumentation.Profiler timing each frame as
+              'perception'
+    """
+    detector = detector or BlockDetector()
+    tracker = tracker or BlockTracker()
+    place_poses = iter(place_poses)
+    try:
+        for stamp, points in frames:
+            if is_shutdown():
+                return
+            with profiler.span('perception') if profiler else NullGuard():
+                poses = detector.detect(points)
+            for pose in tracker.update(poses):
+                try:
+                    place_pose = next(place_poses)
+                except StopIteration:
+                    return
+                tracker.exclude(place_pose)
+                yield PickPlaceJob(pose, place_pose)
+    finally:
+        # release the reader of a LatestFrames source
+        if hasattr(frames, 'stop'):
+            frames.stop()
@@ -0,0 +1,369 @@
+#!/usr/bin/env python
+
+"""
+Concurrent left/right arm operation for the pick and place demo.
+
+Each arm runs its own PickAndPlace instance (with its own IK service proxy)
+on its own motion thread. Jobs are allocated to the arms by reachability
+and load, and a shared-workspace exclusion zone keeps both arms from
+working in the overlap between them at the same time. A job one arm
+cannot plan is offered to the other arm once the first pass is done.
+"""
+import threading
+import time
+
+import numpy as np
+
+import baxter_kinematics
+from pick_place_scheduler import PipelinedScheduler
+
+
+class ZoneCancelled(RuntimeError):
+    """
+    Raised by an arm waiting for the exclusion zone when the run is
+    cancelled.
+    """
+
+
+class ExclusionZone(object):
+    """
+    Axis-aligned box in the base frame that only one arm may work in at a
+    time. An arm claims the zone before a job whose swept path crosses the
+    box, and keeps it until the arm is parked outside again.
+
+    The swept path joins the arm's parked position, the pick and place
+    hover poses and the targets with straight lines. Joint-space moves bow
+    away from those lines, so the box should leave some margin around the
+    space both arms can reach.
+    """
+    def __init__(self, x_range=(0.4, 1.0), y_range=(-0.15, 0.15),
+                 z_range=(-1.0, 1.0)):
+        self._bounds = (x_range, y_range, z_range)
+        self._lock = threading.Lock()
+
+    def contains(self, pose):
+        p = pose.position
+        return self._contains((p.x, p.y, p.z))
+
+    def _contains(self, point):
+        return all(lo <= value <= hi
+                   for value, (lo, hi) in zip(point, self._bounds))
+
+    def _segment_crosses(self, start, end):
+        # slab test: clip the parameter range of start + t (end - start)
+        # to each axis interval of the box
+        t0, t1 = 0.0, 1.0
+        for a, b, (lo, hi) in zip(start, end, self._bounds):
+            d = b - a
+            if abs(d) < 1e-12:
+                if not lo <= a <= hi:
+                    return False
+                continue
+            ta, tb = sorted(((lo - a) / d, (hi - a) / d))
+            t0, t1 = max(t0, ta), min(t1, tb)
+            if t0 > t1:
+                return False
+        return True
+
+    def crosses(self, points):
+        """
+        Whether the polyline through points, (x, y, z) tuples in the base
+        frame, touches the box.
+        """
+        points = list(points)
+        if len(points) == 1:
+            return self._contains(points[0])
+        return any(self._segment_crosses(a, b)
+                   for a, b in zip(points[:-1], points[1:]))
+
+    def arm_guard(self, pnp, is_cancelled=lambda: False):
+        """
+        Per-arm scheduler guard for the pick_and_place.PickAndPlace pnp.
+        """
+        return ArmZoneGuard(self, pnp, is_cancelled)
+
+
+class ArmZoneGuard(object):
+    """
+    One arm's hold on an ExclusionZone, used as a PipelinedScheduler guard.
+
+    Tracks where the arm is parked between jobs: place() leaves it at the
+    hover pose above the place target. The zone stays held while that
+    hover pose is inside the box, and is released by the first job that
+    takes the arm out of it, or by leave() at the end of the run.
+    """
+    def __init__(self, zone, pnp, is_cancelled=lambda: False):
+        self._zone = zone
+        self._pnp = pnp
+        self._is_cancelled = is_cancelled
+        self._kinematics = baxter_kinematics.BaxterKinematics(pnp._limb_name)
+        self._rest = pnp._limb.joint_angles()
+        self._parked = self._position(self._rest)
+        self.holding = False
+
+    def _position(self, joint_angles):
+        position, _ = self._kinematics.forward(self._kinematics.to_array(joint_angles))
+        return tuple(position)
+
+    def _hover(self, pose):
+        p = pose.position
+        return (p.x, p.y, p.z + self._pnp._hover_distance)
+
+    def swept_path(self, job):
+        # parked -> pick hover -> pick -> pick hover -> place hover -> place
+        # -> place hover, where the arm parks until the next job
+        path = [self._parked]
+        for pose in (job.pick_pose, job.place_pose):
+            p = pose.position
+            path += [self._hover(pose), (p.x, p.y, p.z), self._hover(pose)]
+        return path
+
+    def _acquire(self):
+        # poll, so that a cancelled run does not wait on the other arm
+        while not self._zone._lock.acquire(False):
+            if self._is_cancelled():
+                raise ZoneCancelled("cancelled waiting for the exclusion zone")
+            time.sleep(0.01)
+        self.holding = True
+
+    def _release(self):
+        self.holding = False
+        self._zone._lock.release()
+
+    def __call__(self, job):
+        return _Claim(self, job)
+
+    def _started(self, job):
+        if not self.holding and self._zone.crosses(self.swept_path(job)):
+            self._acquire()
+
+    def _finished(self, job):
+        self._parked = self._hover(job.place_pose)
+        if self.holding and not self._zone._contains(self._parked):
+            self._release()
+
+    def leave(self):
+        """
+        Move the arm back to the joint angles it started from if it is
+        parked inside the zone, and release the zone.
+        """
+        if not self.holding:
+            return
+        if self._zone._contains(self._parked):
+            self._pnp._guarded_move_to_joint_position(self._rest)
+            self._parked = self._position(self._rest)
+        self._release()
+
+    def recover(self):
+        """
+        After a failed job, move the arm back to the joint angles it
+        started from while it still holds the zone, and release the zone.
+        """
+        if not self.holding:
+            # the job's path kept clear of the zone
+            self._parked = self._position(self._pnp._limb.joint_angles())
+            return
+        try:
+            self._pnp._guarded_move_to_joint_position(self._rest)
+            self._parked = self._position(self._rest)
+        finally:
+            self._release()
+
+
+class _Claim(object):
+    # context manager around one job; after a failed job the arm's
+    # position is unknown, so the zone stays held until recover()
+    def __init__(self, guard, job):
+        self._guard = guard
+        self._job = job
+
+    def __enter__(self):
+        self._guard._started(self._job)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self._guard._finished(self._job)
+        return False
+
+
+class ShoulderReach(object):
+    """
+    Default reachability test: the pose lies within max_reach of the arm's
+    shoulder. A reachability map or IK check can be used instead by
+    passing any is_reachable(limb, pose) callable to the coordinator.
+    """
+    def __init__(self, max_reach=1.04):
+        self._max_reach = max_reach
+        self._shoulders = dict(
+            (limb, baxter_kinematics.BaxterKinematics(limb).shoulder_position())
+            for limb in baxter_kinematics.ARM_MOUNTS)
+
+    def distance(self, limb, pose):
+        p = pose.position
+        return float(np.linalg.norm(np.array([p.x, p.y, p.z]) - self._shoulders[limb]))
+
+    def __call__(self, limb, pose):
+        return self.distance(limb, pose) <= self._max_reach
+
+
+class DualArmCoordinator(object):
+    """
+    Runs pick/place jobs on both arms concurrently.
+
+    arms: dict of limb name -> PickAndPlace
+    is_reachable: callable(limb, pose) -> bool, ShoulderReach() if None
+    zone: ExclusionZone shared by both arms, ExclusionZone() if None
+    """
+    def __init__(self, arms, is_reachable=None, zone=None, lookahead=2,
+                 is_shutdown=lambda: False, verbose=True):
+        self._arms = arms
+        self._is_reachable = is_reachable or ShoulderReach()
+        self._zone = zone or ExclusionZone()
+        self._lookahead = lookahead
+        self._is_shutdown = is_shutdown
+        self._verbose = verbose
+        self._schedulers = {}
+        self._stopped = threading.Event()
+
+    def allocate(self, jobs):
+        """
+        Assign each job to an arm that reaches both of its poses, preferring
+        the arm with fewer jobs so far. is_reachable is only a first guess;
+        run() offers the jobs an arm cannot plan to the other arm. Returns (dict of limb -> jobs,
+        list of jobs no arm can reach).
+        """
+        allocation = dict((limb, []) for limb in self._arms)
+        unreachable = []
+        for job in jobs:
+            candidates = [limb for limb in sorted(self._arms)
+                          if self._is_reachable(limb, job.pick_pose) and
+                          self._is_reachable(limb, job.place_pose)]
+            if not candidates:
+                unreachable.append(job)
+                continue
+            limb = min(candidates, key=lambda limb: len(allocation[limb]))
+            allocation[limb].append(job)
+        return allocation, unreachable
+
+    def cancel(self):
+        self._stopped.set()
+        for scheduler in self._schedulers.values():
+            scheduler.cancel()
+
+    def _cancelled(self):
+        return self._stopped.is_set() or self._is_shutdown()
+
+    def _run_arm(self, limb, scheduler, guard, jobs, summaries, errors):
+        try:
+            summaries[limb] = scheduler.run(jobs)
+            guard.leave()
+        except ZoneCancelled:
+            # cancelled while the other arm held the zone
+            summaries[limb] = _summary(scheduler.results, len(jobs))
+        except Exception as e:
+            errors.append(e)
+            self.cancel()
+            # the arm stopped part way through a job; park it so the zone
+            # is free for the next run
+            guard.recover()
+
+    def _run_pass(self, allocation):
+        # one motion thread per arm; returns limb -> (summary, results)
+        summaries = {}
+        errors = []
+        threads = []
+        schedulers = {}
+        for limb, arm_jobs in allocation.items():
+            if not arm_jobs:
+                continue
+            guard = self._zone.arm_guard(self._arms[limb], self._cancelled)
+            scheduler = PipelinedScheduler(
+                self._arms[limb], lookahead=self._lookahead,
+                is_shutdown=self._is_shutdown, verbose=self._verbose,
+                guard=guard)
+            schedulers[limb] = scheduler
+            thread = threading.Thread(
+                target=self._run_arm,
+                args=(limb, scheduler, guard, arm_jobs, summaries, errors))
+            thread.daemon = True
+            threads.append(thread)
+        self._schedulers = schedulers
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        return dict((limb, (summaries[limb], schedulers[limb].results))
+                    for limb in schedulers)
+
+    def run(self, jobs):
+        """
+        Allocate and execute jobs, one motion thread per arm. Jobs an arm
+        fails to plan are then offered to an arm that has not tried them.
+        Returns a summary dict with per-arm scheduler summaries, summed
+        over the passes, under 'arms', and the indices of the jobs no arm
+        could plan under 'failed'.
+        """
+        jobs = list(jobs)
+        for i, job in enumerate(jobs):
+            if job.index is None:
+                job.index = i
+        by_index = dict((job.index, job) for job in jobs)
+        allocation, unreachable = self.allocate(jobs)
+        self._stopped.clear()
+        tried = dict((job.index, set()) for job in jobs)
+        summaries = dict((limb, None) for limb in self._arms)
+        status = {}
+        start = time.time()
+        while any(allocation.values()) and not self._cancelled():
+            for limb, arm_jobs in allocation.items():
+                for job in arm_jobs:
+                    tried[job.index].add(limb)
+            retry = dict((limb, []) for limb in self._arms)
+            for limb, (summary, results) in self._run_pass(allocation).items():
+                summaries[limb] = _merge(summaries[limb], summary)
+                for index, result in results:
+                    status[index] = result
+                    others = [other for other in sorted(self._arms)
+                              if other not in tried[index]]
+                    if result == 'failed' and others:
+                        other = min(others, key=lambda other: len(retry[other]))
+                        retry[other].append(by_index[index])
+            allocation = retry
+        elapsed = time.time() - start
+        summaries = dict((limb, summary) for limb, summary in summaries.items()
+                         if summary is not None)
+        done = sum(summary['done'] for summary in summaries.values())
+        return {
+            'arms': summaries,
+            'done': done,
+            'failed': sorted(index for index, result in status.items()
+                             if result == 'failed'),
+            'unreachable': [job.index for job in unreachable],
+            'elapsed': elapsed,
+            'picks_per_minute': 60.0 * done / elapsed if elapsed > 0 else 0.0,
+        }
+
+
+def _summary(results, total):
+    # scheduler summary of a run cut short; the jobs without a result
+    # count as cancelled
+    counts = dict((status, sum(1 for _, result in results if result == status))
+                  for status in ('done', 'failed', 'resumed'))
+    counts['cancelled'] = total - sum(counts.values())
+    counts['elapsed'] = 0.0
+    counts['picks_per_minute'] = 0.0
+    return counts
+
+
+def _merge(total, summary):
+    # per-arm summary over several passes
+    if total is None:
+        return dict(summary)
+    merged = dict((key, total[key] + summary[key])
+                  for key in ('done', 'failed', 'cancelled', 'resumed', 'elapsed'))
+    merged['picks_per_minute'] = (60.0 * merged['done'] / merged['elapsed']
+                                  if merged['elapsed'] > 0 else 0.0)
+    return merged
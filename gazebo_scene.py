@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+
+"""
+Gazebo scene setup and teardown for the pick and place demo.
+
+Model files are read and newline-stripped once per process, persistent
+connections to the spawn/delete services are pooled and reused across
+calls, and a declarative list of models is spawned or deleted
+concurrently.
+"""
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import rospy
+import rospkg
+
+from gazebo_msgs.srv import (
+    SpawnModel,
+    DeleteModel,
+    GetWorldProperties,
+)
+from geometry_msgs.msg import (
+    Pose,
+    Point,
+)
+
+SPAWN_SERVICES = {
+    'sdf': '/gazebo/spawn_sdf_model',
+    'urdf': '/gazebo/spawn_urdf_model',
+}
+DELETE_SERVICE = '/gazebo/delete_model'
+WORLD_PROPERTIES_SERVICE = '/gazebo/get_world_properties'
+
+
+class ModelSpec(object):
+    """
+    One model to spawn.
+
+    model_file: path relative to the model directory, e.g.
+                "cafe_table/model.sdf"; the spawn service is picked from
+                the extension
+    """
+    def __init__(self, name, model_file, pose, reference_frame="world"):
+        self.name = name
+        self.model_file = model_file
+        self.pose = pose
+        self.reference_frame = reference_frame
+
+    @property
+    def format(self):
+        return 'urdf' if self.model_file.endswith('.urdf') else 'sdf'
+
+
+def default_scene(table_pose=Pose(position=Point(x=1.0, y=0.0, z=0.0)),
+                  table_pose2=Pose(position=Point(x=0.0, y=1.0, z=0.0)),
+                  table_reference_frame="world",
+                  block_pose=Pose(position=Point(x=0.7334, y=-0.0291, z=0.7749)),
+                  block_reference_frame="world"):
+    # The two tables and the block load_gazebo_models spawns
+    return [
+        ModelSpec("cafe_table", "cafe_table/model.sdf", table_pose,
+                  table_reference_frame),
+        ModelSpec("cafe_table2", "cafe_table/model.sdf", table_pose2,
+                  table_reference_frame),
+        ModelSpec("block", "block/model.urdf", block_pose, block_reference_frame),
+    ]
+
+
+def block_grid(count, origin=(0.6, -0.3, 0.7749), spacing=0.1, columns=5,
+               reference_frame="world"):
+    # count blocks laid out in rows on the table in front of the robot
+    return [ModelSpec("block_{0}".format(i), "block/model.urdf",
+                      Pose(position=Point(x=origin[0] + spacing * (i // columns),
+                                          y=origin[1] + spacing * (i % columns),
+                                          z=origin[2])),
+                      reference_frame)
+            for i in range(count)]
+
+
+def _run_parallel(function, items, workers):
+    # Apply function to every item on up to workers threads; results are
+    # returned in item order.
+    items = list(items)
+    results = [None] * len(items)
+    pending = queue.Queue()
+    for index, item in enumerate(items):
+        pending.put((index, item))
+
+    def work():
+        while True:
+            try:
+                index, item = pending.get_nowait()
+            except queue.Empty:
+                return
+            results[index] = function(item)
+
+    threads = [threading.Thread(target=work)
+               for _ in range(max(1, min(workers, len(items))))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def _close_proxy(proxy):
+    # rospy.ServiceProxy.close() shuts a persistent connection down
+    close = getattr(proxy, 'close', None)
+    if close is not None:
+        close()
+
+
+class SceneManager(object):
+    """
+    Spawns and deletes Gazebo models concurrently.
+
+    model_path: directory holding the model files, defaults to the models
+                shipped with baxter_sim_examples
+    workers: number of concurrent service calls
+    service_proxy: ServiceProxy factory, rospy.ServiceProxy by default;
+                   replaceable by a local fake for testing
+
+    Call close() when done to close the pooled connections.
+    """
+    _xml_cache = {}
+    _xml_lock = threading.Lock()
+
+    def __init__(self, model_path=None, workers=4, service_proxy=None,
+                 wait_for_service=None):
+        self._model_path = model_path
+        self._workers = workers
+        self._service_proxy = service_proxy or rospy.ServiceProxy
+        self._wait_for_service = wait_for_service or rospy.wait_for_service
+        self._ready = set()
+        self._ready_lock = threading.Lock()
+        # persistent connections are not safe to share between threads, so
+        # each is checked out of a per-service pool by one call at a time;
+        # at most workers of them are open per service
+        self._idle = {}
+        self._pool_lock = threading.Lock()
+        self.last_elapsed = 0.0
+        # names the last spawn(skip_existing=True) found already there
+        self.last_kept = []
+
+    def _model_dir(self):
+        if self._model_path is None:
+            self._model_path = rospkg.RosPack().get_path('baxter_sim_examples') + "/models/"
+        return self._model_path
+
+    def model_xml(self, model_file):
+        # Read and newline-strip a model file once per process
+        path = self._model_dir() + model_file
+        with self._xml_lock:
+            xml = self._xml_cache.get(path)
+            if xml is None:
+                with open(path, "r") as model:
+                    xml = model.read().replace('\n', '')
+                self._xml_cache[path] = xml
+        return xml
+
+    def _wait_ready(self, service):
+        # not under the lock, so different services are waited for in
+        # parallel; a second waiter on the same service is harmless
+        with self._ready_lock:
+            if service in self._ready:
+                return
+        self._wait_for_service(service)
+        with self._ready_lock:
+            self._ready.add(service)
+
+    def _call(self, service, service_class, args=(), wait=True):
+        # Call service on a pooled persistent connection. A connection
+        # that fails is closed and re-created by a later call.
+        if wait:
+            self._wait_ready(service)
+        with self._pool_lock:
+            idle = self._idle.setdefault(service, [])
+            proxy = idle.pop() if idle else None
+        if proxy is None:
+            proxy = self._service_proxy(service, service_class, persistent=True)
+        try:
+            result = proxy(*args)
+        except (rospy.ServiceException, rospy.ROSException):
+            _close_proxy(proxy)
+            raise
+        with self._pool_lock:
+            self._idle[service].append(proxy)
+        return result
+
+    def close(self):
+        """Close the pooled service connections."""
+        with self._pool_lock:
+            proxies = [proxy for idle in self._idle.values() for proxy in idle]
+            self._idle = {}
+        for proxy in proxies:
+            _close_proxy(proxy)
+
+    def _spawn_one(self, spec):
+        service = SPAWN_SERVICES[spec.format]
+        try:
+            self._call(service, SpawnModel,
+                       (spec.name, self.model_xml(spec.model_file), "/",
+                        spec.pose, spec.reference_frame))
+            return True
+        except (rospy.ServiceException, rospy.ROSException) as e:
+            rospy.logerr("Spawn {0} service call failed: {1}".format(
+                spec.format.upper(), e))
+            return False
+
+    def _delete_one(self, name):
+        # Do not wait for the delete service: teardown runs on ROS exit,
+        # and if Gazebo is already gone it is fine to error out
+        try:
+            self._call(DELETE_SERVICE, DeleteModel, (name,), wait=False)
+            return True
+        except (rospy.ServiceException, rospy.ROSException) as e:
+            rospy.loginfo("Delete Model service call failed: {0}".format(e))
+            return False
+
+    def existing(self):
+        """Names of the models already in the world; empty if unknown."""
+        try:
+            world = self._call(WORLD_PROPERTIES_SERVICE, GetWorldProperties)
+            return set(getattr(world, 'model_names', None) or ())
+        except (rospy.ServiceException, rospy.ROSException) as e:
+            rospy.logwarn("Get world properties service call failed: {0}".format(e))
+            return set()
+
+    def spawn(self, models, skip_existing=False):
+        """
+        Spawn the ModelSpecs concurrently. Returns a dict of model name to
+        success; the wall time taken is kept in last_elapsed. With
+        skip_existing, models already in the world (e.g. left by a run
+        that died) are kept as they are and reported as successes.
+        """
+        models = list(models)
+        start = time.time()
+        # wait for every service needed at once rather than in turn
+        services = set(SPAWN_SERVICES[spec.format] for spec in models)
+        if skip_existing:
+            services.add(WORLD_PROPERTIES_SERVICE)
+        _run_parallel(self._wait_ready, services, self._workers)
+        kept = {}
+        if skip_existing:
+            present = self.existing()
+            kept = dict((spec.name, True) for spec in models if spec.name in present)
+            models = [spec for spec in models if spec.name not in kept]
+        self.last_kept = sorted(kept)
+        # read every distinct file once up front, outside the workers
+        for model_file in set(spec.model_file for spec in models):
+            self.model_xml(model_file)
+        results = _run_parallel(self._spawn_one, models, self._workers)
+        self.last_elapsed = time.time() - start
+        kept.update(zip([spec.name for spec in models], results))
+        return kept
+
+    def delete(self, names):
+        """Delete the named models concurrently; same return as spawn."""
+        names = list(names)
+        start = time.time()
+        results = _run_parallel(self._delete_one, names, self._workers)
+        self.last_elapsed = time.time() - start
+        return dict(zip(names, results))
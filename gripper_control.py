@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+"""
+Completion tracking for Baxter gripper commands.
+
+Gripper.open()/close() are issued non-blocking and return a GripperFuture
+that resolves from the gripper's state feedback: fingers at the commanded
+position, an object detected, a force threshold reached, or the fingers
+stalled. A timeout remains as a fallback.
+"""
+import time
+
+
+class GripperFuture(object):
+    """
+    Pending gripper command.
+
+    done() polls the gripper once; result() polls until the command
+    completes or the timeout expires and returns the reason, one of
+    'position', 'object', 'force', 'stalled' or 'timeout'.
+
+    profiler: optional instrumentation.Profiler; the time result() spends
+              waiting is recorded as the 'gripper_wait' span
+    """
+    OPEN = 100.0
+    CLOSED = 0.0
+
+    def __init__(self, gripper, target, timeout=1.0, force_threshold=None,
+                 position_tolerance=2.0, poll_period=0.01,
+                 now=time.time, sleep=time.sleep, profiler=None):
+        self._gripper = gripper
+        self._target = target
+        self._timeout = timeout
+        self._force_threshold = force_threshold
+        self._position_tolerance = position_tolerance
+        self._poll_period = poll_period
+        self._now = now
+        self._sleep = sleep
+        self._profiler = profiler
+        self._start = now()
+        self._seen_moving = False
+        self._reason = None
+        self.elapsed = None
+
+    def _check(self):
+        gripper = self._gripper
+        moving = gripper.moving()
+        self._seen_moving = self._seen_moving or moving
+        if abs(gripper.position() - self._target) <= self._position_tolerance:
+            return 'position'
+        if self._target == self.CLOSED:
+            if gripper.gripping():
+                return 'object'
+            if (self._force_threshold is not None and
+                    gripper.force() >= self._force_threshold):
+                return 'force'
+        if self._seen_moving and not moving:
+            return 'stalled'
+        if self._now() - self._start >= self._timeout:
+            return 'timeout'
+        return None
+
+    def done(self):
+        if self._reason is None:
+            self._reason = self._check()
+            if self._reason is not None:
+                self.elapsed = self._now() - self._start
+        return self._reason is not None
+
+    def _wait(self):
+        while not self.done():
+            self._sleep(self._poll_period)
+
+    def result(self):
+        if self._profiler is not None and not self.done():
+            with self._profiler.span('gripper_wait'):
+                self._wait()
+        else:
+            self._wait()
+        return self._reason
+
+
+def open_gripper(gripper, **kwargs):
+    # Issue a non-blocking open and return its GripperFuture
+    gripper.open(block=False)
+    return GripperFuture(gripper, GripperFuture.OPEN, **kwargs)
+
+
+def close_gripper(gripper, **kwargs):
+    # Issue a non-blocking close and return its GripperFuture
+    gripper.close(block=False)
+    return GripperFuture(gripper, GripperFuture.CLOSED, **kwargs)
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+
+"""
+IK solution cache for the Baxter pick and place demo.
+
+Solutions are keyed on the quantized position and orientation of the
+requested pose. Exact hits skip the IK service entirely; near hits supply
+the cached joints as a user seed so the solver converges faster.
+
+The cache is safe to share between threads, e.g. the scheduler's planner
+inserting while a shutdown hook saves.
+"""
+import collections
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+
+def _pose_vector(pose, orientation_weight):
+    # Position in meters plus weighted quaternion, with the sign chosen so
+    # that q and -q (the same rotation) map to the same point.
+    q = pose.orientation
+    sign = -1.0 if q.w < 0 else 1.0
+    p = pose.position
+    return np.array([p.x, p.y, p.z,
+                     sign * orientation_weight * q.x,
+                     sign * orientation_weight * q.y,
+                     sign * orientation_weight * q.z,
+                     sign * orientation_weight * q.w], dtype=np.float64)
+
+
+# changes to the cache searched linearly before the KD-tree is rebuilt,
+# at least; the limit grows with a quarter of the cache size
+_REBUILD_MIN = 64
+
+
+class _KDTree(object):
+    """
+    Static KD-tree over the rows of points. Rows can be removed, which
+    only hides them from query(); the cache rebuilds the tree once enough
+    of it is out of date. Small enough for the few thousand poses a cell
+    uses; query() is a recursive nearest-neighbour search with pruning.
+    """
+    def __init__(self, points):
+        self._points = points
+        self._alive = np.ones(len(points), dtype=bool)
+        self.removed = 0
+        self._root = self._build(np.arange(len(points)), 0)
+
+    def remove(self, index):
+        if self._alive[index]:
+            self._alive[index] = False
+            self.removed += 1
+
+    def _build(self, indices, depth):
+        if len(indices) == 0:
+            return None
+        axis = depth % self._points.shape[1]
+        order = indices[np.argsort(self._points[indices, axis])]
+        mid = len(order) // 2
+        return (order[mid], axis,
+                self._build(order[:mid], depth + 1),
+                self._build(order[mid + 1:], depth + 1))
+
+    def query(self, point):
+        # Returns (distance, row index) of the nearest point, or (inf, None)
+        best = [np.inf, None]
+
+        def search(node):
+            if node is None:
+                return
+            index, axis, left, right = node
+            dist = float(np.linalg.norm(self._points[index] - point))
+            if dist < best[0] and self._alive[index]:
+                best[0], best[1] = dist, index
+            diff = point[axis] - self._points[index, axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            search(near)
+            if abs(diff) < best[0]:
+                search(far)
+
+        search(self._root)
+        return best[0], best[1]
+
+
+class IKCache(object):
+    """
+    LRU cache of IK solutions with nearest-neighbour seed lookup.
+
+    position_resolution: quantization step for positions, meters
+    orientation_resolution: quantization step for quaternion components
+    seed_radius: maximum pose-space distance for a near hit to be used as
+                 a seed (meters, with orientation scaled by
+                 orientation_weight)
+    """
+    def __init__(self, capacity=4096, position_resolution=0.001,
+                 orientation_resolution=0.001, seed_radius=0.05,
+                 orientation_weight=0.25, path=None):
+        self._capacity = capacity
+        self._position_resolution = position_resolution
+        self._orientation_resolution = orientation_resolution
+        self._seed_radius = seed_radius
+        self._orientation_weight = orientation_weight
+        self._path = path
+        # key -> (pose vector, joint dict), least recently used first
+        self._entries = collections.OrderedDict()
+        # KD-tree over the entries as of its last build, with its row
+        # keys and key -> row for the rows still current; entries inserted
+        # since are in _pending, key -> pose vector, and searched directly
+        self._tree = None
+        self._tree_keys = []
+        self._tree_rows = {}
+        self._pending = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _key(self, pose):
+        p = pose.position
+        q = pose.orientation
+        sign = -1 if q.w < 0 else 1
+        pos = self._position_resolution
+        rot = self._orientation_resolution
+        return (int(round(p.x / pos)), int(round(p.y / pos)), int(round(p.z / pos)),
+                int(round(sign * q.x / rot)), int(round(sign * q.y / rot)),
+                int(round(sign * q.z / rot)), int(round(sign * q.w / rot)))
+
+    def _touch(self, key):
+        # OrderedDict.move_to_end is not available on python 2
+        self._entries[key] = self._entries.pop(key)
+
+    def _rebuild(self):
+        self._tree_keys = list(self._entries.keys())
+        points = np.array([self._entries[k][0] for k in self._tree_keys])
+        self._tree = _KDTree(points)
+        self._tree_rows = dict((key, row) for row, key in enumerate(self._tree_keys))
+        self._pending.clear()
+
+    def _forget(self, key):
+        # key is leaving the entries, or about to be re-inserted
+        if key in self._pending:
+            del self._pending[key]
+        elif key in self._tree_rows:
+            self._tree.remove(self._tree_rows.pop(key))
+
+    def _nearest(self, vector):
+        if not self._entries:
+            return None
+        # rebuilding costs O(n log n), so it waits until a quarter of the
+        # tree is out of date; until then changes are searched linearly
+        if self._tree is None or (len(self._pending) + self._tree.removed >
+                                  max(_REBUILD_MIN, len(self._entries) // 4)):
+            self._rebuild()
+        dist, index = self._tree.query(vector)
+        key = None if index is None else self._tree_keys[index]
+        if self._pending:
+            keys = list(self._pending.keys())
+            dists = np.linalg.norm(np.array(list(self._pending.values())) - vector, axis=1)
+            best = int(np.argmin(dists))
+            if dists[best] < dist:
+                dist, key = float(dists[best]), keys[best]
+        if key is None or dist > self._seed_radius:
+            return None
+        return key
+
+    def lookup(self, pose):
+        """
+        Returns (joints, exact). exact is True for a cache hit, whose joints
+        are the solution; False with joints set for a near hit, whose
+        joints are only a seed; and (None, False) for a miss.
+        """
+        key = self._key(pose)
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._touch(key)
+                return dict(self._entries[key][1]), True
+            near = self._nearest(_pose_vector(pose, self._orientation_weight))
+            if near is not None:
+                self.near_hits += 1
+                self._touch(near)
+                return dict(self._entries[near][1]), False
+            self.misses += 1
+            return None, False
+
+    def insert(self, pose, joints):
+        key = self._key(pose)
+        vector = _pose_vector(pose, self._orientation_weight)
+        with self._lock:
+            if key in self._entries:
+                self._entries.pop(key)
+                self._forget(key)
+            self._entries[key] = (vector, dict(joints))
+            self._pending[key] = vector
+            while len(self._entries) > self._capacity:
+                evicted, _ = self._entries.popitem(last=False)
+                self._forget(evicted)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.near_hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'near_hits': self.near_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': float(self.hits) / lookups if lookups else 0.0,
+            }
+
+    def save(self, path=None):
+        # Atomically write the cache, least recently used first, so that a
+        # reload preserves the eviction order.
+        path = path or self._path
+        if not path:
+            return
+        with self._lock:
+            entries = [[list(key), vector.tolist(), dict(joints)]
+                       for key, (vector, joints) in self._entries.items()]
+        data = {
+            'position_resolution': self._position_resolution,
+            'orientation_resolution': self._orientation_resolution,
+            'orientation_weight': self._orientation_weight,
+            'entries': entries,
+        }
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as cache_file:
+            json.dump(data, cache_file)
+        os.rename(tmp_path, path)
+
+    def load(self, path=None):
+        # Entries saved with a different quantization are discarded.
+        path = path or self._path
+        if not path or not os.path.exists(path):
+            return 0
+        with open(path, 'r') as cache_file:
+            data = json.load(cache_file)
+        if (data.get('position_resolution') != self._position_resolution or
+                data.get('orientation_resolution') != self._orientation_resolution or
+                data.get('orientation_weight') != self._orientation_weight):
+            return 0
+        with self._lock:
+            for key, vector, joints in data['entries']:
+                self._entries[tuple(key)] = (np.array(vector, dtype=np.float64), joints)
+            while len(self._entries) > self._capacity:
+                self._entries.popitem(last=False)
+            self._tree = None
+            self._tree_rows = {}
+            self._pending.clear()
+            return len(self._entries)
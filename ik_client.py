@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+
+"""
+IK service client layer for the pick and place demo.
+
+PersistentServiceClient keeps one persistent connection to a
+SolvePositionIK service and reconnects transparently after a failure.
+IKSolverPool spreads requests over several solver endpoints (IK nodes,
+or an in-process LocalIKService), dispatching each request to the
+endpoint with the fewest outstanding requests, and keeps per-endpoint
+latency statistics. Both are called like the plain service proxy.
+"""
+import copy
+import threading
+
+import rospy
+
+import instrumentation
+from instrumentation import monotonic
+
+
+class PersistentServiceClient(object):
+    """
+    Callable holding a persistent ServiceProxy. A call that fails on the
+    connection is retried once on a fresh connection before the error is
+    raised.
+
+    timeout: seconds to wait for the service when (re)connecting
+    """
+    def __init__(self, service, service_class, timeout=5.0,
+                 service_proxy=None, wait_for_service=None):
+        self.service = service
+        self._service_class = service_class
+        self._timeout = timeout
+        self._service_proxy = service_proxy or rospy.ServiceProxy
+        self._wait_for_service = wait_for_service or rospy.wait_for_service
+        self._proxy = None
+        self.reconnects = 0
+
+    def wait(self, timeout=None):
+        self._wait_for_service(self.service,
+                               self._timeout if timeout is None else timeout)
+
+    def _connect(self):
+        if self._proxy is None:
+            self.wait()
+            self._proxy = self._service_proxy(self.service, self._service_class,
+                                              persistent=True)
+            self.reconnects += 1
+        return self._proxy
+
+    def close(self):
+        proxy, self._proxy = self._proxy, None
+        if proxy is not None and hasattr(proxy, 'close'):
+            proxy.close()
+
+    def __call__(self, request):
+        for attempt in range(2):
+            try:
+                return self._connect()(request)
+            except (rospy.ServiceException, rospy.ROSException):
+                # the persistent connection may have gone stale
+                self.close()
+                if attempt:
+                    raise
+
+
+class _Endpoint(object):
+    # One solver of the pool with its dispatch and latency state. A solver
+    # connection serves one request at a time; further callers queue on
+    # the endpoint's lock and count as outstanding.
+    def __init__(self, name, solver):
+        self.name = name
+        self.solver = solver
+        self.lock = threading.Lock()
+        self.latency = instrumentation.Histogram()
+        self.outstanding = 0
+        self.calls = 0
+        self.poses = 0
+        self.failures = 0
+        self.down_until = 0.0
+
+
+class IKSolverPool(object):
+    """
+    Least-outstanding-requests dispatch over several IK solvers.
+
+    solvers: list of callables taking a SolvePositionIKRequest, e.g.
+             PersistentServiceClients, or (name, solver) pairs
+    fallback: solver used only when every endpoint has failed, e.g. a
+              baxter_kinematics.LocalIKService
+    retry_after: seconds a failed endpoint is skipped before it is tried
+                 again
+    split_size: requests with more poses than this are split into chunks
+                solved concurrently on idle endpoints; None never splits
+    """
+    def __init__(self, solvers, fallback=None, retry_after=5.0, split_size=None,
+                 clock=monotonic):
+        self._endpoints = [self._endpoint(solver) for solver in solvers]
+        self._fallback = self._endpoint(('fallback', fallback)) if fallback else None
+        self._retry_after = retry_after
+        self._split_size = split_size
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _endpoint(solver):
+        if isinstance(solver, tuple):
+            return _Endpoint(*solver)
+        return _Endpoint(getattr(solver, 'service', type(solver).__name__), solver)
+
+    @classmethod
+    def for_services(cls, services, service_class, fallback=None, timeout=5.0,
+                     **options):
+        """Pool of persistent clients, one per service name."""
+        return cls([PersistentServiceClient(service, service_class, timeout)
+                    for service in services], fallback, **options)
+
+    def wait(self, timeout=5.0):
+        """
+        Wait for the service endpoints. Endpoints that do not come up are
+        skipped for now; raises only if no endpoint nor fallback is left.
+        """
+        available = 0
+        for endpoint in self._endpoints:
+            try:
+                if hasattr(endpoint.solver, 'wait'):
+                    endpoint.solver.wait(timeout)
+                available += 1
+            except rospy.ROSException as e:
+                rospy.logwarn("IK endpoint {0} unavailable: {1}".format(endpoint.name, e))
+                self._mark_down(endpoint)
+        if not available and self._fallback is None:
+            raise rospy.ROSException("No IK solver endpoint available")
+        return available
+
+    @property
+    def calls(self):
+        return sum(endpoint.calls for endpoint in self._all_endpoints())
+
+    def _all_endpoints(self):
+        return self._endpoints + ([self._fallback] if self._fallback else [])
+
+    def _mark_down(self, endpoint):
+        with self._lock:
+            endpoint.failures += 1
+            endpoint.down_until = self._clock() + self._retry_after
+
+    def _acquire(self, exclude):
+        # Reserve the healthy endpoint with the fewest outstanding requests,
+        # mean latency breaking ties; endpoints that are down only if
+        # nothing else is left
+        with self._lock:
+            now = self._clock()
+            candidates = [e for e in self._endpoints if e not in exclude]
+            healthy = [e for e in candidates if e.down_until <= now]
+            if not (healthy or candidates):
+                return None
+            endpoint = min(healthy or candidates, key=lambda e: (
+                e.outstanding, e.latency.total / e.latency.count if e.latency.count else 0.0))
+            endpoint.outstanding += 1
+            return endpoint
+
+    def _call(self, endpoint, request):
+        try:
+            with endpoint.lock:
+                start = self._clock()
+                response = endpoint.solver(request)
+                elapsed = self._clock() - start
+        except (rospy.ServiceException, rospy.ROSException):
+            self._mark_down(endpoint)
+            raise
+        finally:
+            with self._lock:
+                endpoint.outstanding -= 1
+        with self._lock:
+            endpoint.calls += 1
+            endpoint.poses += len(request.pose_stamp)
+            endpoint.latency.add(elapsed)
+            endpoint.down_until = 0.0
+        return response
+
+    def _solve(self, request):
+        # Try endpoints in dispatch order until one answers, then the
+        # fallback; the last error is raised if they all fail
+        tried = []
+        error = None
+        while True:
+            endpoint = self._acquire(tried)
+            if endpoint is None:
+                break
+            tried.append(endpoint)
+            try:
+                return self._call(endpoint, request)
+            except (rospy.ServiceException, rospy.ROSException) as e:
+                rospy.logwarn("IK endpoint {0} failed: {1}".format(endpoint.name, e))
+                error = e
+        if self._fallback is not None:
+            with self._lock:
+                self._fallback.outstanding += 1
+            return self._call(self._fallback, request)
+        raise error or rospy.ServiceException("No IK solver endpoint available")
+
+    def __call__(self, request):
+        n = len(request.pose_stamp)
+        if self._split_size is None or n <= self._split_size or len(self._endpoints) < 2:
+            return self._solve(request)
+        return self._solve_split(request)
+
+    def _solve_split(self, request):
+        # Solve chunks of the request concurrently and merge the responses
+        # back in pose order
+        size = self._split_size
+        seeded = len(request.seed_angles) == len(request.pose_stamp)
+        chunks = []
+        for start in range(0, len(request.pose_stamp), size):
+            chunk = copy.copy(request)
+            chunk.pose_stamp = request.pose_stamp[start:start + size]
+            chunk.seed_angles = request.seed_angles[start:start + size] if seeded \
+                else request.seed_angles
+            chunks.append(chunk)
+        responses = [None] * len(chunks)
+        errors = []
+
+        def solve(index):
+            try:
+                responses[index] = self._solve(chunks[index])
+            except (rospy.ServiceException, rospy.ROSException) as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=solve, args=(i,)) for i in range(1, len(chunks))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        solve(0)
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        merged = copy.copy(responses[0])
+        merged.joints = [joints for response in responses for joints in response.joints]
+        merged.result_type = type(responses[0].result_type)().join(
+            response.result_type for response in responses)
+        return merged
+
+    def stats(self):
+        """Per-endpoint latency summary with call, pose and failure counts."""
+        with self._lock:
+            stats = {}
+            for endpoint in self._all_endpoints():
+                summary = endpoint.latency.summary()
+                summary.update(calls=endpoint.calls, poses=endpoint.poses,
+                               failures=endpoint.failures,
+                               outstanding=endpoint.outstanding)
+                stats[endpoint.name] = summary
+            return stats
+
+    def report(self):
+        lines = ["{0:<48}{1:>7}{2:>7}{3:>6}{4:>9}{5:>9}".format(
+            'endpoint', 'calls', 'poses', 'fail', 'p50', 'p95')]
+        for name, s in sorted(self.stats().items()):
+            lines.append("{0:<48}{1:>7}{2:>7}{3:>6}{4:>8.3f}s{5:>8.3f}s".format(
+                name, s['calls'], s['poses'], s['failures'], s['p50'], s['p95']))
+        return '\n'.join(lines)
+
+    def close(self):
+        for endpoint in self._all_endpoints():
+            if hasattr(endpoint.solver, 'close'):
+                endpoint.solver.close()
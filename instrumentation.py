@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+
+"""
+Per-phase latency instrumentation for the pick and place demo.
+
+Spans are timed with a monotonic clock and aggregated into log-bucketed
+histograms, so memory stays bounded however long the run. Each span can
+also be appended to a JSONL or CSV trace, buffered to keep the overhead
+off the control path. StartupTimeline times the steps of process startup
+against wall time.
+"""
+import csv
+import functools
+import json
+import math
+import threading
+import time
+
+# Clock for measuring intervals; time.monotonic is not available on
+# python 2
+monotonic = getattr(time, 'monotonic', time.time)
+
+
+class Histogram(object):
+    """
+    Log-bucketed latency histogram. Buckets grow by a factor of
+    1 + resolution from min_value seconds, so percentiles are accurate to
+    about resolution relative error.
+    """
+    def __init__(self, min_value=1e-6, resolution=0.02):
+        self._min_value = min_value
+        self._log_base = math.log1p(resolution)
+        self._buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.min = float('inf')
+
+    def add(self, value):
+        index = 0
+        if value > self._min_value:
+            index = int(math.log(value / self._min_value) / self._log_base) + 1
+        self._buckets[index] = self._buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.min = min(self.min, value)
+
+    def _bucket_value(self, index):
+        if index == 0:
+            return self._min_value
+        # geometric midpoint of the bucket
+        return self._min_value * math.exp((index - 0.5) * self._log_base)
+
+    def percentile(self, p):
+        if not self.count:
+            return 0.0
+        rank = p / 100.0 * self.count
+        seen = 0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if seen >= rank:
+                return min(max(self._bucket_value(index), self.min), self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else 0.0,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': self.max,
+        }
+
+
+class _Span(object):
+    def __init__(self, profiler, name):
+        self._profiler = profiler
+        self._name = name
+
+    def __enter__(self):
+        self._start = self._profiler.clock()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._profiler.record(self._name, self._start,
+                              self._profiler.clock() - self._start)
+        return False
+
+
+class Profiler(object):
+    """
+    Collects named spans.
+
+    trace_path: optional .jsonl or .csv file receiving every span
+    flush_every: number of spans buffered before the trace is written
+    """
+    def __init__(self, trace_path=None, flush_every=256, clock=monotonic):
+        self.clock = clock
+        self._histograms = {}
+        self._trace_path = trace_path
+        self._flush_every = flush_every
+        self._pending = []
+        self._trace_file = None
+        self._trace_started = False
+        self._csv = None
+        self._started = clock()
+        # spans arrive from the planner and motion threads alike
+        self._lock = threading.Lock()
+
+    def span(self, name):
+        return _Span(self, name)
+
+    def record(self, name, start, duration):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.add(duration)
+            if self._trace_path:
+                self._pending.append((name, start - self._started, duration))
+                if len(self._pending) >= self._flush_every:
+                    self._write_pending()
+
+    def flush(self):
+        with self._lock:
+            self._write_pending()
+
+    def _write_pending(self):
+        if not self._pending:
+            return
+        if self._trace_file is None:
+            # truncate on first write only, so close() mid-run is safe
+            self._trace_file = open(self._trace_path, 'a' if self._trace_started else 'w')
+            if self._trace_path.endswith('.csv'):
+                self._csv = csv.writer(self._trace_file)
+                if not self._trace_started:
+                    self._csv.writerow(['phase', 'start', 'duration'])
+            self._trace_started = True
+        for name, start, duration in self._pending:
+            if self._csv is not None:
+                self._csv.writerow([name, '%.6f' % start, '%.6f' % duration])
+            else:
+                self._trace_file.write(json.dumps(
+                    {'phase': name, 'start': start, 'duration': duration}) + '\n')
+        self._trace_file.flush()
+        self._pending = []
+
+    def close(self):
+        self.flush()
+        if self._trace_file is not None:
+            self._trace_file.close()
+            self._trace_file = None
+            self._csv = None
+
+    def summary(self):
+        return dict((name, histogram.summary())
+                    for name, histogram in self._histograms.items())
+
+    def report(self):
+        # Plain-text table of the phases, largest total time first
+        wall = self.clock() - self._started
+        lines = ["{0:<24}{1:>7}{2:>10}{3:>9}{4:>9}{5:>9}{6:>9}{7:>7}".format(
+            'phase', 'count', 'total', 'mean', 'p50', 'p95', 'p99', '%wall')]
+        rows = sorted(self.summary().items(), key=lambda item: -item[1]['total'])
+        for name, s in rows:
+            lines.append(
+                "{0:<24}{1:>7}{2:>9.3f}s{3:>8.3f}s{4:>8.3f}s{5:>8.3f}s{6:>8.3f}s{7:>6.1f}%".format(
+                    name, s['count'], s['total'], s['mean'], s['p50'], s['p95'],
+                    s['p99'], 100.0 * s['total'] / wall if wall > 0 else 0.0))
+        lines.append("wall time {0:.3f}s".format(wall))
+        return '\n'.join(lines)
+
+
+class StartupTimeline(object):
+    """
+    Wall-clock timeline of process startup. Steps are timed from origin,
+    the time.time() the process started at, and may overlap when run
+    concurrently.
+    """
+    def __init__(self, origin=None, clock=time.time):
+        self.clock = clock
+        self.origin = clock() if origin is None else origin
+        self.steps = []
+        self._lock = threading.Lock()
+
+    def span(self, name):
+        return _Span(self, name)
+
+    def record(self, name, start, duration):
+        with self._lock:
+            self.steps.append((name, start - self.origin, duration))
+
+    def run_concurrently(self, tasks):
+        """
+        Run each (name, callable) of tasks on its own thread, timed as a
+        step, and return their results in order. The first error raised
+        is re-raised once every task has finished.
+        """
+        tasks = list(tasks)
+        results = [None] * len(tasks)
+        errors = []
+
+        def run(index):
+            name, task = tasks[index]
+            try:
+                with self.span(name):
+                    results[index] = task()
+            except Exception as e:
+                errors.append((index, e))
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(1, len(tasks))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        if tasks:
+            run(0)
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise min(errors, key=lambda error: error[0])[1]
+        return results
+
+    def ready(self):
+        # seconds from origin until the last step ended
+        with self._lock:
+            return max([start + duration for _, start, duration in self.steps] or [0.0])
+
+    def report(self):
+        lines = ["{0:<24}{1:>9}{2:>9}{3:>10}".format('step', 'start', 'end', 'duration')]
+        with self._lock:
+            steps = sorted(self.steps, key=lambda step: step[1])
+        for name, start, duration in steps:
+            lines.append("{0:<24}{1:>8.3f}s{2:>8.3f}s{3:>9.3f}s".format(
+                name, start, start + duration, duration))
+        lines.append("ready after {0:.3f}s".format(self.ready()))
+        return '\n'.join(lines)
+
+
+def timed(name):
+    """
+    Method decorator recording a span on self._profiler, if it is set.
+    With no profiler the method is called directly.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            profiler = self._profiler
+            if profiler is None:
+                return method(self, *args, **kwargs)
+            with profiler.span(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
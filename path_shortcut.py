@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+"""
+Joint-space path simplification for taught waypoint sequences.
+
+Drops waypoints as long as the path the arm actually plays back through
+the rest, trajectory.time_optimal's spline, stays within a tolerance of
+the path through all of them. Fewer knots give the spline fewer wiggles
+to slow down for; PickAndPlace.execute_trajectory simplifies with it.
+"""
+import argparse
+import sys
+
+import numpy as np
+
+from baxter_kinematics import JOINT_LIMITS
+import trajectory
+from waypoints import WaypointLibrary
+
+
+def _polyline_distance(points, polyline):
+    # Distance from each row of points (M, J) to the polyline (K, J)
+    a, b = polyline[:-1], polyline[1:]
+    ab = b - a
+    length2 = np.maximum(np.einsum('kj,kj->k', ab, ab), 1e-300)
+    ap = points[:, np.newaxis, :] - a[np.newaxis, :, :]
+    t = np.clip(np.einsum('mkj,kj->mk', ap, ab) / length2, 0.0, 1.0)
+    closest = a[np.newaxis] + t[..., np.newaxis] * ab[np.newaxis]
+    return np.linalg.norm(points[:, np.newaxis, :] - closest, axis=2).min(axis=1)
+
+
+def _deviation(executed, reference):
+    # Largest distance between two densely sampled paths, either way
+    return max(_polyline_distance(executed, reference).max(),
+               _polyline_distance(reference, executed).max())
+
+
+def _segment_ok(path, reference, window, i, j, tolerance, samples):
+    # Whether the spline through path[window], which skips from i to j,
+    # stays within tolerance of the reference samples between i and j
+    dense = trajectory.sample_path(path[window], (j - i) * (samples - 1) + 1)
+    executed = dense[window.index(i)]
+    return _deviation(executed, reference[i:j].reshape(-1, path.shape[1])) <= tolerance
+
+
+def _stray_segments(path, reference, keep, stop_at, tolerance, samples, max_span):
+    # Indices k of the segments keep[k]-keep[k + 1] of the spline through
+    # the kept waypoints, played back with the same stops, that stray
+    # more than tolerance from the reference
+    stops = [k for k, index in enumerate(keep) if index in stop_at]
+    executed = trajectory.sample_path(path[keep], max_span * (samples - 1) + 1, stops)
+    return [k for k in range(len(keep) - 1)
+            if _deviation(executed[k], reference[keep[k]:keep[k + 1]].reshape(
+                -1, path.shape[1])) > tolerance]
+
+
+def simplify_path(path, tolerance, joint_limits=JOINT_LIMITS, samples=4,
+                  max_span=8, stop_at=()):
+    """
+    Indices of the waypoints of path (N, J) to keep.
+
+    Greedily skips up to max_span - 1 waypoints at a time while a local
+    spline stays within tolerance (radians, Euclidean) of the played-back
+    path through all waypoints, sampled samples times per segment. The
+    spline through the kept waypoints is then checked as a whole and
+    waypoints are put back where it strays, so the result holds for the
+    trajectory time_optimal builds with the same stop_at. The ends, the
+    indices in stop_at and the waypoints where the arm stops to turn back
+    are always kept. Runs in time linear in N.
+    """
+    path = np.asarray(path, dtype=np.float64)
+    if joint_limits is not None:
+        outside = (path < joint_limits[:, 0]) | (path > joint_limits[:, 1])
+        if outside.any():
+            row, col = np.argwhere(outside)[0]
+            raise ValueError("Waypoint {0} joint {1} is outside the joint limits".format(
+                row, col))
+    n = len(path)
+    if n <= 2:
+        return np.arange(n)
+    stop_at = set(i for i in stop_at if 0 < i < n - 1)
+    reference = trajectory.sample_path(path, samples, sorted(stop_at))
+    anchors = set(stop_at)
+    for rows in trajectory.path_pieces(path, stop_at):
+        anchors.update((int(rows[0]), int(rows[-1])))
+    keep = [0]
+    i = 0
+    while i < n - 1:
+        # the local spline runs from the previous kept waypoint to the one
+        # after the next, without crossing a stop
+        before = keep[-2:-1] if i not in anchors else []
+        j = i + 1
+        while j < n - 1 and j - i < max_span and j not in anchors:
+            after = [j + 2] if j + 1 not in anchors else []
+            if not _segment_ok(path, reference, before + [i, j + 1] + after,
+                               i, j + 1, tolerance, samples):
+                break
+            j += 1
+        keep.append(j)
+        i = j
+    # local splines only approximate the whole one, so check that and put
+    # back the middle waypoint of each segment that strays, or of the
+    # nearest segment that still skips any
+    while True:
+        added = set()
+        for k in _stray_segments(path, reference, keep, stop_at, tolerance,
+                                 samples, max_span):
+            for d in range(len(keep)):
+                spans = [c for c in (k - d, k + d)
+                         if 0 <= c < len(keep) - 1 and keep[c + 1] - keep[c] > 1]
+                if spans:
+                    added.add((keep[spans[0]] + keep[spans[0] + 1]) // 2)
+                    break
+        if not added:
+            return np.array(keep)
+        keep = sorted(set(keep) | added)
+
+
+def main():
+    """Simplify a waypoint library file (.wpt or .npy) offline."""
+    arg_fmt = argparse.RawDescriptionHelpFormatter
+    parser = argparse.ArgumentParser(formatter_class=arg_fmt,
+                                     description=main.__doc__)
+    parser.add_argument('input', help="waypoint library to simplify")
+    parser.add_argument('output', help="where to write the simplified library")
+    parser.add_argument('-l', '--limb', default=None,
+                        help="limb of the library (required for .npy)")
+    parser.add_argument('-t', '--tolerance', type=float, default=0.01,
+                        help="maximum deviation from the original path (rad)")
+    args = parser.parse_args()
+    library = WaypointLibrary.load(args.input, args.limb)
+    keep = simplify_path(library.positions, args.tolerance)
+    WaypointLibrary(library.limb, np.ascontiguousarray(library.positions[keep])).save(args.output)
+    print("Kept {0} of {1} waypoints: {2}".format(len(keep), len(library), keep.tolist()))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,771 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2013-2015, Rethink Robotics
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the Rethink Robotics nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Baxter RSDK Inverse Kinematics Pick and Place Demo
+
+The robot side of the demo; ik_pick_and_place_demo.py is the command
+line entry point.
+"""
+import os
+import struct
+import sys
+import time
+import copy
+import math
+
+import rospy
+
+from geometry_msgs.msg import (
+    PoseStamped,
+    Pose,
+    Point,
+    Quaternion,
+)
+from std_msgs.msg import (
+    Header,
+    Empty,
+)
+from sensor_msgs.msg import JointState
+
+from baxter_core_msgs.srv import (
+    SolvePositionIK,
+    SolvePositionIKRequest,
+)
+
+import baxter_interface
+
+import baxter_kinematics
+import block_perception
+import gazebo_scene
+import gripper_control
+import ik_cache
+import ik_client
+import instrumentation
+import path_shortcut
+import pick_place_scheduler
+import pick_sequencing
+import reachability
+import task_journal
+import trajectory
+import waypoints
+
+# SolvePositionIK service of the robot's IK node for a limb
+IK_SERVICE = "ExternalTools/{0}/PositionKinematicsNode/IKService"
+
+# Largest distance (m) between pose and the local forward kinematics of the
+# IK service's solution for it before a Cartesian line is distrusted
+LINE_TOLERANCE = 0.005
+
+# Largest joint-space deviation (rad) from the taught tour the streamed
+# tour may take when it drops waypoints
+TOUR_TOLERANCE = 0.02
+
+#Pick and Place Class Use is to move the robot 
+
+class PickAndPlace(object):
+    def __init__(self, limb, hover_distance = 0.15, verbose=True, ik_cache=None,
+                 ik_backend='service', gripper_timeout=1.0,
+                 gripper_force_threshold=None, gripper_lead_time=0.0,
+                 profiler=None, reachability=None, ik_services=None,
+                 ik_fallback=False, cartesian_step=0.01, wait_ready=True,
+                 speed_scale=0.5, accel_scale=0.5):
+        self._limb_name = limb # string
+        self._hover_distance = hover_distance # in meters
+        self._verbose = verbose # bool
+        self._ik_cache = ik_cache # ik_cache.IKCache or None
+        # gripper commands complete on state feedback, with the timeout
+        # (seconds) as a fallback
+        self._gripper_options = dict(timeout=gripper_timeout,
+                                     force_threshold=gripper_force_threshold)
+        # seconds before the end of the final servo to start actuating
+        self._gripper_lead_time = gripper_lead_time
+        # fractions of the joint velocity and acceleration limits streamed
+        # trajectories run at; the acceleration limits are an assumption,
+        # so neither defaults to the full limit
+        self._max_vel = speed_scale * baxter_kinematics.VELOCITY_LIMITS
+        self._max_acc = accel_scale * baxter_kinematics.ACCELERATION_LIMITS
+        # instrumentation.Profiler timing each phase, or None
+        self._profiler = profiler
+        # reachability.ReachabilityMap seeding IK, or None
+        self._reachability = reachability
+        self._limb = baxter_interface.Limb(limb)
+        self._gripper = baxter_interface.Gripper(limb)
+        # 'service' solves on the robot's IK node, 'local' in-process
+        if ik_backend == 'local':
+            self._kinematics = baxter_kinematics.BaxterKinematics(limb)
+            self._iksvc = baxter_kinematics.LocalIKService(limb, self._kinematics)
+        else:
+            self._kinematics = None
+            # persistent connections to one or more IK nodes, optionally
+            # falling back to solving in-process when none answers
+            ns = IK_SERVICE.format(limb)
+            fallback = None
+            if ik_fallback:
+                self._kinematics = baxter_kinematics.BaxterKinematics(limb)
+                fallback = baxter_kinematics.LocalIKService(limb, self._kinematics)
+            self._iksvc = ik_client.IKSolverPool.for_services(
+                ik_services or [ns], SolvePositionIK, fallback, clock=rospy.get_time)
+        # descents and lifts follow a straight vertical line, one pose every
+        # cartesian_step meters tracked with local IK; None moves in joint
+        # space to a single IK solution instead
+        self._cartesian_step = cartesian_step
+        # with the service backend the local model is unvalidated, so each
+        # line is checked against the robot's own solution for its target
+        self._check_lines = ik_backend != 'local'
+        if cartesian_step and self._kinematics is None:
+            self._kinematics = baxter_kinematics.BaxterKinematics(limb)
+        # last joint angles commanded, and the wall time of the first
+        # motion command, for the task journal and restart timing
+        self.last_command = None
+        self.first_motion_time = None
+        # without wait_ready the caller runs wait_for_ik and enable_robot,
+        # e.g. overlapped with the rest of startup
+        if wait_ready:
+            self.wait_for_ik()
+            self.enable_robot()
+
+    def wait_for_ik(self, timeout=5.0):
+        # the in-process solver is always ready
+        if hasattr(self._iksvc, 'wait'):
+            self._iksvc.wait(timeout)
+
+    def enable_robot(self):
+        # verify robot is enabled
+        print("Getting robot state... ")
+        self._rs = baxter_interface.RobotEnable(baxter_interface.CHECK_VERSION)
+        self._init_state = self._rs.state().enabled
+        # a warm restart finds the robot still enabled
+        if not self._init_state:
+            print("Enabling robot... ")
+            self._rs.enable()
+
+    def move_to_start(self, start_angles=None):
+        print("Moving the {0} arm to start pose...".format(self._limb_name))
+        if not start_angles:
+            start_angles = dict(zip(self._joint_names, [0]*7))
+        self._guarded_move_to_joint_position(start_angles)
+        self.gripper_open()
+        print("Running. Ctrl-c to quit")
+
+    def ik_request(self, pose):
+        return self.ik_request_batch([pose])[0]
+
+    @instrumentation.timed('ik_request')
+    def ik_request_batch(self, poses):
+        # Solve every pose in a single SolvePositionIK round-trip.
+        # Returns one entry per pose, in order: a Limb API-compatible joint
+        # dictionary, or False if no valid solution was found.
+        # With an IK cache, exact hits skip the service and near hits are
+        # sent as user seeds. With a reachability map, poses well outside
+        # the reachable envelope are rejected without a request, and the
+        # other poses in reachable voxels are seeded from it.
+        solutions = [None] * len(poses)
+        seeds = [None] * len(poses)
+        if self._ik_cache is not None:
+            for i, pose in enumerate(poses):
+                joints, exact = self._ik_cache.lookup(pose)
+                if exact:
+                    solutions[i] = joints
+                else:
+                    seeds[i] = joints
+        if self._reachability is not None:
+            for i, pose in enumerate(poses):
+                if solutions[i] is not None or seeds[i] is not None:
+                    continue
+                if self._reachability.is_unreachable(pose):
+                    solutions[i] = False
+                else:
+                    seeds[i] = self._reachability.seed_for(pose)
+        pending = [i for i, joints in enumerate(solutions) if joints is None]
+        if pending:
+            solved = self._solve_ik([poses[i] for i in pending],
+                                    [seeds[i] for i in pending])
+            for i, joints in zip(pending, solved):
+                solutions[i] = joints
+                if joints and self._ik_cache is not None:
+                    self._ik_cache.insert(poses[i], joints)
+        return solutions
+
+    @instrumentation.timed('ik_service')
+    def _solve_ik(self, poses, seeds):
+        hdr = Header(stamp=rospy.Time.now(), frame_id='base')
+        ikreq = SolvePositionIKRequest()
+        for pose in poses:
+            ikreq.pose_stamp.append(PoseStamped(header=hdr, pose=pose))
+        if any(seeds):
+            # seeds are per pose; poses without a cached neighbour are
+            # seeded from the current joint angles
+            current = self._limb.joint_angles()
+            for seed in seeds:
+                seed = seed or current
+                ikreq.seed_angles.append(JointState(
+                    header=hdr, name=list(seed.keys()), position=list(seed.values())))
+            ikreq.seed_mode = ikreq.SEED_AUTO
+        try:
+            resp = self._iksvc(ikreq)
+        except (rospy.ServiceException, rospy.ROSException) as e:
+            rospy.logerr("Service call failed: %s" % (e,))
+            return [False] * len(poses)
+        # Check if result valid, and type of seed ultimately used to get solution
+        # convert rospy's string representation of uint8[]'s to int's
+        resp_seeds = struct.unpack('<%dB' % len(resp.result_type), resp.result_type)
+        solutions = []
+        for seed, joints in zip(resp_seeds, resp.joints):
+            if (seed != resp.RESULT_INVALID):
+                seed_str = {
+                            ikreq.SEED_USER: 'User Provided Seed',
+                            ikreq.SEED_CURRENT: 'Current Joint Angles',
+                            ikreq.SEED_NS_MAP: 'Nullspace Setpoints',
+                           }.get(seed, 'None')
+                if self._verbose:
+                    print("IK Solution SUCCESS - Valid Joint Solution Found from Seed Type: {0}".format(
+                             (seed_str)))
+                # Format solution into Limb API-compatible dictionary
+                limb_joints = dict(zip(joints.name, joints.position))
+                if self._verbose:
+                    print("IK Joint Solution:\n{0}".format(limb_joints))
+                    print("------------------")
+                solutions.append(limb_joints)
+            else:
+                rospy.logerr("INVALID POSE - No Valid Joint Solution Found.")
+                solutions.append(False)
+        # a short response counts as failure for the missing poses
+        solutions.extend([False] * (len(poses) - len(solutions)))
+        return solutions
+
+    def _commanded(self, joint_angles):
+        if self.first_motion_time is None:
+            self.first_motion_time = time.time()
+        self.last_command = dict(joint_angles)
+
+    @instrumentation.timed('move_to_joint_positions')
+    def _guarded_move_to_joint_position(self, joint_angles):
+        if joint_angles:
+            self._commanded(joint_angles)
+            self._limb.move_to_joint_positions(joint_angles)
+        else:
+            rospy.logerr("No Joint Angles provided for move_to_joint_positions. Staying put.")
+
+    @instrumentation.timed('execute_trajectory')
+    def execute_trajectory(self, waypoints, max_vel=None, max_acc=None,
+                           rate=100.0, events=(), tolerance=None):
+        # Time-parameterize the whole waypoint sequence from the current
+        # joint angles and stream interpolated setpoints at a fixed rate,
+        # moving through the intermediate waypoints instead of stopping at
+        # each one, as fast as the per-joint limits allow.
+        # max_vel/max_acc in rad/s and rad/s^2, per joint or scalar; by
+        # default the limits scaled by speed_scale and accel_scale.
+        # events: (seconds_before_end, callable) pairs fired during playback
+        # waypoints: joint dicts or rows of a waypoints.WaypointLibrary
+        # tolerance: drop waypoints while the played-back path stays within
+        # this many radians of the one through all of them
+        waypoints = [w for w in waypoints if w is not None and len(w)]
+        if not waypoints:
+            rospy.logerr("No waypoints provided for execute_trajectory. Staying put.")
+            return False
+        joint_names = self._limb.joint_names()
+        waypoints = [self._limb.joint_angles()] + waypoints
+        if tolerance:
+            positions = trajectory.waypoints_to_array(waypoints, joint_names)
+            waypoints = positions[path_shortcut.simplify_path(
+                positions, tolerance, joint_limits=None)]
+        traj = trajectory.time_optimal(
+            waypoints, joint_names,
+            self._max_vel if max_vel is None else max_vel,
+            self._max_acc if max_acc is None else max_acc)
+        if self._verbose:
+            print("Streaming {0} waypoints over {1:.2f}s".format(
+                len(waypoints) - 1, traj.duration))
+        self._commanded(traj.joint_dict(traj.duration))
+        control_rate = rospy.Rate(rate)
+        completed = trajectory.stream_trajectory(
+            traj,
+            lambda setpoint: self._limb.set_joint_positions(setpoint, raw=True),
+            rate,
+            now=rospy.get_time,
+            sleep=lambda _: control_rate.sleep(),
+            is_shutdown=rospy.is_shutdown,
+            events=events)
+        if completed:
+            # settle on the final waypoint with the limb's own controller
+            self._guarded_move_to_joint_position(traj.joint_dict(traj.duration))
+        return completed
+
+    @instrumentation.timed('gripper_open')
+    def gripper_open(self, block=True):
+        future = gripper_control.open_gripper(
+            self._gripper, now=rospy.get_time, sleep=rospy.sleep,
+            profiler=self._profiler, **self._gripper_options)
+        if block:
+            future.result()
+        return future
+
+    @instrumentation.timed('gripper_close')
+    def gripper_close(self, block=True):
+        future = gripper_control.close_gripper(
+            self._gripper, now=rospy.get_time, sleep=rospy.sleep,
+            profiler=self._profiler, **self._gripper_options)
+        if block:
+            future.result()
+        return future
+
+    def _hover_pose(self, pose):
+        # a pose the hover-distance above the requested pose
+        hover = copy.deepcopy(pose)
+        hover.position.z = hover.position.z + self._hover_distance
+        return hover
+
+    @instrumentation.timed('approach')
+    def _approach(self, pose, joint_angles=None):
+        # approach with a pose the hover-distance above the requested pose
+        if joint_angles is None:
+            joint_angles = self.ik_request(self._hover_pose(pose))
+        self._guarded_move_to_joint_position(joint_angles)
+
+    @instrumentation.timed('cartesian_line')
+    def _cartesian_line(self, start_angles, pose, check_angles=None):
+        # Joint angles down the straight line from the hover pose reached
+        # by start_angles to pose, each solved from the previous one with a
+        # local Jacobian step. Returns a list of joint dicts ending at pose,
+        # or False if the line cannot be tracked, or if the local forward
+        # kinematics of check_angles, the IK service's solution for pose,
+        # miss pose by more than LINE_TOLERANCE.
+        position = (pose.position.x, pose.position.y, pose.position.z)
+        q, ok = self._kinematics.straight_line(
+            self._kinematics.to_array(start_angles),
+            (position[0], position[1], position[2] + self._hover_distance),
+            position,
+            (pose.orientation.x, pose.orientation.y, pose.orientation.z,
+             pose.orientation.w),
+            self._cartesian_step)
+        if not ok.all():
+            rospy.logwarn("Cartesian line not trackable, moving in joint space.")
+            return False
+        if check_angles:
+            reached, _ = self._kinematics.forward(
+                self._kinematics.to_array(check_angles))
+            error = math.sqrt(sum((a - b) ** 2 for a, b in zip(reached, position)))
+            if error > LINE_TOLERANCE:
+                rospy.logwarn("Local kinematics miss the IK service solution by "
+                              "%.1f mm, moving in joint space." % (1000.0 * error))
+                return False
+        return [self._kinematics.to_dict(row) for row in q]
+
+    @instrumentation.timed('retract')
+    def _retract(self, joint_angles=None):
+        if isinstance(joint_angles, list):
+            # lift straight back up the line the servo came down
+            self.execute_trajectory(joint_angles)
+            return
+        if joint_angles is None and self._kinematics is not None:
+            # current pose from local forward kinematics
+            position, orientation = self._kinematics.forward(
+                self._kinematics.to_array(self._limb.joint_angles()))
+            ik_pose = Pose(position=Point(*position),
+                           orientation=Quaternion(*orientation))
+            ik_pose.position.z = ik_pose.position.z + self._hover_distance
+            joint_angles = self.ik_request(ik_pose)
+        elif joint_angles is None:
+            # retrieve current pose from endpoint
+            if self._profiler is not None:
+                with self._profiler.span('endpoint_pose'):
+                    current_pose = self._limb.endpoint_pose()
+            else:
+                current_pose = self._limb.endpoint_pose()
+            ik_pose = Pose()
+            ik_pose.position.x = current_pose['position'].x 
+            ik_pose.position.y = current_pose['position'].y 
+            ik_pose.position.z = current_pose['position'].z + self._hover_distance
+            ik_pose.orientation.x = current_pose['orientation'].x 
+            ik_pose.orientation.y = current_pose['orientation'].y 
+            ik_pose.orientation.z = current_pose['orientation'].z 
+            ik_pose.orientation.w = current_pose['orientation'].w
+            joint_angles = self.ik_request(ik_pose)
+        # servo up from current pose
+        self._guarded_move_to_joint_position(joint_angles)
+
+    @instrumentation.timed('servo_to_pose')
+    def _servo_to_pose(self, pose, joint_angles=None, gripper_action=None):
+        # servo down to release
+        # joint_angles: a joint dict, or a list of them along a Cartesian
+        # line, streamed as one trajectory
+        if joint_angles is None:
+            joint_angles = self.ik_request(pose)
+        line = joint_angles if isinstance(joint_angles, list) else None
+        if gripper_action is not None and self._gripper_lead_time > 0 and joint_angles:
+            # start actuating the gripper while the servo is decelerating
+            pending = []
+            self.execute_trajectory(line or [joint_angles], events=[(
+                self._gripper_lead_time,
+                lambda: pending.append(gripper_action(block=False)))])
+            future = pending[0] if pending else gripper_action(block=False)
+            future.result()
+            return
+        if line:
+            self.execute_trajectory(line)
+        else:
+            self._guarded_move_to_joint_position(joint_angles)
+        # without a lead time the gripper acts once the arm has settled
+        if gripper_action is not None:
+            gripper_action()
+
+    def solve_cycle(self, pose):
+        # Solve the hover and the target pose of one pick or place cycle in
+        # a single IK request. The retract goes back up to the hover pose,
+        # so it reuses the hover solution.
+        # With Cartesian moves the pose entry is the line of joint dicts
+        # down to pose. The local backend only solves the hover pose; the
+        # service backend solves both, and the pose solution vets the line.
+        if self._cartesian_step and self._check_lines:
+            hover_angles, pose_angles = self.ik_request_batch(
+                [self._hover_pose(pose), pose])
+            line = (hover_angles and pose_angles and
+                    self._cartesian_line(hover_angles, pose, pose_angles))
+            return hover_angles, line or pose_angles
+        if self._cartesian_step:
+            hover_angles = self.ik_request(self._hover_pose(pose))
+            line = hover_angles and self._cartesian_line(hover_angles, pose)
+            if line:
+                return hover_angles, line
+            return hover_angles, hover_angles and self.ik_request(pose)
+        hover_angles, pose_angles = self.ik_request_batch(
+            [self._hover_pose(pose), pose])
+        return hover_angles, pose_angles
+
+    def _lift(self, hover_angles, pose_angles):
+        # retract target: back up the descent line if there was one
+        if isinstance(pose_angles, list):
+            return pose_angles[-2::-1] + [hover_angles]
+        return hover_angles
+
+    @instrumentation.timed('pick')
+    def pick(self, pose, plan=None):
+        # plan: pre-solved (hover, pose) joint angles from solve_cycle
+        hover_angles, pose_angles = plan or self.solve_cycle(pose)
+        # open the gripper while servoing above pose
+        opening = self.gripper_open(block=False)
+        self._approach(pose, hover_angles)
+        opening.result()
+        # servo to pose, then close gripper
+        self._servo_to_pose(pose, pose_angles, self.gripper_close)
+        # retract to clear object
+        self._retract(self._lift(hover_angles, pose_angles))
+
+    @instrumentation.timed('place')
+    def place(self, pose, plan=None):
+        # plan: pre-solved (hover, pose) joint angles from solve_cycle
+        hover_angles, pose_angles = plan or self.solve_cycle(pose)
+        # servo above pose
+        self._approach(pose, hover_angles)
+        # servo to pose, then open the gripper
+        self._servo_to_pose(pose, pose_angles, self.gripper_open)
+        # retract to clear object
+        self._retract(self._lift(hover_angles, pose_angles))
+
+
+# Shared so that teardown reuses the service connections and model cache
+_scene_manager = gazebo_scene.SceneManager()
+
+# don't mess with this
+def load_gazebo_models(table_pose=Pose(position=Point(x=1.0, y=0.0, z=0.0)),
+                       table_pose2=Pose(position=Point(x=0.0, y=1.0, z=0.0)),
+		       table_reference_frame="world",
+                       block_pose=Pose(position=Point(x=0.7334, y=-0.0291, z=0.7749)),
+                       block_reference_frame="world", skip_existing=False,
+                       blocks=0):
+    # Spawn the tables and the block, plus a grid of more blocks,
+    # concurrently. With skip_existing, models left in the world by an
+    # earlier run are kept where they are.
+    # Returns the number of models spawned.
+    results = _scene_manager.spawn(gazebo_scene.default_scene(
+        table_pose, table_pose2, table_reference_frame,
+        block_pose, block_reference_frame) + _block_batch(blocks), skip_existing)
+    spawned = len(results) - len(_scene_manager.last_kept)
+    rospy.loginfo("Spawned {0} Gazebo models in {1:.3f}s".format(
+        spawned, _scene_manager.last_elapsed))
+    return spawned
+
+def delete_gazebo_models(blocks=0):
+    # This will be called on ROS Exit, deleting Gazebo models
+    # Do not wait for the Gazebo Delete Model service, since
+    # Gazebo should already be running. If the service is not
+    # available since Gazebo has been killed, it is fine to error out
+    _scene_manager.delete(["cafe_table", "cafe_table2", "block"] +
+                          [spec.name for spec in _block_batch(blocks)])
+    # teardown is the last use of the scene's service connections
+    _scene_manager.close()
+
+
+# An orientation for gripper fingers to be overhead and parallel to the obj
+OVERHEAD_ORIENTATION = Quaternion(
+                         x=-0.0249590815779,
+                         y=0.999649402929,
+                         z=0.00737916180073,
+                         w=0.00486450832011)
+
+def _block_batch(blocks):
+    # Grid of blocks in three columns beside the demo block; the first 12
+    # are within reach of the left arm
+    return gazebo_scene.block_grid(blocks, origin=(0.55, 0.02, 0.7749),
+                                   spacing=0.07, columns=3)
+
+def _batch_poses(blocks):
+    # Pick poses of the _block_batch blocks at the height of the demo
+    # block, and as many place slots in the next three columns
+    picks = [Pose(position=Point(x=spec.pose.position.x, y=spec.pose.position.y,
+                                 z=-0.129),
+                  orientation=OVERHEAD_ORIENTATION)
+             for spec in _block_batch(blocks)]
+    places = [Pose(position=Point(x=0.55 + 0.07 * (i // 3), y=0.26 + 0.07 * (i % 3),
+                                  z=-0.129),
+                   orientation=OVERHEAD_ORIENTATION)
+              for i in range(blocks)]
+    return picks, places
+
+def _load_tour(limb):
+    # Taught joint waypoints for the arm tour, one row per pose in
+    # the fixed s0, s1, e0, e1, w0, w1, w2 joint order
+    return waypoints.WaypointLibrary.load(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                     "waypoints", "{0}_tour.wpt".format(limb)), limb)
+
+def _load_arm_data(limb):
+    # IK solutions persist across runs; the cache is saved on shutdown
+    cache = ik_cache.IKCache(path=os.path.expanduser(
+        "~/.ros/ik_pick_and_place_cache_{0}.json".format(limb)))
+    cache.load()
+    rospy.on_shutdown(cache.save)
+    # Precomputed with reachability.py; optional
+    reach_path = os.path.expanduser(
+        "~/.ros/ik_pick_and_place_reach_{0}.npz".format(limb))
+    reach = None
+    if os.path.exists(reach_path):
+        reach = reachability.ReachabilityMap.load(reach_path)
+    return cache, reach
+
+def start(timeline, scene, limb='left', hover_distance=0.15, profiler=None):
+    """
+    Bring up the node and the arm. scene() sets up the world and waits for
+    the emulator; it runs concurrently with the IK service wait and the
+    loading of the tour, IK cache and reachability map, each timed on the
+    instrumentation.StartupTimeline. The arm is set up and the robot
+    enabled once all are done: the Limb and Gripper wait only briefly for
+    robot state, which a cold emulator is not publishing yet.
+    Returns (scene() result, PickAndPlace, tour).
+    """
+    with timeline.span('init_node'):
+        rospy.init_node("ik_pick_and_place_demo")
+    scene_result, _, (cache, reach), tour = timeline.run_concurrently([
+        ('scene', scene),
+        ('ik_service', lambda: rospy.wait_for_service(IK_SERVICE.format(limb), 5.0)),
+        ('arm_data', lambda: _load_arm_data(limb)),
+        ('tour', lambda: _load_tour(limb)),
+    ])
+    with timeline.span('arm'):
+        pnp = PickAndPlace(limb, hover_distance, ik_cache=cache, profiler=profiler,
+                           reachability=reach, wait_ready=False)
+        rospy.on_shutdown(pnp._iksvc.close)
+        pnp.wait_for_ik(5.0)
+    with timeline.span('enable'):
+        pnp.enable_robot()
+    print(timeline.report())
+    return scene_result, pnp, tour
+
+def _wait_for_sim():
+    # Wait for the All Clear from emulator startup
+    rospy.wait_for_message("/robot/sim/started", Empty)
+
+def tour(timeline):
+    """Run the taught waypoint tour of the left arm once."""
+    _, pnp, waypoint_tour = start(timeline, _wait_for_sim)
+    pnp._guarded_move_to_joint_position(waypoint_tour.joint_dict(0))
+    pnp.execute_trajectory(waypoint_tour[1:], tolerance=TOUR_TOLERANCE)
+    return 0
+
+def run(timeline, cycles=0, blocks=0):
+    """RSDK Inverse Kinematics Pick and Place Example
+
+    A Pick and Place example using the Rethink Inverse Kinematics
+    Service which returns the joint angles a requested Cartesian Pose.
+    This ROS Service client is used to request both pick and place
+    poses in the /base frame of the robot.
+
+    Note: This is a highly scripted and tuned demo. The object location
+    is "known" and movement is done completely open loop. It is expected
+    behavior that Baxter will eventually mis-pick or drop the block. You
+    can improve on this demo by adding perception and feedback to close
+    the loop; recorded point cloud frames in
+    ~/.ros/ik_pick_and_place_frames are segmented by block_perception
+    and the blocks found there are picked.
+
+    By default the run is the waypoint tour only. With cycles, the block
+    is then shuttled between its initial pose and a second one; with
+    blocks, a grid of that many more blocks is spawned and moved to free
+    place slots in the order of least arm travel.
+    """
+    # Completed steps are journaled; a run that died is resumed after its
+    # last completed step instead of starting over
+    with timeline.span('journal'):
+        journal = task_journal.TaskJournal(os.path.expanduser(
+            "~/.ros/ik_pick_and_place_journal.jsonl"))
+        # a journal left by a run of other jobs is not resumed
+        pick_poses, place_poses = _batch_poses(blocks)
+        resumable = journal.resuming
+        resuming = journal.start(plan=task_journal.plan_digest({
+            'cycles': cycles,
+            'batch': [[pose.position.x, pose.position.y, pose.position.z]
+                      for pose in pick_poses + place_poses]}))
+        if resumable and not resuming:
+            print("The journal is of a different job list; starting over.")
+
+    def scene():
+        # Load Gazebo Models via Spawning Services
+        # Note that the models reference is the /world frame
+        # and the IK operates with respect to the /base frame
+        spawned = load_gazebo_models(skip_existing=True, blocks=blocks)
+        # A warm restart finds the scene in place and the emulator long
+        # started
+        if spawned:
+            _wait_for_sim()
+
+    # Per-phase timings, reported when the run ends
+    profiler = instrumentation.Profiler(trace_path=os.path.expanduser(
+        "~/.ros/ik_pick_and_place_trace.jsonl"))
+    _, pnp, waypoint_tour = start(timeline, scene, profiler=profiler)
+    rospy.on_shutdown(journal.close)
+    # Remove models from the scene on shutdown, unless the run is
+    # unfinished and the scene is kept for a warm restart
+    rospy.on_shutdown(lambda: journal.finished and delete_gazebo_models(blocks))
+    rospy.on_shutdown(profiler.close)
+
+    # Starting Joint angles for left arm
+    # starting_joint_angles = {'left_w0': 0.7702527147204759,
+    #                          'left_w1': 1.0699003547293966,
+    #                          'left_w2': -0.7439340610665388,
+    #                          'left_e0': -0.6731041905255042,
+    #                          'left_e1': 1.006470431827732,
+    #                          'left_s0': -0.8243352082669739,
+    #                          'left_s1': -0.28686986561936934}
+    block_poses = list()
+    # The Pose of the block in its initial location.
+    # You may wish to replace these poses with estimates
+    # from a perception node.
+    # block_poses.append(Pose(
+    #     position=Point(x=0.7, y=0.15, z=-0.129),
+    #     orientation=OVERHEAD_ORIENTATION))
+    # Feel free to add additional desired poses for the object.
+    # Each additional pose will get its own pick and place.
+    block_poses.append(Pose(
+        position=Point(x=0.75, y=-0.1, z=-0.129),
+        orientation=OVERHEAD_ORIENTATION))
+
+    # block_poses.append(Pose(
+    #     position=Point(x=0.0, y=1.0, z=-0.129),
+    #     orientation=OVERHEAD_ORIENTATION))
+    # Move to the desired starting angles
+    # pnp.move_to_start(starting_joint_angles)
+
+    # pnp.pick(block_poses[0])
+    # pnp._guarded_move_to_joint_position(waypoint_tour.joint_dict(0))
+    if resuming:
+        print("Resuming the run from {0}".format(journal.path))
+        # back to the last commanded configuration, where the interrupted
+        # step started from or ended at
+        if journal.last_joints:
+            pnp._guarded_move_to_joint_position(journal.last_joints)
+    if not journal.completed(None, 'tour'):
+        pnp.execute_trajectory(waypoint_tour[1:], tolerance=TOUR_TOLERANCE)
+        journal.record_step(None, 'tour', pnp.last_command)
+
+    # Shuttle the block back and forth between its initial pose and a
+    # second one; a restarted run resumes after the last completed pick or
+    # place
+    if cycles:
+        shuttle_poses = [block_poses[0], Pose(
+            position=Point(x=0.7, y=0.15, z=-0.129),
+            orientation=OVERHEAD_ORIENTATION)]
+        jobs = [pick_place_scheduler.PickPlaceJob(shuttle_poses[i % 2],
+                                                  shuttle_poses[(i + 1) % 2])
+                for i in range(cycles)]
+        scheduler = pick_place_scheduler.PipelinedScheduler(
+            pnp, is_shutdown=rospy.is_shutdown, journal=journal)
+        print(scheduler.run(jobs))
+
+    # The batch of blocks: the hover poses are solved in one IK request and
+    # the jobs ordered to minimize the arm travel between them
+    if blocks and not rospy.is_shutdown():
+        batch, unsolved = pick_sequencing.sequence_jobs(
+            pnp, pick_poses, place_poses, assign=True)
+        if unsolved:
+            rospy.logwarn("No IK solution for blocks {0}, skipping them.".format(
+                ", ".join(str(i) for i in unsolved)))
+        # journaled after the shuttle jobs
+        for job in batch:
+            job.index += cycles
+        scheduler = pick_place_scheduler.PipelinedScheduler(
+            pnp, is_shutdown=rospy.is_shutdown, journal=journal)
+        print(scheduler.run(batch))
+
+    # Closed loop: blocks found in recorded point cloud frames (if any) are
+    # picked as soon as they are confirmed, and lined up on the table
+    frames_path = os.path.expanduser("~/.ros/ik_pick_and_place_frames")
+    if os.path.isdir(frames_path):
+        frames = block_perception.LatestFrames(
+            block_perception.read_frames(frames_path, period=1.0 / 30))
+        place_poses = [Pose(position=Point(x=0.6 + 0.08 * i, y=0.3, z=-0.129),
+                            orientation=OVERHEAD_ORIENTATION) for i in range(4)]
+        scheduler = pick_place_scheduler.PipelinedScheduler(
+            pnp, is_shutdown=rospy.is_shutdown)
+        print(scheduler.run(block_perception.pick_jobs(
+            frames, place_poses, profiler=profiler, is_shutdown=rospy.is_shutdown)))
+        print("{0} frames, {1} dropped".format(frames.received, frames.dropped))
+    if not rospy.is_shutdown():
+        journal.finish()
+    if pnp.first_motion_time is not None:
+        seconds = pnp.first_motion_time - timeline.origin
+        journal.record('first_motion', seconds=seconds, resumed=resuming)
+        print("{0} to first motion: {1:.3f}s".format(
+            "Restart" if resuming else "Start", seconds))
+    journal.close()
+    profiler.close()
+    print(profiler.report())
+    print(pnp._iksvc.report())
+    if pnp._ik_cache is not None:
+        print("IK cache: {size} entries, {hits} hits, {near_hits} near hits, "
+              "{misses} misses, {evictions} evictions, "
+              "hit rate {hit_rate:.1%}".format(**pnp._ik_cache.stats()))
+
+    # while not rospy.is_shutdown():
+    #     print("\nPicking...")
+    #     pnp.pick(block_poses[idx])
+    #     print("\nPlacing...")
+    #     idx = (idx+1) % len(block_poses)
+    #     pnp.place(block_poses[idx])
+    return 0
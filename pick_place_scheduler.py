@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+
+"""
+Pipelined pick and place scheduling.
+
+While the arm executes step k, a planner thread is already solving IK for
+steps k+1 .. k+lookahead, so planning latency overlaps with motion instead
+of adding to it.
+"""
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+class NullGuard(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class PickPlaceJob(object):
+    def __init__(self, pick_pose, place_pose, index=None):
+        self.pick_pose = pick_pose
+        self.place_pose = place_pose
+        self.index = index
+
+
+class _Plan(object):
+    # IK solutions for one job: (hover, pose) joint angles for each half
+    # resumed: the job was completed by an earlier run
+    def __init__(self, job, pick=None, place=None, error=None, resumed=False):
+        self.job = job
+        self.pick = pick
+        self.place = place
+        self.error = error
+        self.resumed = resumed
+
+    @property
+    def ok(self):
+        return (self.error is None and all(self.pick) and all(self.place))
+
+
+class PipelinedScheduler(object):
+    """
+    Runs a queue of PickPlaceJobs on a PickAndPlace instance.
+
+    lookahead: maximum number of planned jobs waiting ahead of the arm
+    stop_on_failure: cancel the rest of the queue when a job cannot be
+                     planned, instead of skipping that job
+    guard: optional callable guard(job) returning a context manager held
+           while the job executes, e.g. a shared workspace lock
+    journal: optional task_journal.TaskJournal; completed picks and places
+             are recorded, and those an earlier run completed are skipped
+    """
+    _DONE = object()
+
+    def __init__(self, pnp, lookahead=2, stop_on_failure=False,
+                 is_shutdown=lambda: False, verbose=True, guard=None,
+                 journal=None):
+        self._pnp = pnp
+        self._journal = journal
+        self._guard = guard or (lambda job: NullGuard())
+        self._lookahead = max(1, lookahead)
+        self._stop_on_failure = stop_on_failure
+        self._is_shutdown = is_shutdown
+        self._verbose = verbose
+        self._cancelled = threading.Event()
+        self.results = []
+        self._pulled = []
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def _cancelled_or_shutdown(self):
+        return self._cancelled.is_set() or self._is_shutdown()
+
+    def _put(self, plans, item):
+        # bounded put that still notices cancellation
+        while not self._cancelled_or_shutdown():
+            try:
+                plans.put(item, timeout=0.05)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _completed(self, job, step):
+        return self._journal is not None and self._journal.completed(job.index, step)
+
+    def _record(self, job, step):
+        if self._journal is not None:
+            self._journal.record_step(job.index, step, self._pnp.last_command)
+
+    def _plan(self, jobs, plans):
+        try:
+            for job in jobs:
+                if self._cancelled_or_shutdown():
+                    break
+                if job.index is None:
+                    job.index = len(self._pulled)
+                self._pulled.append(job)
+                if self._completed(job, 'place'):
+                    if not self._put(plans, _Plan(job, resumed=True)):
+                        break
+                    continue
+                try:
+                    plan = _Plan(job, self._pnp.solve_cycle(job.pick_pose),
+                                 self._pnp.solve_cycle(job.place_pose))
+                except Exception as e:
+                    plan = _Plan(job, error=e)
+                if not self._put(plans, plan):
+                    break
+        finally:
+            self._put(plans, self._DONE)
+
+    def run(self, jobs):
+        """
+        Execute jobs in order and return a summary dict. Each entry of
+        self.results is (job index, 'done' | 'failed' | 'cancelled' |
+        'resumed'), resumed jobs being those the journal had completed.
+        jobs may be a generator, e.g. block_perception.pick_jobs; it is
+        consumed by the planner only as the lookahead has room.
+        """
+        streaming = not hasattr(jobs, '__len__')
+        if not streaming:
+            jobs = list(jobs)
+            for i, job in enumerate(jobs):
+                if job.index is None:
+                    job.index = i
+        self._cancelled.clear()
+        self.results = []
+        self._pulled = []
+        plans = queue.Queue(maxsize=self._lookahead)
+        planner = threading.Thread(target=self._plan, args=(jobs, plans))
+        planner.daemon = True
+        start = time.time()
+        planner.start()
+        try:
+            while True:
+                try:
+                    plan = plans.get(timeout=0.05)
+                except queue.Empty:
+                    if self._cancelled_or_shutdown() and not planner.is_alive():
+                        break
+                    continue
+                if plan is self._DONE:
+                    break
+                if plan.resumed:
+                    self.results.append((plan.job.index, 'resumed'))
+                    continue
+                if self._cancelled_or_shutdown():
+                    self.results.append((plan.job.index, 'cancelled'))
+                    continue
+                if not plan.ok:
+                    if self._verbose:
+                        print("Planning failed for job {0}: {1}".format(
+                            plan.job.index, plan.error or "no IK solution"))
+                    self.results.append((plan.job.index, 'failed'))
+                    if self._stop_on_failure:
+                        self.cancel()
+                    continue
+                with self._guard(plan.job):
+                    # a pick completed before a restart holds the block already
+                    if not self._completed(plan.job, 'pick'):
+                        if self._verbose:
+                            print("\nPicking...")
+                        self._pnp.pick(plan.job.pick_pose, plan.pick)
+                        self._record(plan.job, 'pick')
+                    if self._verbose:
+                        print("\nPlacing...")
+                    self._pnp.place(plan.job.place_pose, plan.place)
+                    self._record(plan.job, 'place')
+                self.results.append((plan.job.index, 'done'))
+        except BaseException:
+            # stop the planner, or it waits in _put for a queue no
+            # one reads any more
+            self.cancel()
+            raise
+        finally:
+            planner.join()
+        finished = set(index for index, _ in self.results)
+        # a stream's jobs that were never pulled are not reported
+        self.results.extend((job.index, 'cancelled')
+                            for job in (self._pulled if streaming else jobs)
+                            if job.index not in finished)
+        elapsed = time.time() - start
+        done = sum(1 for _, status in self.results if status == 'done')
+        return {
+            'done': done,
+            'failed': sum(1 for _, status in self.results if status == 'failed'),
+            'cancelled': sum(1 for _, status in self.results if status == 'cancelled'),
+            'resumed': sum(1 for _, status in self.results if status == 'resumed'),
+            'elapsed': elapsed,
+            'picks_per_minute': 60.0 * done / elapsed if elapsed > 0 else 0.0,
+        }
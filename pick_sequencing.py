@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+
+"""
+Pick and place job sequencing.
+
+Orders a batch of pick and place jobs to minimize the estimated arm
+travel between them. Travel times come from a vectorized matrix of
+rest-to-rest joint-space moves under the per-joint velocity and
+acceleration limits; the order is built nearest neighbour first and then
+improved with 2-opt. A few hundred jobs are ordered in milliseconds.
+"""
+import numpy as np
+
+from baxter_kinematics import JOINTS, VELOCITY_LIMITS, ACCELERATION_LIMITS
+from pick_place_scheduler import PickPlaceJob
+from trajectory import rest_to_rest_time
+
+
+def _move_times(distance, max_vel, max_acc):
+    # the slowest joint sets the time of each move
+    return rest_to_rest_time(distance, max_vel, max_acc).max(axis=-1)
+
+
+def travel_times(start, end, max_vel=VELOCITY_LIMITS, max_acc=ACCELERATION_LIMITS):
+    """
+    (N, M) estimated seconds to move from each row of start (N, 7) to
+    each row of end (M, 7).
+    """
+    start = np.atleast_2d(np.asarray(start, dtype=np.float64))
+    end = np.atleast_2d(np.asarray(end, dtype=np.float64))
+    return _move_times(np.abs(end[np.newaxis, :, :] - start[:, np.newaxis, :]),
+                       max_vel, max_acc)
+
+
+def assign_places(pick_q, place_q, max_vel=VELOCITY_LIMITS, max_acc=ACCELERATION_LIMITS):
+    """
+    Place slot for every pick, taking the pairs with the least pick to
+    place travel first. Returns an index into place_q for each pick.
+    """
+    costs = travel_times(pick_q, place_q, max_vel, max_acc)
+    n, m = costs.shape
+    if m < n:
+        raise ValueError("{0} picks but only {1} place poses".format(n, m))
+    assigned = np.full(n, -1, dtype=int)
+    taken = np.zeros(m, dtype=bool)
+    remaining = n
+    for flat in np.argsort(costs, axis=None, kind='mergesort'):
+        if not remaining:
+            break
+        i, j = divmod(int(flat), m)
+        if assigned[i] < 0 and not taken[j]:
+            assigned[i] = j
+            taken[j] = True
+            remaining -= 1
+    return assigned
+
+
+def _nearest_neighbour(start_costs, costs):
+    n = len(start_costs)
+    order = np.empty(n, dtype=int)
+    visited = np.zeros(n, dtype=bool)
+    current = start_costs
+    for k in range(n):
+        job = int(np.argmin(np.where(visited, np.inf, current)))
+        order[k] = job
+        visited[job] = True
+        current = costs[job]
+    return order
+
+
+def _path_seconds(order, start_costs, costs):
+    # travel between the jobs run in order, from the start
+    return start_costs[order[0]] + costs[order[:-1], order[1:]].sum()
+
+
+def _two_opt(order, start_costs, costs, max_rounds=1000):
+    # 2-opt over the open path. Costs are asymmetric, so reversing
+    # path[i..j] also turns the edges inside the segment around; their
+    # cost both ways comes from prefix sums, which makes every move O(1)
+    # and one round a single vectorized pass. Each round applies the best
+    # improving reversals whose edges do not overlap.
+    n = len(order)
+    # node n stands for the start configuration; ending anywhere is free
+    d = np.zeros((n + 1, n + 1))
+    d[:n, :n] = costs
+    d[n, :n] = start_costs
+    path = np.concatenate([[n], order, [n]])
+    i = np.arange(1, n + 1)[:, np.newaxis]
+    j = np.arange(1, n + 1)[np.newaxis, :]
+    for _ in range(max_rounds):
+        forward = np.concatenate([[0.0], np.cumsum(d[path[:-1], path[1:]])])
+        backward = np.concatenate([[0.0], np.cumsum(d[path[1:], path[:-1]])])
+        old = d[path[i - 1], path[i]] + d[path[j], path[j + 1]] + forward[j] - forward[i]
+        new = d[path[i - 1], path[j]] + d[path[i], path[j + 1]] + backward[j] - backward[i]
+        delta = np.where(j > i, new - old, 0.0)
+        improving = np.flatnonzero(delta < -1e-9)
+        if not len(improving):
+            break
+        improving = improving[np.argsort(delta.flat[improving], kind='mergesort')][:n]
+        # edge k joins path[k] and path[k + 1]
+        used = np.zeros(n + 1, dtype=bool)
+        for flat in improving:
+            first, last = divmod(int(flat), n)
+            first += 1
+            last += 1
+            if used[first - 1:last + 1].any():
+                continue
+            used[first - 1:last + 1] = True
+            path[first:last + 1] = path[first:last + 1][::-1].copy()
+    return path[1:-1]
+
+
+def order_jobs(pick_q, place_q, start_q=None, max_vel=VELOCITY_LIMITS,
+               max_acc=ACCELERATION_LIMITS, improve=True):
+    """
+    Order of the jobs that minimizes the estimated travel time.
+
+    pick_q, place_q: (N, 7) joints the arm picks and places each job at,
+                     e.g. the hover solutions; rows pair up
+    start_q: (7,) joints the arm starts from; None starts at any job
+    improve: refine the nearest neighbour order with 2-opt
+    Returns (order, seconds): job indices in execution order, and the
+    estimated travel time of the whole batch. The order is never slower
+    than running the jobs as given.
+    """
+    pick_q = np.asarray(pick_q, dtype=np.float64).reshape(-1, len(JOINTS))
+    place_q = np.asarray(place_q, dtype=np.float64).reshape(-1, len(JOINTS))
+    n = len(pick_q)
+    if not n:
+        return np.empty(0, dtype=int), 0.0
+    # costs[a, b]: from placing job a to picking job b
+    costs = travel_times(place_q, pick_q, max_vel, max_acc)
+    start_costs = np.zeros(n) if start_q is None else \
+        travel_times(start_q, pick_q, max_vel, max_acc)[0]
+    order = _nearest_neighbour(start_costs, costs)
+    given = np.arange(n)
+    if _path_seconds(given, start_costs, costs) < _path_seconds(order, start_costs, costs):
+        # greedy choices can lose to the order the jobs came in
+        order = given
+    if improve and n > 1:
+        order = _two_opt(order, start_costs, costs)
+    seconds = (_path_seconds(order, start_costs, costs) +
+               _move_times(np.abs(place_q - pick_q), max_vel, max_acc).sum())
+    return order, float(seconds)
+
+
+def sequence_jobs(pnp, pick_poses, place_poses, assign=False, improve=True,
+                  max_vel=VELOCITY_LIMITS, max_acc=ACCELERATION_LIMITS):
+    """
+    PickPlaceJobs for a pick_and_place.PickAndPlace in the order of least
+    arm travel from its current joint angles.
+
+    place_poses pair up with pick_poses in order, or with assign each pick
+    gets the free place pose nearest to it. The hover poses are solved in
+    one IK batch, which also leaves them in the IK cache for the cycles.
+    A job's index is the position of its pick in pick_poses. Returns
+    (jobs, unsolved): picks without a hover solution, or whose place pose
+    has none, are not queued, and their indices are listed in unsolved.
+    """
+    pick_poses = list(pick_poses)
+    place_poses = list(place_poses)
+    names = [pnp._limb_name + '_' + joint for joint in JOINTS]
+    hovers = pnp.ik_request_batch([pnp._hover_pose(pose)
+                                   for pose in pick_poses + place_poses])
+    picks, places = hovers[:len(pick_poses)], hovers[len(pick_poses):]
+    to_array = lambda solutions: np.array(
+        [[solution[name] for name in names] for solution in solutions])
+    if assign:
+        valid = [i for i, joints in enumerate(picks) if joints]
+        free = [j for j, joints in enumerate(places) if joints]
+        if len(free) < len(valid) or (pick_poses and not place_poses):
+            raise ValueError("{0} reachable picks but only {1} reachable place poses".format(
+                len(valid), len(free)))
+        slots = assign_places(to_array([picks[i] for i in valid]),
+                              to_array([places[j] for j in free]),
+                              max_vel, max_acc) if valid else []
+        place_for = dict((i, free[slot]) for i, slot in zip(valid, slots))
+    else:
+        if len(place_poses) != len(pick_poses):
+            raise ValueError("{0} picks but {1} place poses".format(
+                len(pick_poses), len(place_poses)))
+        place_for = dict((i, i) for i in range(len(pick_poses)))
+        valid = [i for i in range(len(pick_poses)) if picks[i] and places[i]]
+    start = pnp._limb.joint_angles()
+    order, _ = order_jobs(to_array([picks[i] for i in valid]),
+                          to_array([places[place_for[i]] for i in valid]),
+                          [start[name] for name in names], max_vel, max_acc, improve)
+    solved = set(valid)
+    return ([PickPlaceJob(pick_poses[i], place_poses[place_for[i]], index=i)
+             for i in (valid[k] for k in order)],
+            [i for i in range(len(pick_poses)) if i not in solved])
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+
+"""
+Precomputed reachability over the table workspace.
+
+Samples a 3D grid over the table regions spawned by load_gazebo_models,
+batch-solves IK at every sample with the overhead gripper orientation and
+stores the result as a bitmap with the best seed joints of each reachable
+voxel. is_reachable(pose), seed_for(pose) and is_unreachable(pose) are
+then O(1) lookups.
+
+A voxel is solved only at its centre, so a voxel marked unreachable may
+still hold solvable poses near a reachable neighbour. is_unreachable is
+the conservative test used to skip IK: it is True only well outside the
+reachable envelope, where the voxel and every voxel within margin of it
+were solved and found unreachable. Poses outside the grid or in another
+orientation are unknown to the map.
+"""
+import argparse
+import math
+import os
+import sys
+
+import numpy as np
+
+import baxter_kinematics
+
+# Table footprints in the base frame from load_gazebo_models' default
+# table poses (world (1, 0) and (0, 1)); the cafe_table top is 0.913 m
+# square, and the robot base sits 0.93 m above the world origin.
+TABLE_SIZE = 0.913
+TABLE_HEIGHT = 0.775
+BASE_HEIGHT = 0.93
+TABLE_CENTERS = ((1.0, 0.0), (0.0, 1.0))
+# Heights above the table top the gripper works at: from below the grasp
+# (0.026 m) to above the hover pose, 0.15 m over the grasp
+WORK_HEIGHTS = (-0.16, 0.20)
+
+OVERHEAD_ORIENTATION = (-0.0249590815779, 0.999649402929,
+                        0.00737916180073, 0.00486450832011)
+
+# Popcount of every byte value, for rank queries into the bitmap
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+class ReachabilityMap(object):
+    """
+    Voxel bitmap of reachable positions for one limb and orientation.
+
+    origin: base-frame corner of voxel (0, 0, 0), meters
+    resolution: voxel edge length, meters
+    shape: voxel counts along x, y, z
+    bits: packed bitmap in C order over shape
+    seeds: (M, 7) float32 joints of the M reachable voxels, in bit order
+    known: packed bitmap of the voxels that were solved; None for a map
+           saved without it, which then never rejects a pose
+    margin: voxels around a reachable one that is_unreachable never rejects
+    """
+    def __init__(self, limb, origin, resolution, shape, bits, seeds,
+                 orientation=OVERHEAD_ORIENTATION, orientation_tolerance=0.1,
+                 known=None, margin=1):
+        self.limb = limb
+        self.origin = np.asarray(origin, dtype=np.float64)
+        self._origin = self.origin.tolist()
+        self.resolution = float(resolution)
+        self.shape = tuple(int(n) for n in shape)
+        self.orientation = tuple(orientation)
+        # poses within this angle (radians) of orientation use the map
+        self._min_dot = math.cos(orientation_tolerance / 2.0)
+        self._bits = np.asarray(bits, dtype=np.uint8)
+        self._seeds = np.asarray(seeds, dtype=np.float32)
+        # number of reachable voxels before each byte of the bitmap
+        counts = _POPCOUNT[self._bits].astype(np.uint32)
+        self._byte_rank = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.uint32)
+        self._joint_names = [limb + '_' + joint for joint in baxter_kinematics.JOINTS]
+        self._known = None if known is None else np.asarray(known, dtype=np.uint8)
+        self._rejected = self._rejections(margin)
+
+    def _rejections(self, margin):
+        # Voxels well outside the envelope: every voxel within margin of
+        # them, themselves included, was solved and is unreachable
+        size = int(np.prod(self.shape))
+        if self._known is None:
+            return np.zeros(size, dtype=bool)
+        reachable = np.unpackbits(self._bits)[:size].reshape(self.shape).astype(bool)
+        unknown = ~np.unpackbits(self._known)[:size].reshape(self.shape).astype(bool)
+        # outside the grid counts as unknown
+        blocked = np.pad(reachable | unknown, margin, mode='constant',
+                         constant_values=True)
+        near = np.zeros(self.shape, dtype=bool)
+        nx, ny, nz = self.shape
+        span = range(2 * margin + 1)
+        for di in span:
+            for dj in span:
+                for dk in span:
+                    near |= blocked[di:di + nx, dj:dj + ny, dk:dk + nz]
+        return ~near.reshape(-1)
+
+    def __len__(self):
+        return len(self._seeds)
+
+    def _voxel(self, pose):
+        # flat voxel index of the pose position, or None outside the grid
+        # or in another orientation
+        # plain float math: this runs per query, numpy would dominate
+        o = pose.orientation
+        q = self.orientation
+        if abs(o.x * q[0] + o.y * q[1] + o.z * q[2] + o.w * q[3]) < self._min_dot:
+            return None
+        p = pose.position
+        nx, ny, nz = self.shape
+        i = int(math.floor((p.x - self._origin[0]) / self.resolution))
+        j = int(math.floor((p.y - self._origin[1]) / self.resolution))
+        k = int(math.floor((p.z - self._origin[2]) / self.resolution))
+        if not (0 <= i < nx and 0 <= j < ny and 0 <= k < nz):
+            return None
+        return (i * ny + j) * nz + k
+
+    def _bit(self, flat):
+        byte, offset = divmod(flat, 8)
+        return (int(self._bits[byte]) >> (7 - offset)) & 1
+
+    def is_reachable(self, pose):
+        # True or False by the voxel's centre solution, None if the map
+        # does not cover the pose
+        flat = self._voxel(pose)
+        if flat is None:
+            return None
+        return bool(self._bit(flat))
+
+    def is_unreachable(self, pose):
+        # True only for poses well outside the reachable envelope, which
+        # can be rejected without an IK request
+        flat = self._voxel(pose)
+        return flat is not None and bool(self._rejected[flat])
+
+    def seed_for(self, pose):
+        # Limb API joint dict of the voxel's solution, or None
+        flat = self._voxel(pose)
+        if flat is None or not self._bit(flat):
+            return None
+        byte, offset = divmod(flat, 8)
+        # rank = reachable voxels before this one
+        before = int(self._bits[byte]) >> (8 - offset) if offset else 0
+        rank = int(self._byte_rank[byte]) + int(_POPCOUNT[before])
+        return dict(zip(self._joint_names, self._seeds[rank].astype(np.float64).tolist()))
+
+    def __call__(self, limb, pose):
+        # is_reachable(limb, pose) interface used by dual_arm; poses the
+        # map does not cover are left to IK
+        return limb == self.limb and self.is_reachable(pose) is not False
+
+    @classmethod
+    def build(cls, limb, resolution=0.03, table_centers=TABLE_CENTERS,
+              orientation=OVERHEAD_ORIENTATION, kinematics=None, chunk=4096):
+        """
+        Batch-solve IK over the table regions. Voxels outside the table
+        footprints are left unreachable without solving.
+        """
+        kinematics = kinematics or baxter_kinematics.BaxterKinematics(limb)
+        half = TABLE_SIZE / 2.0
+        centers = np.asarray(table_centers, dtype=np.float64)
+        table_top = TABLE_HEIGHT - BASE_HEIGHT
+        lower = np.array([centers[:, 0].min() - half, centers[:, 1].min() - half,
+                          table_top + WORK_HEIGHTS[0]])
+        upper = np.array([centers[:, 0].max() + half, centers[:, 1].max() + half,
+                          table_top + WORK_HEIGHTS[1]])
+        shape = np.ceil((upper - lower) / resolution).astype(int)
+        axes = [lower[d] + resolution * (np.arange(shape[d]) + 0.5) for d in range(3)]
+        grid = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, 3)
+        on_table = np.zeros(len(grid), dtype=bool)
+        for cx, cy in centers:
+            on_table |= ((np.abs(grid[:, 0] - cx) <= half) &
+                         (np.abs(grid[:, 1] - cy) <= half))
+        reachable = np.zeros(len(grid), dtype=bool)
+        solutions = np.zeros((len(grid), 7))
+        candidates = np.flatnonzero(on_table)
+        quaternion = np.asarray(orientation, dtype=np.float64)
+        for start in range(0, len(candidates), chunk):
+            index = candidates[start:start + chunk]
+            q, ok = kinematics.inverse(grid[index], np.tile(quaternion, (len(index), 1)))
+            reachable[index] = ok
+            solutions[index] = q
+        return cls(limb, lower, resolution, shape, np.packbits(reachable),
+                   solutions[reachable], orientation, known=np.packbits(on_table))
+
+    def save(self, path):
+        np.savez_compressed(path, limb=np.array(self.limb), origin=self.origin,
+                            resolution=np.array(self.resolution),
+                            shape=np.array(self.shape), bits=self._bits,
+                            seeds=self._seeds, orientation=np.array(self.orientation),
+                            known=(self._known if self._known is not None
+                                   else np.zeros(0, dtype=np.uint8)))
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        limb = data['limb'].item()
+        if isinstance(limb, bytes):
+            limb = limb.decode('utf-8')
+        # maps saved before the known bitmap was kept never reject
+        known = data['known'] if 'known' in data.files else None
+        if known is not None and not len(known):
+            known = None
+        return cls(limb, data['origin'], float(data['resolution']),
+                   data['shape'], data['bits'], data['seeds'], data['orientation'],
+                   known=known)
+
+
+def main():
+    """Precompute the reachability map of one arm over the tables."""
+    arg_fmt = argparse.RawDescriptionHelpFormatter
+    parser = argparse.ArgumentParser(formatter_class=arg_fmt,
+                                     description=main.__doc__)
+    parser.add_argument('-l', '--limb', choices=['left', 'right'], default='left')
+    parser.add_argument('-r', '--resolution', type=float, default=0.03,
+                        help="voxel edge length (m)")
+    parser.add_argument('-o', '--output', default=None,
+                        help="output .npz (default ~/.ros/ik_pick_and_place_reach_<limb>.npz)")
+    args = parser.parse_args()
+    output = args.output or os.path.expanduser(
+        "~/.ros/ik_pick_and_place_reach_{0}.npz".format(args.limb))
+    reach = ReachabilityMap.build(args.limb, args.resolution)
+    reach.save(output)
+    print("{0} of {1} voxels reachable, saved to {2}".format(
+        len(reach), int(np.prod(reach.shape)), output))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+
+"""
+In-process stand-ins for the baxter_interface objects used by the pick
+and place demo, driven by a simulated clock so cycle times can be
+compared without Gazebo or a ROS master.
+"""
+from baxter_kinematics import IKResponse
+from trajectory import rest_to_rest_time
+
+
+class SimClock(object):
+    """
+    Virtual clock. sleep() advances time instantly, so simulated runs
+    take as long as their computation, not as long as the motion.
+    """
+    def __init__(self, start=0.0):
+        self._now = float(start)
+
+    def now(self):
+        return self._now
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self._now += seconds
+
+
+class SimulatedLimb(object):
+    """
+    Kinematic model of baxter_interface.Limb.
+
+    move_to_joint_positions() blocks (in simulated time) for a rest-to-rest
+    move of the slowest joint plus a settle time, mirroring the stop at
+    every waypoint of the real call. set_joint_positions() snaps to the
+    commanded setpoint, as a streamed raw position command would track it.
+    """
+    JOINTS = ('s0', 's1', 'e0', 'e1', 'w0', 'w1', 'w2')
+
+    def __init__(self, limb, clock=None, max_vel=1.0, max_acc=2.0,
+                 settle_time=0.3, start_angles=None):
+        self.name = limb
+        self._clock = clock or SimClock()
+        self._max_vel = max_vel
+        self._max_acc = max_acc
+        self._settle_time = settle_time
+        self._joint_names = [limb + '_' + joint for joint in self.JOINTS]
+        self._angles = dict((name, 0.0) for name in self._joint_names)
+        if start_angles:
+            self._angles.update(start_angles)
+        self.commands = 0
+
+    @property
+    def clock(self):
+        return self._clock
+
+    def joint_names(self):
+        return list(self._joint_names)
+
+    def joint_angles(self):
+        return dict(self._angles)
+
+    def joint_angle(self, joint):
+        return self._angles[joint]
+
+    def set_joint_positions(self, positions, raw=False):
+        self.commands += 1
+        self._angles.update(positions)
+
+    def move_to_joint_positions(self, positions, timeout=15.0, threshold=0.008726646):
+        self.commands += 1
+        distance = max([abs(value - self._angles[name])
+                        for name, value in positions.items()] + [0.0])
+        duration = float(rest_to_rest_time(distance, self._max_vel, self._max_acc))
+        self._clock.sleep(min(duration + self._settle_time, timeout))
+        self._angles.update(positions)
+
+
+class SimulatedIKService(object):
+    """
+    Stand-in for the ExternalTools/<limb>/PositionKinematicsNode/IKService
+    proxy. Every call costs latency seconds of simulated time regardless of
+    how many poses it carries, which is what makes batching pay off.
+
+    solver(pose) returns a joint dict, or None for an unreachable pose.
+    By default every pose resolves to the limb's zero configuration.
+    """
+    SEED_CURRENT = 2
+
+    def __init__(self, limb, clock=None, latency=0.05, solver=None):
+        self._clock = clock or SimClock()
+        self._latency = latency
+        self._joint_names = [limb + '_' + joint for joint in SimulatedLimb.JOINTS]
+        self._solver = solver or (
+            lambda pose: dict((name, 0.0) for name in self._joint_names))
+        self.calls = 0
+        self.poses = 0
+
+    def __call__(self, request):
+        self.calls += 1
+        self._clock.sleep(self._latency)
+        solutions = []
+        for pose_stamped in request.pose_stamp:
+            self.poses += 1
+            solutions.append(self._solver(pose_stamped.pose))
+        return IKResponse.from_solutions(solutions, self.SEED_CURRENT)
+
+
+class SimulatedGripper(object):
+    """
+    Stand-in for baxter_interface.Gripper with a configurable actuation
+    delay before the fingers start moving and a full-stroke travel time.
+    With object_width set (0-100, as position()), closing stops on the
+    object and reports gripping().
+    """
+    def __init__(self, clock=None, actuation_delay=0.1, travel_time=0.6,
+                 object_width=None, grip_force=30.0):
+        self._clock = clock or SimClock()
+        self._actuation_delay = actuation_delay
+        self._travel_time = travel_time
+        self.object_width = object_width
+        self._grip_force = grip_force
+        self._from = 100.0
+        self._to = 100.0
+        self._commanded_at = -float('inf')
+        self.commands = 0
+
+    def _command(self, target):
+        self.commands += 1
+        self._from = self.position()
+        if target == 0.0 and self.object_width is not None:
+            target = max(self.object_width, 0.0)
+        self._to = target
+        self._commanded_at = self._clock.now()
+
+    def open(self, block=False, timeout=5.0):
+        self._command(100.0)
+        if block:
+            self._clock.sleep(self._remaining())
+
+    def close(self, block=False, timeout=5.0):
+        self._command(0.0)
+        if block:
+            self._clock.sleep(self._remaining())
+
+    def _stroke_time(self):
+        return self._travel_time * abs(self._to - self._from) / 100.0
+
+    def _remaining(self):
+        end = self._commanded_at + self._actuation_delay + self._stroke_time()
+        return max(0.0, end - self._clock.now())
+
+    def position(self):
+        elapsed = self._clock.now() - self._commanded_at - self._actuation_delay
+        stroke = self._stroke_time()
+        if elapsed <= 0 or stroke <= 0:
+            return self._from if elapsed <= 0 else self._to
+        fraction = min(1.0, elapsed / stroke)
+        return self._from + (self._to - self._from) * fraction
+
+    def moving(self):
+        elapsed = self._clock.now() - self._commanded_at - self._actuation_delay
+        return 0 < elapsed < self._stroke_time()
+
+    def gripping(self):
+        return (self.object_width is not None and self._to == self.object_width and
+                not self.moving() and self._remaining() == 0.0)
+
+    def force(self):
+        return self._grip_force if self.gripping() else 0.0
+
+
+class SimulatedRobotEnable(object):
+    # Stand-in for baxter_interface.RobotEnable
+    class _State(object):
+        def __init__(self, enabled):
+            self.enabled = enabled
+
+    def __init__(self, versioned=False):
+        self._enabled = False
+
+    def state(self):
+        return self._State(self._enabled)
+
+    def enable(self):
+        self._enabled = True
+
+    def disable(self):
+        self._enabled = False
+
+
+class _Message(object):
+    # Minimal ROS message: fields are set from defaults, then kwargs
+    _fields = ()
+
+    def __init__(self, *args, **kwargs):
+        for name, default in self._fields:
+            setattr(self, name, default() if callable(default) else default)
+        for (name, _), value in zip(self._fields, args):
+            setattr(self, name, value)
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+
+
+def _message(name, *fields):
+    return type(name, (_Message,), {'_fields': fields})
+
+
+class _SimRate(object):
+    def __init__(self, clock, hz):
+        self._clock = clock
+        self._period = 1.0 / hz
+
+    def sleep(self):
+        self._clock.sleep(self._period)
+
+
+def install_fake_ros(clock, ik_latency=0.05, limb_options=None,
+                     gripper_options=None, ik_solver=None):
+    """
+    Register in-process stand-ins for rospy, rospkg, the message and
+    service packages and baxter_interface in sys.modules, all driven by
+    clock, so pick_and_place imports and runs with no ROS install.
+
+    Must be called before pick_and_place is imported. Returns the
+    fake rospy module, whose log_counts tallies logerr/logwarn/loginfo.
+    ik_solver(limb, pose) returns a joint dict or None; by default poses
+    are solved with baxter_kinematics.
+    """
+    import sys
+    import types
+    import baxter_kinematics
+
+    def module(name, **attributes):
+        fake = types.ModuleType(name)
+        fake.__dict__.update(attributes)
+        sys.modules[name] = fake
+        return fake
+
+    log_counts = {'logerr': 0, 'logwarn': 0, 'loginfo': 0}
+
+    def logger(level):
+        def log(*args, **kwargs):
+            log_counts[level] += 1
+        return log
+
+    kinematics = {}
+
+    def solve(limb, pose):
+        if ik_solver is not None:
+            return ik_solver(limb, pose)
+        if limb not in kinematics:
+            kinematics[limb] = baxter_kinematics.BaxterKinematics(limb)
+        return kinematics[limb].solve_poses([pose])[0] or None
+
+    class ServiceException(Exception):
+        pass
+
+    class ROSException(Exception):
+        pass
+
+    class Time(object):
+        @staticmethod
+        def now():
+            return clock.now()
+
+    def service_proxy(name, service_class, persistent=False):
+        if name.startswith('ExternalTools/'):
+            limb = name.split('/')[1]
+            return SimulatedIKService(limb, clock=clock, latency=ik_latency,
+                                      solver=lambda pose: solve(limb, pose))
+        return lambda *args, **kwargs: None
+
+    rospy = module(
+        'rospy', ServiceException=ServiceException, ROSException=ROSException,
+        Time=Time, Rate=lambda hz: _SimRate(clock, hz), ServiceProxy=service_proxy,
+        get_time=clock.now, sleep=clock.sleep, is_shutdown=lambda: False,
+        logerr=logger('logerr'), logwarn=logger('logwarn'), loginfo=logger('loginfo'),
+        wait_for_service=lambda *args, **kwargs: None,
+        wait_for_message=lambda *args, **kwargs: None,
+        init_node=lambda *args, **kwargs: None,
+        on_shutdown=lambda callback: None, log_counts=log_counts)
+
+    class RosPack(object):
+        def get_path(self, package):
+            return ''
+
+    module('rospkg', RosPack=RosPack)
+
+    Point = _message('Point', ('x', 0.0), ('y', 0.0), ('z', 0.0))
+    Quaternion = _message('Quaternion', ('x', 0.0), ('y', 0.0), ('z', 0.0), ('w', 0.0))
+    Pose = _message('Pose', ('position', Point), ('orientation', Quaternion))
+    Header = _message('Header', ('seq', 0), ('stamp', 0.0), ('frame_id', ''))
+    PoseStamped = _message('PoseStamped', ('header', Header), ('pose', Pose))
+    JointState = _message('JointState', ('header', Header), ('name', list),
+                          ('position', list), ('velocity', list), ('effort', list))
+    IKRequest = _message('SolvePositionIKRequest', ('pose_stamp', list),
+                         ('seed_angles', list), ('seed_mode', 0))
+    IKRequest.SEED_AUTO, IKRequest.SEED_USER = 0, 1
+    IKRequest.SEED_CURRENT, IKRequest.SEED_NS_MAP = 2, 3
+
+    module('gazebo_msgs')
+    module('gazebo_msgs.srv', SpawnModel=object, DeleteModel=object,
+           GetWorldProperties=object)
+    module('geometry_msgs')
+    module('geometry_msgs.msg', Point=Point, Quaternion=Quaternion, Pose=Pose,
+           PoseStamped=PoseStamped)
+    module('std_msgs')
+    module('std_msgs.msg', Header=Header, Empty=_message('Empty'))
+    module('sensor_msgs')
+    module('sensor_msgs.msg', JointState=JointState)
+    module('baxter_core_msgs')
+    module('baxter_core_msgs.srv', SolvePositionIK=object,
+           SolvePositionIKRequest=IKRequest)
+    module('baxter_interface', CHECK_VERSION=True,
+           Limb=lambda limb: SimulatedLimb(limb, clock=clock, **(limb_options or {})),
+           Gripper=lambda limb: SimulatedGripper(clock=clock, **(gripper_options or {})),
+           RobotEnable=SimulatedRobotEnable)
+    return rospy
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+
+"""
+Crash-safe task journal for long pick and place runs.
+
+Every completed step (the tour, each pick and each place) is appended to
+a JSON-lines file together with the last commanded joint state. Records
+are flushed to the OS as they are written, so they survive the process
+dying; fsync to disk is batched by count, and a timer fsyncs the rest
+of a burst. On restart the journal is replayed and the run resumes after
+the last completed step, if it was started for the same plan. A torn
+final line from a crash mid-write is ignored.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from instrumentation import monotonic
+
+
+def plan_digest(plan):
+    """
+    Short digest of a JSON-serializable description of a run's jobs, for
+    TaskJournal.start.
+    """
+    text = json.dumps(plan, sort_keys=True)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+class TaskJournal(object):
+    """
+    Append-only journal of one run.
+
+    sync_every: records written before the file is fsynced
+    sync_interval: seconds after which a pending record is fsynced anyway,
+                   by a timer thread
+    """
+    def __init__(self, path, sync_every=8, sync_interval=1.0, clock=monotonic):
+        self.path = path
+        self._sync_every = sync_every
+        self._sync_interval = sync_interval
+        self._clock = clock
+        self._file = None
+        self._unsynced = 0
+        self._last_sync = clock()
+        self._timer = None
+        self._lock = threading.RLock()
+        self._completed = set()
+        self.plan = None
+        self.last_joints = None
+        self.finished = False
+        self.records = 0
+        self.torn = 0
+        self._replay()
+
+    def _replay(self):
+        self._valid_size = 0
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r') as journal:
+            for line in journal:
+                if not line.endswith('\n'):
+                    # partial write of the last record before a crash
+                    self.torn += 1
+                    break
+                # records are ASCII json, so characters are bytes
+                self._valid_size += len(line)
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    self.torn += 1
+                    continue
+                self._apply(record)
+                self.records += 1
+
+    def _apply(self, record):
+        event = record.get('event')
+        if event == 'start':
+            self._completed = set()
+            self.plan = record.get('plan')
+            self.last_joints = None
+            self.finished = False
+        elif event == 'step':
+            self._completed.add((record['job'], record['step']))
+        elif event == 'finish':
+            self.finished = True
+        if record.get('joints') is not None:
+            self.last_joints = record['joints']
+
+    @property
+    def resuming(self):
+        # an unfinished run with completed steps to skip
+        return not self.finished and bool(self._completed)
+
+    def completed(self, job, step):
+        return (job, step) in self._completed
+
+    def start(self, plan=None):
+        """
+        Begin a new run unless an unfinished one for the same plan, e.g. a
+        plan_digest of the job list, can be resumed. Returns True when
+        resuming.
+        """
+        if self.resuming and self.plan == plan:
+            return True
+        # a finished or empty journal, or one of another plan, is
+        # restarted from scratch
+        with self._lock:
+            self._close_file()
+            self._file = open(self.path, 'w')
+            self._valid_size = 0
+            self._append({'event': 'start', 'plan': plan}, sync=True)
+        return False
+
+    def _open(self):
+        if self._file is None:
+            if os.path.exists(self.path) and os.path.getsize(self.path) > self._valid_size:
+                # drop a torn tail so new records start on a fresh line
+                with open(self.path, 'r+') as journal:
+                    journal.truncate(self._valid_size)
+            self._file = open(self.path, 'a')
+        return self._file
+
+    def _append(self, record, sync=False):
+        record['time'] = time.time()
+        with self._lock:
+            journal = self._open()
+            journal.write(json.dumps(record, sort_keys=True) + '\n')
+            journal.flush()
+            self._apply(record)
+            self.records += 1
+            self._unsynced += 1
+            if (sync or self._unsynced >= self._sync_every or
+                    self._clock() - self._last_sync >= self._sync_interval):
+                self.sync()
+            elif self._timer is None:
+                # the last records of a burst are fsynced by the timer
+                self._timer = threading.Timer(self._sync_interval, self.sync)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def record_step(self, job, step, joints=None):
+        """Mark step ('tour', 'pick' or 'place') of job done."""
+        self._append({'event': 'step', 'job': job, 'step': step, 'joints': joints})
+
+    def record(self, event, **fields):
+        # free-form record, e.g. startup timings
+        fields['event'] = event
+        self._append(fields)
+
+    def finish(self):
+        self._append({'event': 'finish'}, sync=True)
+
+    def sync(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._file is not None and self._unsynced:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            self._unsynced = 0
+            self._last_sync = self._clock()
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        with self._lock:
+            timer = self._timer
+            self.sync()
+            self._close_file()
+        if timer is not None and timer is not threading.current_thread():
+            # let the cancelled timer's thread end before the interpreter
+            # does; outside the lock, which a firing timer waits for
+            timer.join()
@@ -0,0 +1,10 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sim_backend
+
+# rospy, the message packages and baxter_interface, so the demo modules
+# import without a ROS install
+sim_backend.install_fake_ros(sim_backend.SimClock())
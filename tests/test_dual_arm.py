@@ -0,0 +1,216 @@
+import random
+import threading
+import time
+
+import pytest
+
+import sim_backend
+from dual_arm import DualArmCoordinator, ExclusionZone, ZoneCancelled
+from geometry_msgs.msg import Pose, Point
+from pick_place_scheduler import PickPlaceJob
+
+
+def _pose(x, y, z=-0.13):
+    return Pose(position=Point(x=x, y=y, z=z))
+
+
+def _point(pose, lift=0.0):
+    p = pose.position
+    return (p.x, p.y, p.z + lift)
+
+
+class Occupancy(object):
+    # arms whose motion is in the zone, and any moment two of them were
+    def __init__(self, zone):
+        self.zone = zone
+        self.inside = set()
+        self.overlaps = []
+        self._lock = threading.Lock()
+
+    def move(self, limb, start, end):
+        if not self.zone.crosses([start, end]):
+            return
+        with self._lock:
+            if self.inside:
+                self.overlaps.append((limb, set(self.inside)))
+            self.inside.add(limb)
+        time.sleep(0.002)
+        with self._lock:
+            self.inside.discard(limb)
+
+
+class FakeArm(object):
+    """
+    Stand-in for pick_and_place.PickAndPlace with a sim_backend limb: the
+    hover and target moves are tracked in Cartesian space, and poses
+    unsolvable(pose) returns True for fail to plan.
+    """
+    def __init__(self, limb, occupancy, unsolvable=lambda pose: False):
+        self._limb_name = limb
+        self._hover_distance = 0.15
+        self._limb = sim_backend.SimulatedLimb(limb, settle_time=0.0)
+        self._occupancy = occupancy
+        self._unsolvable = unsolvable
+        self._rest = occupancy.zone.arm_guard(self)._parked
+        self.position = self._rest
+        self.last_command = None
+        self.done = []
+        self.retreats = 0
+
+    def _move(self, point):
+        self._occupancy.move(self._limb_name, self.position, point)
+        self.position = point
+
+    def solve_cycle(self, pose):
+        if self._unsolvable(pose):
+            return False, False
+        return {'hover': True}, {'pose': True}
+
+    def _cycle(self, pose):
+        for point in (_point(pose, self._hover_distance), _point(pose),
+                      _point(pose, self._hover_distance)):
+            self._move(point)
+
+    def pick(self, pose, plan):
+        self._cycle(pose)
+
+    def place(self, pose, plan):
+        self._cycle(pose)
+        self.done.append(pose)
+
+    def _guarded_move_to_joint_position(self, joint_angles):
+        self.retreats += 1
+        self._move(self._rest)
+
+
+def _arms(zone, unsolvable=None):
+    occupancy = Occupancy(zone)
+    unsolvable = unsolvable or {}
+    return occupancy, dict(
+        (limb, FakeArm(limb, occupancy, unsolvable.get(limb, lambda pose: False)))
+        for limb in ('left', 'right'))
+
+
+def test_zone_catches_paths_that_only_pass_through_it():
+    zone = ExclusionZone()
+    assert zone.crosses([(0.7, 0.4, 0.0), (0.7, -0.4, 0.0)])
+    assert zone.crosses([(0.7, 0.4, 0.0), (0.7, 0.3, 0.0), (0.7, 0.0, 0.2)])
+    assert not zone.crosses([(0.7, 0.4, 0.0), (0.7, 0.3, 0.0)])
+    assert not zone.crosses([(0.3, 0.4, 0.0), (0.3, -0.4, 0.0)])
+    assert zone.crosses([(0.7, 0.0, 0.0)])
+
+
+def test_zone_is_held_while_the_arm_is_parked_inside():
+    zone = ExclusionZone()
+    _, arms = _arms(zone)
+    guard = zone.arm_guard(arms['left'])
+    into = PickPlaceJob(_pose(0.7, 0.4), _pose(0.7, 0.05))
+    with guard(into):
+        assert guard.holding
+    # parked above a place target in the zone
+    assert guard.holding and zone._lock.locked()
+    out = PickPlaceJob(_pose(0.7, 0.4), _pose(0.7, 0.3))
+    with guard(out):
+        assert guard.holding
+    assert not guard.holding and not zone._lock.locked()
+
+
+def test_jobs_outside_the_zone_do_not_claim_it():
+    zone = ExclusionZone()
+    _, arms = _arms(zone)
+    guard = zone.arm_guard(arms['left'])
+    with guard(PickPlaceJob(_pose(0.7, 0.4), _pose(0.7, 0.3))):
+        assert not guard.holding
+    # the straight path between the two crosses the zone
+    with guard(PickPlaceJob(_pose(0.7, 0.4), _pose(0.7, -0.3))):
+        assert guard.holding
+    assert not zone._lock.locked()
+
+
+def test_leave_moves_the_arm_out_before_releasing():
+    zone = ExclusionZone()
+    _, arms = _arms(zone)
+    guard = zone.arm_guard(arms['left'])
+    with guard(PickPlaceJob(_pose(0.7, 0.4), _pose(0.7, 0.0))):
+        pass
+    assert zone._lock.locked()
+    guard.leave()
+    assert arms['left'].retreats == 1
+    assert not zone._lock.locked()
+
+
+def test_waiting_for_the_zone_stops_on_cancel():
+    zone = ExclusionZone()
+    _, arms = _arms(zone)
+    left = zone.arm_guard(arms['left'])
+    right = zone.arm_guard(arms['right'], is_cancelled=lambda: True)
+    with left(PickPlaceJob(_pose(0.7, 0.4), _pose(0.7, 0.0))):
+        pass
+    with pytest.raises(ZoneCancelled):
+        with right(PickPlaceJob(_pose(0.7, -0.4), _pose(0.7, -0.05))):
+            pass
+
+
+def test_arms_never_share_the_zone():
+    zone = ExclusionZone()
+    occupancy, arms = _arms(zone)
+    random.seed(3)
+    jobs = [PickPlaceJob(_pose(random.uniform(0.5, 0.9), random.uniform(-0.5, 0.5)),
+                         _pose(random.uniform(0.5, 0.9), random.uniform(-0.5, 0.5)))
+            for _ in range(40)]
+    coordinator = DualArmCoordinator(arms, zone=zone, verbose=False)
+    summary = coordinator.run(jobs)
+    assert summary['done'] + len(summary['unreachable']) == len(jobs)
+    assert all(arm.done for arm in arms.values())
+    assert occupancy.overlaps == []
+    assert not zone._lock.locked()
+
+
+def test_a_job_one_arm_cannot_plan_goes_to_the_other():
+    zone = ExclusionZone()
+    cross_table = PickPlaceJob(_pose(0.7, 0.3), _pose(0.7, -0.35))
+    _, arms = _arms(zone, unsolvable={'left': lambda pose: pose.position.y < -0.3})
+    # the heuristic offers the job to the left arm only
+    coordinator = DualArmCoordinator(
+        arms, zone=zone, verbose=False,
+        is_reachable=lambda limb, pose: limb == 'left')
+    summary = coordinator.run([cross_table])
+    assert summary['done'] == 1
+    assert summary['failed'] == []
+    assert arms['right'].done == [cross_table.place_pose]
+    assert summary['arms']['left']['failed'] == 1
+
+
+def test_a_job_no_arm_can_plan_is_reported_failed():
+    zone = ExclusionZone()
+    never = lambda pose: True
+    _, arms = _arms(zone, unsolvable={'left': never, 'right': never})
+    coordinator = DualArmCoordinator(
+        arms, zone=zone, verbose=False, is_reachable=lambda limb, pose: True)
+    summary = coordinator.run([PickPlaceJob(_pose(0.7, 0.0), _pose(0.7, 0.1))])
+    assert summary['done'] == 0
+    assert summary['failed'] == [0]
+
+
+def test_a_job_runs_after_a_failed_one():
+    zone = ExclusionZone()
+    _, arms = _arms(zone)
+    left = arms['left']
+
+    def faulty_place(pose, plan):
+        left._cycle(pose)
+        raise RuntimeError("gripper fault")
+    left.place = faulty_place
+    deadline = time.time() + 5.0
+    coordinator = DualArmCoordinator(
+        arms, zone=zone, verbose=False,
+        is_reachable=lambda limb, pose: (limb == 'left') == (pose.position.y > 0),
+        is_shutdown=lambda: time.time() > deadline)
+    with pytest.raises(RuntimeError):
+        coordinator.run([PickPlaceJob(_pose(0.7, 0.4), _pose(0.7, 0.05))])
+    # parked at its start outside the zone, which is free again
+    assert left.retreats == 1
+    assert not zone._lock.locked()
+    summary = coordinator.run([PickPlaceJob(_pose(0.7, -0.4), _pose(0.7, -0.05))])
+    assert summary['done'] == 1
+    assert len(arms['right'].done) == 1
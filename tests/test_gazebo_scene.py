@@ -0,0 +1,154 @@
+import threading
+import time
+
+import gazebo_scene
+from gazebo_scene import SceneManager, ModelSpec, SPAWN_SERVICES, DELETE_SERVICE
+from geometry_msgs.msg import Pose
+
+
+class FakeGazebo(object):
+    """
+    Local stand-in for the Gazebo spawn, delete and world properties
+    services, recording every proxy created and every call made.
+    """
+    def __init__(self, models=(), latency=0.0, fail=()):
+        self.models = set(models)
+        self.latency = latency
+        self.fail = set(fail)
+        self.proxies = []
+        self.closed = []
+        self.waited = []
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def wait_for_service(self, service, timeout=None):
+        with self._lock:
+            self.waited.append(service)
+
+    def service_proxy(self, service, service_class, persistent=False):
+        assert persistent
+        with self._lock:
+            self.proxies.append(service)
+
+        def close():
+            with self._lock:
+                self.closed.append(service)
+
+        def call(*args):
+            with self._lock:
+                self.calls.append((service,) + args[:1])
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                time.sleep(self.latency)
+                if args and args[0] in self.fail:
+                    raise gazebo_scene.rospy.ServiceException("spawn failed")
+                if service == gazebo_scene.WORLD_PROPERTIES_SERVICE:
+                    return type('WorldProperties', (object,),
+                                {'model_names': sorted(self.models)})()
+                with self._lock:
+                    if service == DELETE_SERVICE:
+                        self.models.discard(args[0])
+                    else:
+                        self.models.add(args[0])
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+        call.close = close
+        return call
+
+    def manager(self, model_path, workers=4):
+        return SceneManager(model_path, workers=workers,
+                            service_proxy=self.service_proxy,
+                            wait_for_service=self.wait_for_service)
+
+
+def _model_dir(tmp_path):
+    (tmp_path / 'block').mkdir()
+    (tmp_path / 'block' / 'model.urdf').write_text(u'<robot>\n  <link/>\n</robot>\n')
+    (tmp_path / 'cafe_table').mkdir()
+    (tmp_path / 'cafe_table' / 'model.sdf').write_text(u'<sdf>\n</sdf>\n')
+    return str(tmp_path) + '/'
+
+
+def test_spawn_many_models_concurrently(tmp_path):
+    gazebo = FakeGazebo(latency=0.05)
+    manager = gazebo.manager(_model_dir(tmp_path))
+    blocks = gazebo_scene.block_grid(12)
+    result = manager.spawn(blocks)
+    assert result == dict((spec.name, True) for spec in blocks)
+    assert gazebo.models == set(spec.name for spec in blocks)
+    assert gazebo.max_in_flight > 1
+    assert manager.last_elapsed < 12 * 0.05
+    # one wait per service and persistent proxies: at most one per worker
+    assert gazebo.waited == [SPAWN_SERVICES['urdf']]
+    assert len(gazebo.proxies) <= 4
+
+
+def test_model_files_are_read_once_and_newline_stripped(tmp_path):
+    model_dir = _model_dir(tmp_path)
+    manager = FakeGazebo().manager(model_dir)
+    assert manager.model_xml('block/model.urdf') == '<robot>  <link/></robot>'
+    (tmp_path / 'block' / 'model.urdf').write_text(u'<changed/>')
+    assert manager.model_xml('block/model.urdf') == '<robot>  <link/></robot>'
+
+
+def test_spawn_waits_for_every_service_once(tmp_path):
+    gazebo = FakeGazebo()
+    manager = gazebo.manager(_model_dir(tmp_path))
+    manager.spawn(gazebo_scene.default_scene())
+    manager.spawn(gazebo_scene.block_grid(3))
+    assert sorted(gazebo.waited) == sorted(SPAWN_SERVICES.values())
+
+
+def test_skip_existing_keeps_models_already_in_the_world(tmp_path):
+    gazebo = FakeGazebo(models=['block_0', 'block_2'])
+    manager = gazebo.manager(_model_dir(tmp_path))
+    result = manager.spawn(gazebo_scene.block_grid(4), skip_existing=True)
+    assert result == {'block_0': True, 'block_1': True, 'block_2': True, 'block_3': True}
+    assert manager.last_kept == ['block_0', 'block_2']
+    spawned = [call[1] for call in gazebo.calls
+               if call[0] == SPAWN_SERVICES['urdf']]
+    assert sorted(spawned) == ['block_1', 'block_3']
+
+
+def test_failed_spawn_is_reported_and_its_proxy_recreated(tmp_path):
+    gazebo = FakeGazebo(fail=['block_1'])
+    manager = gazebo.manager(_model_dir(tmp_path), workers=1)
+    result = manager.spawn(gazebo_scene.block_grid(3))
+    assert result == {'block_0': True, 'block_1': False, 'block_2': True}
+    assert gazebo.proxies == [SPAWN_SERVICES['urdf']] * 2
+    assert gazebo.closed == [SPAWN_SERVICES['urdf']]
+
+
+def test_delete_does_not_wait_for_the_service(tmp_path):
+    gazebo = FakeGazebo(models=['cafe_table', 'block'])
+    manager = gazebo.manager(_model_dir(tmp_path))
+    result = manager.delete(['cafe_table', 'block'])
+    assert result == {'cafe_table': True, 'block': True}
+    assert gazebo.models == set()
+    assert gazebo.waited == []
+
+
+def test_custom_model_spec_picks_the_spawn_service(tmp_path):
+    gazebo = FakeGazebo()
+    manager = gazebo.manager(_model_dir(tmp_path))
+    manager.spawn([ModelSpec('table', 'cafe_table/model.sdf', Pose())])
+    assert gazebo.calls == [(SPAWN_SERVICES['sdf'], 'table')]
+
+
+def test_connections_are_reused_across_calls_and_closed(tmp_path):
+    gazebo = FakeGazebo(latency=0.01)
+    manager = gazebo.manager(_model_dir(tmp_path))
+    manager.spawn(gazebo_scene.block_grid(8))
+    opened = len(gazebo.proxies)
+    manager.spawn(gazebo_scene.block_grid(8))
+    manager.delete(['block_{0}'.format(i) for i in range(8)])
+    manager.delete(['block_{0}'.format(i) for i in range(8)])
+    assert gazebo.proxies.count(SPAWN_SERVICES['urdf']) == opened
+    assert 1 <= gazebo.proxies.count(DELETE_SERVICE) <= 4
+    assert gazebo.closed == []
+    manager.close()
+    assert sorted(gazebo.closed) == sorted(gazebo.proxies)
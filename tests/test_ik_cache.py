@@ -0,0 +1,108 @@
+import random
+
+import numpy as np
+
+from geometry_msgs.msg import Pose, Point, Quaternion
+from ik_cache import IKCache, _KDTree, _pose_vector
+
+OVERHEAD = Quaternion(x=-0.0249590815779, y=0.999649402929,
+                      z=0.00737916180073, w=0.00486450832011)
+
+
+def _pose(x, y, z=-0.13, orientation=OVERHEAD):
+    return Pose(position=Point(x=x, y=y, z=z), orientation=orientation)
+
+
+def _joints(i):
+    return {'left_s0': float(i)}
+
+
+def test_kd_tree_finds_the_nearest_live_point():
+    rng = np.random.RandomState(0)
+    points = rng.uniform(-1.0, 1.0, (500, 7))
+    tree = _KDTree(points)
+    removed = set(range(0, 500, 7))
+    for index in removed:
+        tree.remove(index)
+    alive = np.array([i not in removed for i in range(500)])
+    for query in rng.uniform(-1.0, 1.0, (50, 7)):
+        dist, index = tree.query(query)
+        brute = np.linalg.norm(points - query, axis=1)
+        brute[~alive] = np.inf
+        assert index == int(np.argmin(brute))
+        assert np.isclose(dist, brute.min())
+
+
+def test_near_hits_match_a_linear_search_across_rebuilds():
+    cache = IKCache(capacity=300, seed_radius=10.0)
+    random.seed(1)
+    poses = [_pose(random.uniform(0.4, 0.9), random.uniform(-0.5, 0.5))
+             for _ in range(400)]
+    for i, pose in enumerate(poses):
+        cache.insert(pose, _joints(i))
+        if i % 37 == 0:
+            # a lookup between inserts rebuilds or searches the pending
+            # entries, depending on how far the tree is behind
+            query = _pose(random.uniform(0.4, 0.9), random.uniform(-0.5, 0.5))
+            live = [(j, p) for j, p in enumerate(poses[:i + 1])
+                    if j > i - 300]
+            vectors = np.array([_pose_vector(p, 0.25) for _, p in live])
+            nearest = live[int(np.argmin(np.linalg.norm(
+                vectors - _pose_vector(query, 0.25), axis=1)))][0]
+            joints, exact = cache.lookup(query)
+            if not exact:
+                assert joints == _joints(nearest)
+
+
+def test_exact_hits_skip_the_near_search():
+    cache = IKCache()
+    cache.insert(_pose(0.7, 0.1), _joints(1))
+    # within the quantization step
+    assert cache.lookup(_pose(0.7002, 0.1)) == (_joints(1), True)
+    assert cache.lookup(_pose(0.72, 0.1)) == (_joints(1), False)
+    assert cache.lookup(_pose(0.2, 0.1)) == (None, False)
+    stats = cache.stats()
+    assert (stats['hits'], stats['near_hits'], stats['misses']) == (1, 1, 1)
+
+
+def test_the_least_recently_used_entry_is_evicted():
+    cache = IKCache(capacity=3, seed_radius=0.0)
+    for i in range(3):
+        cache.insert(_pose(0.5 + 0.1 * i, 0.0), _joints(i))
+    # touching the oldest entry makes the second one the oldest
+    assert cache.lookup(_pose(0.5, 0.0))[1]
+    cache.insert(_pose(0.8, 0.0), _joints(3))
+    assert len(cache) == 3
+    assert cache.stats()['evictions'] == 1
+    assert cache.lookup(_pose(0.6, 0.0)) == (None, False)
+    for i in (0, 2, 3):
+        assert cache.lookup(_pose(0.5 + 0.1 * i, 0.0)) == (_joints(i), True)
+
+
+def test_save_and_load_round_trip_keeps_the_eviction_order(tmp_path):
+    path = str(tmp_path / 'ik_cache.json')
+    cache = IKCache(capacity=3)
+    for i in range(3):
+        cache.insert(_pose(0.5 + 0.1 * i, 0.0), _joints(i))
+    cache.lookup(_pose(0.5, 0.0))
+    cache.save(path)
+
+    loaded = IKCache(capacity=3, seed_radius=0.0)
+    assert loaded.load(path) == 3
+    for i in range(3):
+        assert loaded.lookup(_pose(0.5 + 0.1 * i, 0.0)) == (_joints(i), True)
+    reloaded = IKCache(capacity=3, seed_radius=0.0)
+    reloaded.load(path)
+    reloaded.insert(_pose(0.9, 0.0), _joints(3))
+    # entry 1 was the least recently used when saved
+    assert reloaded.lookup(_pose(0.6, 0.0)) == (None, False)
+    assert reloaded.lookup(_pose(0.5, 0.0)) == (_joints(0), True)
+
+
+def test_a_cache_saved_with_other_quantization_is_not_loaded(tmp_path):
+    path = str(tmp_path / 'ik_cache.json')
+    cache = IKCache()
+    cache.insert(_pose(0.7, 0.1), _joints(1))
+    cache.save(path)
+    assert IKCache(position_resolution=0.005).load(path) == 0
+    assert IKCache().load(path) == 1
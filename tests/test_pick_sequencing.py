@@ -0,0 +1,62 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from baxter_kinematics import JOINT_LIMITS
+from pick_sequencing import assign_places, order_jobs, travel_times
+
+
+def _configs(rng, n):
+    return rng.uniform(JOINT_LIMITS[:, 0], JOINT_LIMITS[:, 1], (n, 7))
+
+
+def _seconds(order, pick_q, place_q, start_q):
+    # estimated travel time of the batch run in order
+    order = list(order)
+    seconds = travel_times(start_q, pick_q[order[0]])[0, 0]
+    for a, b in zip(order[:-1], order[1:]):
+        seconds += travel_times(place_q[a], pick_q[b])[0, 0]
+    return seconds + sum(travel_times(p, q)[0, 0] for p, q in zip(pick_q, place_q))
+
+
+def test_the_order_is_never_worse_than_the_input_order():
+    rng = np.random.RandomState(4)
+    for n in (1, 2, 3, 7, 25, 60):
+        pick_q, place_q = _configs(rng, n), _configs(rng, n)
+        start_q = _configs(rng, 1)[0]
+        order, seconds = order_jobs(pick_q, place_q, start_q)
+        assert sorted(order.tolist()) == list(range(n))
+        assert np.isclose(seconds, _seconds(order, pick_q, place_q, start_q))
+        assert seconds <= _seconds(range(n), pick_q, place_q, start_q) + 1e-9
+
+
+def test_two_opt_never_undoes_the_nearest_neighbour_order():
+    rng = np.random.RandomState(5)
+    for _ in range(10):
+        pick_q, place_q = _configs(rng, 30), _configs(rng, 30)
+        start_q = _configs(rng, 1)[0]
+        _, greedy = order_jobs(pick_q, place_q, start_q, improve=False)
+        _, improved = order_jobs(pick_q, place_q, start_q)
+        assert improved <= greedy + 1e-9
+
+
+def test_small_batches_come_close_to_the_best_order():
+    rng = np.random.RandomState(6)
+    for _ in range(5):
+        pick_q, place_q = _configs(rng, 6), _configs(rng, 6)
+        start_q = _configs(rng, 1)[0]
+        _, seconds = order_jobs(pick_q, place_q, start_q)
+        best = min(_seconds(order, pick_q, place_q, start_q)
+                   for order in itertools.permutations(range(6)))
+        assert best - 1e-9 <= seconds <= 1.1 * best
+
+
+def test_every_pick_gets_its_own_place():
+    rng = np.random.RandomState(7)
+    pick_q, place_q = _configs(rng, 8), _configs(rng, 11)
+    assigned = assign_places(pick_q, place_q)
+    assert len(set(assigned.tolist())) == 8
+    assert all(0 <= j < 11 for j in assigned)
+    with pytest.raises(ValueError):
+        assign_places(pick_q, place_q[:5])
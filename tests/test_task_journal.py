@@ -0,0 +1,101 @@
+import json
+import os
+import time
+
+from task_journal import TaskJournal, plan_digest
+
+PLAN = plan_digest({'cycles': 2, 'batch': [[0.7, 0.1, -0.13]]})
+
+
+def _lines(path):
+    with open(path, 'r') as journal:
+        return journal.read().split('\n')
+
+
+def _run(path, steps, plan=PLAN):
+    journal = TaskJournal(path)
+    journal.start(plan)
+    for job, step in steps:
+        journal.record_step(job, step, {'left_s0': 0.1 * len(step)})
+    journal.close()
+    return journal
+
+
+def test_a_torn_tail_is_ignored_and_truncated(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    _run(path, [(None, 'tour'), (0, 'pick')])
+    with open(path, 'a') as journal:
+        journal.write('{"event": "step", "job": 0, "st')
+
+    journal = TaskJournal(path)
+    assert journal.torn == 1
+    assert journal.completed(0, 'pick')
+    assert not journal.completed(0, 'place')
+    assert journal.start(PLAN)
+    journal.record_step(0, 'place')
+    journal.close()
+
+    lines = _lines(path)
+    assert lines[-1] == ''
+    records = [json.loads(line) for line in lines[:-1]]
+    assert [r.get('step') for r in records] == [None, 'tour', 'pick', 'place']
+    assert TaskJournal(path).torn == 0
+
+
+def test_replay_skips_the_completed_steps(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    _run(path, [(None, 'tour'), (0, 'pick'), (0, 'place'), (1, 'pick')])
+
+    journal = TaskJournal(path)
+    assert journal.resuming
+    assert journal.start(PLAN)
+    # the run loop asks before every step
+    todo = [(job, step) for job, step in
+            [(None, 'tour'), (0, 'pick'), (0, 'place'), (1, 'pick'), (1, 'place')]
+            if not journal.completed(job, step)]
+    assert todo == [(1, 'place')]
+    assert journal.last_joints == {'left_s0': 0.4}
+    journal.close()
+
+
+def test_another_plan_starts_over(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    _run(path, [(None, 'tour'), (0, 'pick')])
+
+    journal = TaskJournal(path)
+    assert not journal.start(plan_digest({'cycles': 3, 'batch': []}))
+    assert not journal.completed(0, 'pick')
+    journal.close()
+    assert len(_lines(path)) == 2
+
+
+def test_a_finished_run_starts_over(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    journal = TaskJournal(path)
+    journal.start(PLAN)
+    journal.record_step(0, 'pick')
+    journal.finish()
+    journal.close()
+
+    journal = TaskJournal(path)
+    assert not journal.resuming
+    assert not journal.start(PLAN)
+    assert not journal.completed(0, 'pick')
+    journal.close()
+
+
+def test_the_timer_fsyncs_the_end_of_a_burst(tmp_path, monkeypatch):
+    synced = []
+    fsync = os.fsync
+    monkeypatch.setattr(os, 'fsync', lambda fd: synced.append(fd) or fsync(fd))
+    path = str(tmp_path / 'journal.jsonl')
+    journal = TaskJournal(path, sync_every=100, sync_interval=0.05)
+    journal.start(PLAN)
+    del synced[:]
+    journal.record_step(0, 'pick')
+    assert synced == []
+    deadline = time.time() + 5.0
+    while not synced and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(synced) == 1
+    journal.close()
@@ -0,0 +1,78 @@
+import numpy as np
+
+import trajectory
+
+JOINTS = ['j0', 'j1', 'j2']
+MAX_VEL = np.array([1.0, 2.0, 0.5])
+MAX_ACC = np.array([2.0, 4.0, 1.0])
+
+
+def _waypoints():
+    rng = np.random.RandomState(2)
+    return np.cumsum(rng.uniform(-0.4, 0.6, (8, 3)), axis=0)
+
+
+def _dense(traj, samples=4000):
+    t = np.linspace(0.0, traj.duration, samples)
+    return t, traj.sample(t)
+
+
+def test_time_optimal_respects_the_joint_limits():
+    traj = trajectory.time_optimal(list(_waypoints()), JOINTS, MAX_VEL, MAX_ACC)
+    _, (_, vel, acc) = _dense(traj)
+    assert np.all(np.abs(vel) <= MAX_VEL * (1.0 + 1e-6))
+    assert np.all(np.abs(acc) <= MAX_ACC * (1.0 + 1e-6))
+    # time-optimal: some joint rides a limit for most of the move
+    ratio = np.maximum(np.abs(vel) / MAX_VEL, np.abs(acc) / MAX_ACC).max(axis=1)
+    assert np.mean(ratio > 0.9) > 0.5
+
+
+def test_the_path_passes_through_every_waypoint():
+    waypoints = _waypoints()
+    traj = trajectory.time_optimal(list(waypoints), JOINTS, MAX_VEL, MAX_ACC)
+    _, (pos, _, _) = _dense(traj, 20000)
+    for waypoint in waypoints:
+        assert np.linalg.norm(pos - waypoint, axis=1).min() < 1e-3
+    assert np.allclose(pos[0], waypoints[0])
+    assert np.allclose(pos[-1], waypoints[-1])
+
+
+def _speed_at(traj, waypoint):
+    _, (pos, vel, _) = _dense(traj, 20000)
+    return np.abs(vel[np.argmin(np.linalg.norm(pos - waypoint, axis=1))]).max()
+
+
+def test_the_arm_stops_at_stop_at_waypoints():
+    waypoints = _waypoints()
+    through = trajectory.time_optimal(list(waypoints), JOINTS, MAX_VEL, MAX_ACC)
+    stopping = trajectory.time_optimal(list(waypoints), JOINTS, MAX_VEL, MAX_ACC,
+                                       stop_at=[3])
+    assert _speed_at(through, waypoints[3]) > 0.1
+    assert _speed_at(stopping, waypoints[3]) < 0.05
+
+
+def test_it_starts_and_ends_at_rest():
+    traj = trajectory.time_optimal(list(_waypoints()), JOINTS, MAX_VEL, MAX_ACC)
+    _, vel, _ = traj.sample(np.array([0.0, traj.duration]))
+    assert np.allclose(vel, 0.0, atol=1e-6)
+
+
+def test_a_path_going_nowhere_holds_the_position():
+    waypoint = {'j0': 0.1, 'j1': -0.2, 'j2': 0.3}
+    traj = trajectory.time_optimal([waypoint, waypoint], JOINTS, MAX_VEL, MAX_ACC)
+    assert traj.duration == 0.0
+    assert traj.joint_dict(0.5) == waypoint
+    commands = []
+    assert trajectory.stream_trajectory(traj, commands.append, 100.0,
+                                        now=lambda: 0.0, sleep=lambda _: None)
+    assert commands == [waypoint]
+
+
+def test_sample_path_follows_the_played_back_path():
+    waypoints = _waypoints()
+    traj = trajectory.time_optimal(list(waypoints), JOINTS, MAX_VEL, MAX_ACC)
+    _, (pos, _, _) = _dense(traj, 20000)
+    points = trajectory.sample_path(waypoints, 9)
+    assert points.shape == (len(waypoints) - 1, 9, 3)
+    distances = np.linalg.norm(points.reshape(-1, 1, 3) - pos[np.newaxis], axis=2)
+    assert distances.min(axis=1).max() < 1e-3
@@ -0,0 +1,366 @@
+#!/usr/bin/env python
+
+"""
+Joint-space trajectory generation for the Baxter pick and place demo.
+
+Takes a sequence of joint waypoints, time-parameterizes the whole sequence
+up front and produces setpoints that can be streamed to the arm at a fixed
+control rate, instead of stopping at every waypoint. time_optimal runs
+the path as fast as per-joint velocity and acceleration limits allow, and
+stream_trajectory plays the result back.
+"""
+import time
+
+import numpy as np
+
+
+def waypoints_to_array(waypoints, joint_names):
+    # Convert a list of joint dicts into an (N, len(joint_names)) array.
+    # A waypoint that omits a joint holds that joint at its previous value,
+    # which is what move_to_joint_positions would have done. Waypoints that
+    # are already arrays must be ordered as joint_names.
+    rows = np.empty((len(waypoints), len(joint_names)), dtype=np.float64)
+    previous = None
+    for i, waypoint in enumerate(waypoints):
+        if not isinstance(waypoint, dict):
+            rows[i] = waypoint
+            previous = rows[i]
+            continue
+        for j, name in enumerate(joint_names):
+            if name in waypoint:
+                rows[i, j] = waypoint[name]
+            elif previous is not None:
+                rows[i, j] = previous[j]
+            else:
+                raise KeyError("First waypoint is missing joint {0}".format(name))
+        previous = rows[i]
+    return rows
+
+
+def rest_to_rest_time(distance, max_vel, max_acc):
+    """
+    Minimum time of a rest-to-rest move over distance: a trapezoidal
+    profile, or a triangular one if max_vel is not reached. Elementwise,
+    so distance may be an array of joint distances with per-joint limits.
+    """
+    distance = np.asarray(distance, dtype=np.float64)
+    max_vel = np.asarray(max_vel, dtype=np.float64)
+    max_acc = np.asarray(max_acc, dtype=np.float64)
+    return np.where(distance <= max_vel * max_vel / max_acc,
+                    2.0 * np.sqrt(distance / max_acc),
+                    distance / max_vel + max_vel / max_acc)
+
+
+def _spline_second_derivatives(knots, positions):
+    # Natural cubic spline through (knots, positions (K, J)): second
+    # derivatives at the knots, from the tridiagonal continuity equations,
+    # solved by forward elimination and back substitution
+    k = len(knots)
+    m = np.zeros_like(positions)
+    if k < 3:
+        return m
+    h = np.diff(knots)
+    slopes = np.diff(positions, axis=0) / h[:, np.newaxis]
+    diagonal = 2.0 * (h[:-1] + h[1:])
+    rhs = 6.0 * np.diff(slopes, axis=0)
+    for i in range(1, k - 2):
+        w = h[i] / diagonal[i - 1]
+        diagonal[i] -= w * h[i]
+        rhs[i] -= w * rhs[i - 1]
+    m[k - 2] = rhs[-1] / diagonal[-1]
+    for i in range(k - 4, -1, -1):
+        m[i + 1] = (rhs[i] - h[i + 1] * m[i + 2]) / diagonal[i]
+    return m
+
+
+class _SplinePath(object):
+    # Geometric joint-space path q(s) through waypoints, a natural cubic
+    # spline over the cumulative joint-space chord length s
+    def __init__(self, positions):
+        chords = np.linalg.norm(np.diff(positions, axis=0), axis=1)
+        self.knots = np.concatenate([[0.0], np.cumsum(np.maximum(chords, 1e-9))])
+        self.positions = positions
+        self.second = _spline_second_derivatives(self.knots, positions)
+
+    @property
+    def length(self):
+        return float(self.knots[-1])
+
+    def evaluate(self, s):
+        # q, dq/ds and d2q/ds2 at the path parameters s (M,), each (M, J)
+        seg = np.clip(np.searchsorted(self.knots, s, side='right') - 1,
+                      0, len(self.knots) - 2)
+        h = (self.knots[seg + 1] - self.knots[seg])[:, np.newaxis]
+        a = ((self.knots[seg + 1] - s)[:, np.newaxis]) / h
+        b = 1.0 - a
+        p0, p1 = self.positions[seg], self.positions[seg + 1]
+        m0, m1 = self.second[seg], self.second[seg + 1]
+        q = a * p0 + b * p1 + ((a ** 3 - a) * m0 + (b ** 3 - b) * m1) * h * h / 6.0
+        dq = (p1 - p0) / h + ((1.0 - 3.0 * a * a) * m0 + (3.0 * b * b - 1.0) * m1) * h / 6.0
+        ddq = a * m0 + b * m1
+        return q, dq, ddq
+
+
+def _acceleration_bounds(dq, ddq, max_acc, eps=1e-9):
+    # Joint accelerations along the path are dq * u + ddq * x, with
+    # x = sdot^2 and u = sddot. Each moving joint bounds u to an interval
+    # centred on -r x of half-width h; returns r, h (inf where a joint
+    # does not move) and the largest x for which all intervals intersect.
+    moving = np.abs(dq) > eps
+    safe = np.where(moving, dq, 1.0)
+    r = np.where(moving, ddq / safe, 0.0)
+    h = np.where(moving, max_acc / np.abs(safe), np.inf)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # pairs of moving joints: |r_j - r_k| x <= h_j + h_k
+        pair = (h[:, :, np.newaxis] + h[:, np.newaxis, :]) / \
+            np.abs(r[:, :, np.newaxis] - r[:, np.newaxis, :])
+        pair[~(moving[:, :, np.newaxis] & moving[:, np.newaxis, :])] = np.inf
+        # joints at rest on the path: |ddq| x <= max_acc
+        still = np.where(moving, np.inf, max_acc / np.abs(ddq))
+    x_max = np.minimum(pair.reshape(len(dq), -1).min(axis=1), still.min(axis=1))
+    return r, h, x_max
+
+
+class _Playback(object):
+    # Limb API and setpoint helpers over a sample(t) method
+
+    def joint_dict(self, t):
+        # Limb API-compatible dictionary of the positions at time t
+        pos, _, _ = self.sample(t)
+        return dict(zip(self.joint_names, pos.tolist()))
+
+    def setpoints(self, rate):
+        """Dense (times (M,), positions (M, J), velocities (M, J)) at rate Hz."""
+        times = np.append(np.arange(0.0, self.duration, 1.0 / rate), self.duration)
+        pos, vel, _ = self.sample(times)
+        return times, pos, vel
+
+
+class _Stationary(_Playback):
+    # Zero-length trajectory holding a single position
+    def __init__(self, joint_names, position):
+        self.joint_names = list(joint_names)
+        self._position = position
+        self.duration = 0.0
+
+    def sample(self, t):
+        shape = np.shape(t) + (len(self.joint_names),)
+        zeros = np.zeros(shape)
+        return np.broadcast_to(self._position, shape).copy(), zeros, zeros.copy()
+
+
+class TimeOptimalTrajectory(_Playback):
+    """
+    Time-optimal playback of a geometric path, stored densely over the
+    path parameter grid.
+
+    times: (N,) time at each grid point, starting at 0
+    s, sdot: (N,) path parameter and its rate at each grid point
+    sddot: (N - 1,) constant path acceleration over each grid interval
+    """
+    def __init__(self, joint_names, path, times, s, sdot, sddot):
+        self.joint_names = list(joint_names)
+        self._path = path
+        self.times = times
+        self.s = s
+        self.sdot = sdot
+        self.sddot = sddot
+
+    @property
+    def duration(self):
+        return float(self.times[-1])
+
+    def sample(self, t):
+        # Position, velocity and acceleration at the time(s) t, each of
+        # shape (..., J); exact within each grid interval
+        t = np.clip(np.asarray(t, dtype=np.float64), 0.0, self.duration)
+        shape = t.shape
+        t = t.ravel()
+        i = np.clip(np.searchsorted(self.times, t, side='right') - 1,
+                    0, len(self.times) - 2)
+        tau = t - self.times[i]
+        u = self.sddot[i]
+        s = np.minimum(self.s[i] + self.sdot[i] * tau + 0.5 * u * tau * tau, self.s[-1])
+        sdot = np.maximum(self.sdot[i] + u * tau, 0.0)
+        q, dq, ddq = self._path.evaluate(s)
+        vel = dq * sdot[:, np.newaxis]
+        acc = ddq * (sdot * sdot)[:, np.newaxis] + dq * u[:, np.newaxis]
+        joints = q.shape[1]
+        return (q.reshape(shape + (joints,)), vel.reshape(shape + (joints,)),
+                acc.reshape(shape + (joints,)))
+
+
+class _PiecewiseTrajectory(_Playback):
+    # Time-optimal pieces played back to back, each starting and ending
+    # at rest
+    def __init__(self, joint_names, pieces):
+        self.joint_names = list(joint_names)
+        self._pieces = pieces
+        self._starts = np.concatenate([[0.0], np.cumsum([p.duration for p in pieces])])
+
+    @property
+    def duration(self):
+        return float(self._starts[-1])
+
+    def sample(self, t):
+        t = np.clip(np.asarray(t, dtype=np.float64), 0.0, self.duration)
+        piece = np.clip(np.searchsorted(self._starts, t, side='right') - 1,
+                        0, len(self._pieces) - 1)
+        pos = np.empty(t.shape + (len(self.joint_names),))
+        vel, acc = np.empty_like(pos), np.empty_like(pos)
+        for k in np.unique(piece):
+            mask = piece == k
+            pos[mask], vel[mask], acc[mask] = self._pieces[k].sample(t[mask] - self._starts[k])
+        return pos, vel, acc
+
+
+def _time_optimal_piece(joint_names, positions, max_vel, max_acc, grid_points):
+    path = _SplinePath(positions)
+    n = max(int(grid_points), 3)
+    s = np.linspace(0.0, path.length, n)
+    ds = s[1] - s[0]
+    _, dq, ddq = path.evaluate(s)
+    # maximum velocity curve in x = sdot^2, from both limits
+    with np.errstate(divide='ignore'):
+        x_vel = np.min((max_vel / np.abs(dq)) ** 2, axis=1)
+    r, h, x_acc = _acceleration_bounds(dq, ddq, max_acc)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # no step may need to decelerate past rest: u >= -x / (2 ds)
+        overshoot = np.where(r > 0.5 / ds, h / (r - 0.5 / ds), np.inf).min(axis=1)
+        # reaching x_next from x needs u <= (x_next - x) / (2 ds), which
+        # some joint's lower bound -h - r x allows only below this x
+        slope = 1.0 - 2.0 * ds * r
+        reach = np.where(slope > 0, 2.0 * ds * h / np.where(slope > 0, slope, 1.0), np.inf)
+        inverse_slope = np.where(slope > 0, 1.0 / np.where(slope > 0, slope, 1.0), np.inf)
+    mvc = np.minimum(np.minimum(x_vel, x_acc), overshoot)
+
+    # backward pass: the largest x at each grid point from which the arm
+    # can still come to rest at the end within the limits
+    controllable = np.empty(n)
+    controllable[-1] = 0.0
+    for i in range(n - 2, -1, -1):
+        controllable[i] = min(mvc[i], np.min(reach[i] + controllable[i + 1] * inverse_slope[i]))
+    # forward pass: accelerate as hard as the limits allow without
+    # leaving the controllable set
+    x = np.empty(n)
+    x[0] = 0.0
+    for i in range(n - 1):
+        u = min(np.min(h[i] - r[i] * x[i]), (controllable[i + 1] - x[i]) / (2.0 * ds))
+        x[i + 1] = max(x[i] + 2.0 * ds * u, 0.0)
+
+    sddot = (x[1:] - x[:-1]) / (2.0 * ds)
+    # the limits hold exactly at the start of every grid interval; a
+    # uniform slow-down covers the discretization error at its end
+    acc_end = np.abs(dq[1:] * sddot[:, np.newaxis] + ddq[1:] * x[1:, np.newaxis]) / max_acc
+    vel = np.abs(dq) * np.sqrt(x)[:, np.newaxis] / max_vel
+    factor = max(1.0, float(np.sqrt(acc_end.max())), float(vel.max()))
+    sdot = np.sqrt(x) / factor
+    sddot /= factor * factor
+    dt = 2.0 * ds / np.maximum(sdot[:-1] + sdot[1:], 1e-12)
+    times = np.concatenate([[0.0], np.cumsum(dt)])
+    return TimeOptimalTrajectory(joint_names, path, times, s, sdot, sddot)
+
+
+def path_pieces(positions, stop_at=()):
+    """
+    Split the path through positions (N, J) where the arm comes to rest.
+
+    The arm stops at the first and last waypoint, at the waypoint indices
+    in stop_at and wherever the path turns by more than 90 degrees, since
+    a spline cannot turn back smoothly. Returns one index array per piece
+    of the path, without coincident consecutive waypoints.
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    # coincident consecutive waypoints add nothing to the path
+    keep = np.concatenate([[True], np.any(np.diff(positions, axis=0) != 0.0, axis=1)])
+    chords = np.diff(positions[keep], axis=0)
+    turns = np.flatnonzero(keep)[1:-1][np.einsum('ij,ij->i', chords[:-1], chords[1:]) < 0]
+    stops = sorted(set([0, len(positions) - 1]) | set(turns.tolist()) |
+                   set(i for i in stop_at if 0 < i < len(positions)))
+    pieces = []
+    for start, end in zip(stops[:-1], stops[1:]):
+        rows = np.arange(start, end + 1)[np.concatenate([[True], keep[start + 1:end + 1]])]
+        if len(rows) >= 2:
+            pieces.append(rows)
+    return pieces
+
+
+def sample_path(positions, samples, stop_at=()):
+    """
+    The geometric path time_optimal plays back through positions (N, J).
+
+    Returns an (N - 1, samples, J) array of samples points along each
+    segment between consecutive waypoints, both ends included.
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    # segments between coincident waypoints stay put
+    points = np.repeat(positions[:-1, np.newaxis], samples, axis=1)
+    u = np.linspace(0.0, 1.0, samples)
+    for rows in path_pieces(positions, stop_at):
+        path = _SplinePath(positions[rows])
+        s = path.knots[:-1, np.newaxis] + np.diff(path.knots)[:, np.newaxis] * u
+        q, _, _ = path.evaluate(s.ravel())
+        points[rows[1:] - 1] = q.reshape(len(rows) - 1, samples, -1)
+    return points
+
+
+def time_optimal(waypoints, joint_names, max_vel, max_acc, stop_at=(),
+                 grid_points=1000):
+    """
+    Time-optimal trajectory along a joint-space path through waypoints.
+
+    The path is a natural cubic spline through the waypoints over joint-
+    space chord length. Its playback speed is found with a TOPP-style
+    forward/backward integration of the path acceleration on a grid of
+    grid_points per piece, so that at every grid point some joint rides
+    its velocity or acceleration limit. max_vel and max_acc are scalars
+    or per-joint sequences ordered as joint_names. The arm comes to rest
+    at the first and last waypoint, where the path turns back, and at the
+    waypoint indices in stop_at, e.g. where the gripper acts.
+    """
+    positions = waypoints_to_array(waypoints, joint_names)
+    max_vel = np.broadcast_to(np.asarray(max_vel, dtype=np.float64),
+                              (len(joint_names),))
+    max_acc = np.broadcast_to(np.asarray(max_acc, dtype=np.float64),
+                              (len(joint_names),))
+    if len(positions) < 2:
+        positions = np.vstack([positions, positions])
+    pieces = [_time_optimal_piece(joint_names, positions[rows], max_vel, max_acc, grid_points)
+              for rows in path_pieces(positions, stop_at)]
+    if not pieces:
+        # nowhere to go: hold the position
+        return _Stationary(joint_names, positions[-1])
+    if len(pieces) == 1:
+        return pieces[0]
+    return _PiecewiseTrajectory(joint_names, pieces)
+
+
+def stream_trajectory(traj, command, rate, now=time.time, sleep=time.sleep,
+                      is_shutdown=lambda: False, events=()):
+    """
+    Stream setpoints from traj to command(joint_dict) at rate Hz.
+
+    Timing is taken from the now/sleep callables so the same loop can be
+    driven by rospy's clock or by a simulated one. events is a sequence of
+    (seconds_before_end, callable) pairs, each called once when playback
+    reaches that point. Returns False if is_shutdown() interrupted
+    playback, True otherwise.
+    """
+    period = 1.0 / rate
+    pending = sorted(events, key=lambda event: -event[0])
+    start = now()
+    tick = start
+    while not is_shutdown():
+        t = now() - start
+        while pending and t >= traj.duration - pending[0][0]:
+            pending.pop(0)[1]()
+        if t >= traj.duration:
+            command(traj.joint_dict(traj.duration))
+            return True
+        command(traj.joint_dict(t))
+        # Fixed-rate loop that does not accumulate drift
+        tick += period
+        remaining = tick - now()
+        if remaining > 0:
+            sleep(remaining)
+    return False
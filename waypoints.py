@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+"""
+Compact joint waypoint libraries.
+
+A library is a contiguous float64 array of shape (N, 7) in the fixed
+joint order of baxter_kinematics.JOINTS. On disk it is stored either as a
+plain .npy array or as a .wpt file: an 8-byte magic, a uint32 header
+length, a JSON header naming the limb, joint order and row count, then
+the raw little-endian rows aligned to 64 bytes. Both formats are memory
+mapped on load, validated once, and handed out as zero-copy row views.
+"""
+import json
+import struct
+
+import numpy as np
+
+from baxter_kinematics import JOINTS, JOINT_LIMITS
+
+_MAGIC = b'BXWPT001'
+_ALIGN = 64
+
+
+class WaypointLibrary(object):
+    """
+    (N, 7) joint waypoints for one limb.
+
+    Rows are ordered as joint_names(); indexing returns views into the
+    underlying (possibly memory-mapped) array, never copies.
+    """
+    def __init__(self, limb, positions, tolerance=1e-6):
+        self.limb = limb
+        self.positions = positions
+        self._validate(tolerance)
+
+    def _validate(self, tolerance):
+        positions = self.positions
+        if positions.ndim != 2 or positions.shape[1] != len(JOINTS):
+            raise ValueError("Waypoints must have shape (N, {0}), got {1}".format(
+                len(JOINTS), positions.shape))
+        if positions.dtype != np.float64:
+            raise ValueError("Waypoints must be float64, got {0}".format(positions.dtype))
+        bad = ~np.isfinite(positions)
+        bad |= positions < JOINT_LIMITS[:, 0] - tolerance
+        bad |= positions > JOINT_LIMITS[:, 1] + tolerance
+        if bad.any():
+            row, col = np.argwhere(bad)[0]
+            raise ValueError(
+                "Waypoint {0} joint {1}_{2} = {3} is outside the joint limits {4}".format(
+                    row, self.limb, JOINTS[col], positions[row, col],
+                    JOINT_LIMITS[col].tolist()))
+
+    def joint_names(self):
+        return [self.limb + '_' + joint for joint in JOINTS]
+
+    def __len__(self):
+        return self.positions.shape[0]
+
+    def __getitem__(self, index):
+        return self.positions[index]
+
+    def __iter__(self):
+        return iter(self.positions)
+
+    def joint_dict(self, index):
+        # Limb API-compatible dictionary for one waypoint
+        return dict(zip(self.joint_names(), self.positions[index].tolist()))
+
+    @classmethod
+    def from_dicts(cls, limb, joint_dicts):
+        """
+        Build a library from Limb API joint dicts. A dict that omits a joint
+        holds that joint at its previous value.
+        """
+        names = [limb + '_' + joint for joint in JOINTS]
+        rows = np.empty((len(joint_dicts), len(names)), dtype=np.float64)
+        for i, joint_dict in enumerate(joint_dicts):
+            for j, name in enumerate(names):
+                if name in joint_dict:
+                    rows[i, j] = joint_dict[name]
+                elif i > 0:
+                    rows[i, j] = rows[i - 1, j]
+                else:
+                    raise KeyError("First waypoint is missing joint {0}".format(name))
+        return cls(limb, rows)
+
+    def save(self, path):
+        # .npy files carry only the array, so the limb is not recorded
+        if path.endswith('.npy'):
+            np.save(path, np.ascontiguousarray(self.positions, dtype='<f8'))
+            return
+        header = json.dumps({'limb': self.limb, 'joints': list(JOINTS),
+                             'count': len(self)}).encode('utf-8')
+        offset = len(_MAGIC) + 4 + len(header)
+        padding = (-offset) % _ALIGN
+        with open(path, 'wb') as library_file:
+            library_file.write(_MAGIC)
+            library_file.write(struct.pack('<I', len(header) + padding))
+            library_file.write(header + b' ' * padding)
+            library_file.write(np.ascontiguousarray(self.positions, dtype='<f8').tobytes())
+
+    @classmethod
+    def load(cls, path, limb=None, mmap=True):
+        """
+        Load a .wpt or .npy library, memory mapped unless mmap is False.
+        limb is required for .npy files and checked against .wpt headers.
+        """
+        mode = 'r' if mmap else None
+        if path.endswith('.npy'):
+            if limb is None:
+                raise ValueError("A limb is required to load {0}".format(path))
+            return cls(limb, np.load(path, mmap_mode=mode))
+        with open(path, 'rb') as library_file:
+            if library_file.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError("{0} is not a waypoint library".format(path))
+            header_length, = struct.unpack('<I', library_file.read(4))
+            header = json.loads(library_file.read(header_length).decode('utf-8'))
+        if tuple(header['joints']) != JOINTS:
+            raise ValueError("{0} has joint order {1}, expected {2}".format(
+                path, header['joints'], list(JOINTS)))
+        if limb is not None and header['limb'] != limb:
+            raise ValueError("{0} holds {1} arm waypoints, expected {2}".format(
+                path, header['limb'], limb))
+        offset = len(_MAGIC) + 4 + header_length
+        shape = (header['count'], len(JOINTS))
+        if mmap:
+            positions = np.memmap(path, dtype='<f8', mode='r', offset=offset, shape=shape)
+        else:
+            with open(path, 'rb') as library_file:
+                library_file.seek(offset)
+                positions = np.fromfile(library_file, dtype='<f8',
+                                        count=shape[0] * shape[1]).reshape(shape)
+        return cls(header['limb'], positions)